@@ -0,0 +1,79 @@
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+import typing as T
+
+import intermediate
+
+# 中間ファイル形式のベンチマーク: 現在の JSON と intermediate.py のバイナリ形式（非圧縮 / gzip）
+#   python bench_intermediate.py [異なりキー数]   # 既定 1,000,000
+# サイズ、書き込み（map 側）と読み込み（reduce 側）の時間を比べる
+
+DEFAULT_KEYS = 1_000_000
+REPEAT = 3
+
+def make_occurrences(num_keys: int, seed: int = 0) -> T.Dict[str, int]:
+    # 単語らしいキーと Zipf 風に偏ったカウント
+    rng = random.Random(seed)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    results: T.Dict[str, int] = {}
+    while len(results) < num_keys:
+        key = "".join(rng.choices(letters, k=rng.randint(3, 12)))
+        results[key] = max(1, int(1_000_000 / (len(results) + 1)))
+    return results
+
+def save_json(filename: str, results: T.Dict[str, int]) -> None:
+    # Worker.save_map_results と同じ書き方
+    with open(filename, "w") as f:
+        f.write(json.dumps(results))
+
+def load_json(filename: str) -> T.Dict[str, int]:
+    with open(filename, "r") as f:
+        return json.load(f)
+
+FORMATS = {
+    "json": (save_json, load_json),
+    "binary": (
+        lambda filename, results: intermediate.save_occurrences(filename, results),
+        intermediate.load_occurrences,
+    ),
+    "binary+gzip": (
+        lambda filename, results: intermediate.save_occurrences(
+            filename, results, compress=True
+        ),
+        intermediate.load_occurrences,
+    ),
+}
+
+def best_of(fn: T.Callable[[], T.Any]) -> float:
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def main() -> None:
+    num_keys = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_KEYS
+    print(f"Generating {num_keys:,} distinct keys...")
+    results = make_occurrences(num_keys)
+    
+    print(f"{'Format':<14} {'Size(MB)':>9} {'Encode(s)':>10} {'Decode(s)':>10} {'Keys/s(dec)':>12}")
+    print("-" * 60)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for name, (save, load) in FORMATS.items():
+            filename = os.path.join(temp_dir, name)
+            encode = best_of(lambda: save(filename, results))
+            decode = best_of(lambda: load(filename))
+            assert load(filename) == results, f"{name} round trip mismatch"
+            size = os.path.getsize(filename) / 1024 / 1024
+            print(
+                f"{name:<14} {size:>9.1f} {encode:>10.2f} {decode:>10.2f} "
+                f"{num_keys / decode:>12,.0f}"
+            )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import subprocess
+import typing as T
+
+from bench_map_engine import make_corpus
+
+# ネットワーク版（server.py + worker.py）と local_executor.py を同じ入力で比較するベンチマーク
+#   python bench_local.py [--workers N] [FILE ...]   # ファイル省略時は合成コーパス（既定 50MB x 4）
+# どちらも起動から結果ファイルが揃うまでの時間（プロセスの起動・接続を含む）を測る
+
+SYNTHETIC_MB = 50
+SYNTHETIC_FILES = 4
+SERVER_STARTUP_TIMEOUT = 10.0
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def prepare_inputs(work_dir: str, filenames: T.List[str]) -> None:
+    input_dir = os.path.join(work_dir, "input_files")
+    os.makedirs(input_dir)
+    for i, filename in enumerate(filenames):
+        os.symlink(os.path.abspath(filename), os.path.join(input_dir, f"input{i}.txt"))
+
+def wait_for_server(log_file: str, server: subprocess.Popen) -> None:
+    # server.py は待ち受けを始めると "Serving on" を出力する
+    deadline = time.monotonic() + SERVER_STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError("server.py exited before listening")
+        with open(log_file, "r") as f:
+            if "Serving on" in f.read():
+                return
+        time.sleep(0.01)
+    raise RuntimeError("server.py did not start listening")
+
+def run_networked(work_dir: str, workers: int) -> float:
+    env = dict(os.environ, PYTHONUNBUFFERED="1")
+    log_file = os.path.join(work_dir, "server.log")
+    start = time.perf_counter()
+    with open(log_file, "w") as log:
+        server = subprocess.Popen(
+            [sys.executable, os.path.join(HERE, "server.py")],
+            cwd=work_dir, env=env, stdout=log, stderr=subprocess.STDOUT,
+        )
+    wait_for_server(log_file, server)
+    worker_processes = [
+        subprocess.Popen(
+            [sys.executable, os.path.join(HERE, "worker.py")],
+            cwd=work_dir, env=env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        for _ in range(workers)
+    ]
+    server.wait()
+    elapsed = time.perf_counter() - start
+    for process in worker_processes:
+        process.wait()
+    return elapsed
+
+def run_local(work_dir: str, workers: int) -> float:
+    start = time.perf_counter()
+    command = [
+        sys.executable, os.path.join(HERE, "local_executor.py"),
+        "--processes", str(workers),
+    ]
+    subprocess.run(command, cwd=work_dir, stdout=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - start
+
+MODES: T.Dict[str, T.Callable[[str, int], float]] = {
+    "networked": run_networked,
+    "local": run_local,
+}
+
+def main() -> None:
+    args = sys.argv[1:]
+    workers = os.cpu_count() or 1
+    if args[:1] == ["--workers"]:
+        workers = int(args[1])
+        args = args[2:]
+    temp_dir = tempfile.TemporaryDirectory()
+    filenames = args
+    if not filenames:
+        print(f"Generating {SYNTHETIC_FILES} x {SYNTHETIC_MB}MB synthetic corpus...")
+        for i in range(SYNTHETIC_FILES):
+            filename = os.path.join(temp_dir.name, f"corpus{i}.txt")
+            make_corpus(filename, SYNTHETIC_MB, seed=i)
+            filenames.append(filename)
+    
+    total_mb = sum(os.path.getsize(f) for f in filenames) / 1024 / 1024
+    print(f"Input: {len(filenames)} file(s), {total_mb:.1f}MB, {workers} worker(s)")
+    print(f"{'Mode':<10} {'Time(s)':>8} {'MB/s':>8}")
+    print("-" * 28)
+    results = {}
+    for name, run in MODES.items():
+        work_dir = os.path.join(temp_dir.name, name)
+        prepare_inputs(work_dir, filenames)
+        elapsed = run(work_dir, workers)
+        with open(os.path.join(work_dir, "result.json"), "r") as f:
+            results[name] = json.load(f)
+        print(f"{name:<10} {elapsed:>8.2f} {total_mb / elapsed:>8.1f}")
+    assert results["networked"] == results["local"], "results differ between modes"
+    
+    # ネットワーク版の中間ファイルは tasks.get_temp_dir() に残るので片付ける
+    shutil.rmtree(os.path.join(HERE, "temp_results"), ignore_errors=True)
+    temp_dir.cleanup()
+
+if __name__ == "__main__":
+    main()
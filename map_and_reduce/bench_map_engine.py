@@ -0,0 +1,95 @@
+import os
+import sys
+import time
+import random
+import resource
+import tempfile
+import multiprocessing as mp
+import typing as T
+
+# 旧実装（Worker.mapfn + combinefn）と map_engine.count_file を比較するベンチマーク
+#   python bench_map_engine.py            # 合成コーパス（既定 200MB）で計測
+#   python bench_map_engine.py FILE ...   # 既存のファイルで計測
+# ピークRSSを正しく測るため、各実装は spawn した新しいプロセスで 1 回ずつ実行する
+
+SYNTHETIC_MB = 200
+VOCABULARY_SIZE = 50_000
+
+def make_corpus(path: str, size_mb: int, seed: int = 0) -> None:
+    rng = random.Random(seed)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    vocabulary = [
+        "".join(rng.choices(letters, k=rng.randint(2, 10)))
+        for _ in range(VOCABULARY_SIZE)
+    ]
+    target = size_mb * 1024 * 1024
+    written = 0
+    with open(path, "w", encoding="ISO-8859-1") as f:
+        while written < target:
+            line = " ".join(rng.choices(vocabulary, k=12)).capitalize() + ".\n"
+            f.write(line)
+            written += len(line)
+
+def run_legacy(filenames: T.List[str]) -> int:
+    from worker import Worker
+    worker = Worker()
+    words = 0
+    for filename in filenames:
+        results = worker.combinefn(worker.mapfn(filename))
+        words += sum(results.values())
+    return words
+
+def run_engine(filenames: T.List[str]) -> int:
+    from map_engine import count_file
+    words = 0
+    for filename in filenames:
+        words += sum(count_file(filename).values())
+    return words
+
+VARIANTS: T.Dict[str, T.Callable[[T.List[str]], int]] = {
+    "mapfn+combinefn": run_legacy,
+    "map_engine": run_engine,
+}
+
+def measure(name: str, filenames: T.List[str], queue: mp.Queue) -> None:
+    start = time.perf_counter()
+    words = VARIANTS[name](filenames)
+    elapsed = time.perf_counter() - start
+    # Linux では ru_maxrss は KiB 単位（macOS ではバイト単位）
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        max_rss //= 1024
+    queue.put((words, elapsed, max_rss))
+
+def main() -> None:
+    filenames = sys.argv[1:]
+    temp_dir = None
+    if not filenames:
+        temp_dir = tempfile.TemporaryDirectory()
+        corpus = os.path.join(temp_dir.name, "corpus.txt")
+        print(f"Generating {SYNTHETIC_MB}MB synthetic corpus...")
+        make_corpus(corpus, SYNTHETIC_MB)
+        filenames = [corpus]
+    
+    total_mb = sum(os.path.getsize(f) for f in filenames) / 1024 / 1024
+    print(f"Input: {len(filenames)} file(s), {total_mb:.1f}MB")
+    print(f"{'Variant':<18} {'Time(s)':>8} {'Words/s':>12} {'MB/s':>8} {'PeakRSS(MB)':>12}")
+    print("-" * 62)
+    
+    ctx = mp.get_context("spawn")
+    for name in VARIANTS:
+        queue = ctx.Queue()
+        process = ctx.Process(target=measure, args=(name, filenames, queue))
+        process.start()
+        words, elapsed, max_rss = queue.get()
+        process.join()
+        print(
+            f"{name:<18} {elapsed:>8.2f} {words / elapsed:>12,.0f} "
+            f"{total_mb / elapsed:>8.1f} {max_rss / 1024:>12.1f}"
+        )
+    
+    if temp_dir is not None:
+        temp_dir.cleanup()
+
+if __name__ == "__main__":
+    main()
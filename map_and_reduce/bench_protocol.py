@@ -0,0 +1,147 @@
+import time
+import asyncio
+import argparse
+import multiprocessing
+import typing as T
+
+from protocol import Protocol, HOST
+
+# protocol.py のメッセージ数/秒を測るベンチマーク
+#   python bench_protocol.py [--workers N] [--tasks M] [--window W] [--inline BYTES]
+# 1つのサーバーと N 個のワーカープロセスをローカルでつなぎ、
+# サーバーは各ワーカーに map タスクと同じ形のメッセージを W 個ずつ先行して送り、
+# ワーカーは受け取ったらすぐ mapdone と同じ形の応答を返す（タスクの処理はしない）。
+# --inline を付けると、応答にその大きさのバイト列（インラインの map の出力）を載せる。
+# まとめ書きあり / なし（Protocol.batch_writes）で、往復の合計メッセージ数/秒を比べる。
+
+WORKERS = 8
+TASKS_PER_WORKER = 20000
+WINDOW = 8
+NUM_PARTITIONS = 4
+
+def task_message(task_id: int) -> T.Any:
+    spec = (
+        "map_engine:count_split_bytes", "operator:add", "operator:add", "/tmp/result",
+        None, None,
+    )
+    split = ("/data/input_files/input0.txt", task_id << 26, (task_id + 1) << 26)
+    return 0, spec, (task_id, split, NUM_PARTITIONS, INLINE_MAP_OUTPUT_BYTES)
+
+class BenchServer(Protocol):
+    def __init__(self, tasks: int, window: int, finished: T.Callable[[int], None]) -> None:
+        super().__init__()
+        self.remaining = tasks
+        self.window = window
+        self.in_flight = 0
+        self.finished = finished
+        self.received = 0
+    
+    def process_command(self, command: bytes, data: T.Any = None) -> None:
+        self.received += 1
+        if command == b"mapdone":
+            self.in_flight -= 1
+        self.send_tasks()
+    
+    def send_tasks(self) -> None:
+        # 送信バッファが詰まっている間は送らない（writing_resumed で再開）
+        while self.remaining and self.in_flight < self.window and not self.writing_paused:
+            self.send_command(command=b"map", data=task_message(self.remaining))
+            self.remaining -= 1
+            self.in_flight += 1
+        if not self.remaining and not self.in_flight:
+            self.send_command(command=b"disconnect")
+            self.finished(self.received)
+    
+    def writing_resumed(self) -> None:
+        self.send_tasks()
+
+class BenchWorker(Protocol):
+    def __init__(self, inline: int) -> None:
+        super().__init__()
+        # パーティションごとの出力（インラインならバイト列、そうでなければファイル名）
+        output: T.Any = b"\0" * (inline // NUM_PARTITIONS) if inline else "/tmp/x.bin"
+        self.output = [output] * NUM_PARTITIONS
+    
+    def connection_made(self, transport: asyncio.Transport) -> None:
+        super().connection_made(transport)
+        self.send_command(command=b"hello", data={"data_dirs": []})
+    
+    def connection_lost(self, exc: T.Optional[Exception]) -> None:
+        asyncio.get_running_loop().stop()
+    
+    def process_command(self, command: bytes, data: T.Any = None) -> None:
+        if command == b"disconnect":
+            self.close()
+            return
+        _, _, (task_id, _, _) = data
+        stats = {"bytes_read": 1 << 26, "keys_emitted": 40000, "seconds": 0.5, "pid": 1}
+        self.send_command(command=b"mapdone", data=(0, (task_id, self.output), stats))
+
+def run_worker(port: int, inline: int, batch_writes: bool) -> None:
+    Protocol.batch_writes = batch_writes
+    loop = asyncio.new_event_loop()
+    connect = loop.create_connection(lambda: BenchWorker(inline), HOST, port)
+    loop.run_until_complete(connect)
+    loop.run_forever()
+    loop.close()
+
+async def run_server(args: argparse.Namespace, batch_writes: bool) -> T.Tuple[int, float]:
+    Protocol.batch_writes = batch_writes
+    loop = asyncio.get_running_loop()
+    done = loop.create_future()
+    counts: T.List[int] = []
+    first_message = [0.0]
+    
+    def finished(received: int) -> None:
+        counts.append(received)
+        if len(counts) == args.workers:
+            done.set_result(time.perf_counter())
+    
+    def make_server() -> BenchServer:
+        if not first_message[0]:
+            first_message[0] = time.perf_counter()
+        return BenchServer(args.tasks, args.window, finished)
+    
+    server = await loop.create_server(make_server, HOST, 0)
+    port = server.sockets[0].getsockname()[1]
+    processes = [
+        multiprocessing.Process(target=run_worker, args=(port, args.inline, batch_writes))
+        for _ in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+    end = await done
+    server.close()
+    for process in processes:
+        process.join()
+    # 送ったタスク + disconnect と、受け取った hello + mapdone
+    messages = sum(counts) + args.workers * (args.tasks + 1)
+    return messages, end - first_message[0]
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument(
+        "--tasks", type=int, default=TASKS_PER_WORKER, help="ワーカーごとのタスク数",
+    )
+    parser.add_argument(
+        "--window", type=int, default=WINDOW, help="ワーカーごとに先行して送るタスク数",
+    )
+    parser.add_argument(
+        "--inline", type=int, default=0, help="応答に載せるインラインの出力のバイト数",
+    )
+    args = parser.parse_args()
+    
+    print(
+        f"{args.workers} workers x {args.tasks} tasks, window {args.window}, "
+        f"inline {args.inline} bytes"
+    )
+    print(f"{'Writes':<10} {'Messages':>10} {'Time(s)':>8} {'Msgs/s':>10}")
+    print("-" * 41)
+    for batch_writes in (False, True):
+        messages, elapsed = asyncio.run(run_server(args, batch_writes))
+        name = "batched" if batch_writes else "immediate"
+        print(f"{name:<10} {messages:>10} {elapsed:>8.2f} {messages / elapsed:>10.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+import os
+import bz2
+import gzip
+import sys
+import json
+import time
+import tempfile
+import typing as T
+
+from bench_map_engine import make_corpus
+from jobs import Job, iter_lines
+from tasks import map_partitions
+from readers import (
+    BGZF_EOF, CHUNK_SIZE, encode_bgzf_block, make_splits, write_bgzf, zstandard,
+)
+
+# 入力の形式ごとの map のスループット（readers.py）
+#   python bench_readers.py [MB]    # 合成コーパス（既定 50MB）を各形式に変換して計測
+# 同じテキストを 平文 / gzip / bz2 / BGZF / zstd（zstandard があれば）/ JSON Lines（平文・BGZF）
+# で書き出し、既定のジョブ（ワードカウント）の map を全分割に対して実行する。
+# MB/s は伸長後のテキストの大きさで割った値なので、形式の間で比べられる。
+# BGZF は分割して読めるので、分割数も表示する（gzip / bz2 / zstd は 1 ファイル = 1 分割）。
+# 計測の前に、小さな分割で BGZF と平文の結果が一致するかを確かめる。ブロックの境界が
+# 行の途中 / 改行の直後 / 改行の直前 にある 3 通りを書き出し、分割の境界で行が欠けたり重なったりしないか見る。
+
+SYNTHETIC_MB = 50
+REPEAT = 3
+SPLIT_SIZE = 8 * 1024 * 1024
+MAPPER = "map_engine:count_split_bytes"
+CHECK_MB = 1
+CHECK_SPLIT_SIZE = 16 * 1024
+CHECK_BLOCK_SIZE = 4 * 1024
+
+def iter_file(filename: str) -> T.Iterator[bytes]:
+    with open(filename, "rb") as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+def write_stream(opener: T.Callable[..., T.BinaryIO], source: str, target: str) -> None:
+    with opener(target, "wb") as f:
+        for chunk in iter_file(source):
+            f.write(chunk)
+
+def write_jsonl(source: str, target: str) -> None:
+    # 1行 = 1レコード、本文は入れ子のフィールドに置く（field="message.text" で取り出す）
+    chunks = (chunk.decode("ISO-8859-1") for chunk in iter_file(source))
+    with open(target, "w", encoding="utf-8") as f:
+        for number, line in enumerate(iter_lines(chunks)):
+            f.write(json.dumps({"id": number, "message": {"text": line}}) + "\n")
+
+def write_bgzf_line_blocks(source: str, target: str, after_newline: bool) -> None:
+    # ブロックを改行の位置で区切った BGZF（after_newline なら改行の直後、そうでなければ直前）
+    with open(target, "wb") as f:
+        pending = b""
+        for chunk in iter_file(source):
+            pending += chunk
+            while len(pending) >= CHECK_BLOCK_SIZE:
+                cut = pending.rfind(b"\n", 1, CHECK_BLOCK_SIZE) + after_newline
+                if cut <= 0:
+                    cut = CHECK_BLOCK_SIZE
+                f.write(encode_bgzf_block(pending[:cut], 6))
+                pending = pending[cut:]
+        if pending:
+            f.write(encode_bgzf_block(pending, 6))
+        f.write(BGZF_EOF)
+
+def check_bgzf_splits(directory: str) -> None:
+    corpus = os.path.join(directory, "check.txt")
+    make_corpus(corpus, CHECK_MB, seed=1)
+    expected, _ = run_map(corpus, None, CHECK_SPLIT_SIZE)
+    layouts = {
+        "unaligned": lambda path: write_bgzf(path, iter_file(corpus)),
+        "after-newline": lambda path: write_bgzf_line_blocks(corpus, path, True),
+        "before-newline": lambda path: write_bgzf_line_blocks(corpus, path, False),
+    }
+    for name, write in layouts.items():
+        path = os.path.join(directory, f"check-{name}.bgz")
+        write(path)
+        counts, num_splits = run_map(path, None, CHECK_SPLIT_SIZE)
+        words, expected_words = sum(counts.values()), sum(expected.values())
+        assert counts == expected, (
+            f"BGZF ({name}) counts differ from plain text: {words} vs {expected_words} words"
+        )
+        print(f"BGZF split check ({name}): {num_splits} splits, {words} words, OK")
+
+def make_inputs(corpus: str, directory: str) -> T.Dict[str, T.Tuple[str, T.Optional[str]]]:
+    # 形式名 → (ファイル名, JSON のフィールド)
+    inputs: T.Dict[str, T.Tuple[str, T.Optional[str]]] = {"plain": (corpus, None)}
+    path = os.path.join(directory, "corpus.txt.gz")
+    write_stream(gzip.open, corpus, path)
+    inputs["gzip"] = (path, None)
+    path = os.path.join(directory, "corpus.txt.bz2")
+    write_stream(bz2.open, corpus, path)
+    inputs["bz2"] = (path, None)
+    path = os.path.join(directory, "corpus.txt.bgz")
+    write_bgzf(path, iter_file(corpus))
+    inputs["bgzf"] = (path, None)
+    if zstandard is not None:
+        path = os.path.join(directory, "corpus.txt.zst")
+        with open(corpus, "rb") as source, open(path, "wb") as f:
+            zstandard.ZstdCompressor().copy_stream(source, f)
+        inputs["zstd"] = (path, None)
+    jsonl = os.path.join(directory, "corpus.jsonl")
+    write_jsonl(corpus, jsonl)
+    inputs["jsonl"] = (jsonl, "message.text")
+    path = os.path.join(directory, "corpus.jsonl.bgz")
+    write_bgzf(path, iter_file(jsonl))
+    inputs["jsonl+bgzf"] = (path, "message.text")
+    return inputs
+
+def run_map(
+    filename: str, field: T.Optional[str], split_size: int = SPLIT_SIZE
+) -> T.Tuple[T.Dict[str, int], int]:
+    spec = Job("bench_readers", [filename], mapper=MAPPER, field=field).task_spec()
+    splits = make_splits([filename], split_size)
+    counts: T.Dict[str, int] = {}
+    for split in splits:
+        for partition in map_partitions(spec, split, 1):
+            for word, count in partition.items():
+                counts[word] = counts.get(word, 0) + count
+    return counts, len(splits)
+
+def main() -> None:
+    megabytes = int(sys.argv[1]) if len(sys.argv) > 1 else SYNTHETIC_MB
+    with tempfile.TemporaryDirectory() as temp_dir:
+        check_bgzf_splits(temp_dir)
+        corpus = os.path.join(temp_dir, "corpus.txt")
+        print(f"Generating {megabytes}MB synthetic corpus...")
+        make_corpus(corpus, megabytes)
+        inputs = make_inputs(corpus, temp_dir)
+        if zstandard is None:
+            print("zstandard is not installed; skipping zstd")
+        
+        text_mb = os.path.getsize(corpus) / 1024 / 1024
+        print(f"{'Format':<12} {'Size(MB)':>9} {'Splits':>7} {'Time(s)':>8} {'MB/s':>8}")
+        print("-" * 48)
+        expected = None
+        for name, (filename, field) in inputs.items():
+            timings = []
+            for _ in range(REPEAT):
+                start = time.perf_counter()
+                counts, num_splits = run_map(filename, field)
+                timings.append(time.perf_counter() - start)
+            if expected is None:
+                expected = counts
+            assert counts == expected, f"{name} counts differ from plain text"
+            elapsed = min(timings)
+            size_mb = os.path.getsize(filename) / 1024 / 1024
+            print(
+                f"{name:<12} {size_mb:>9.1f} {num_splits:>7} {elapsed:>8.2f} "
+                f"{text_mb / elapsed:>8.1f}"
+            )
+
+if __name__ == "__main__":
+    main()
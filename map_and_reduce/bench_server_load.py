@@ -0,0 +1,229 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+import typing as T
+
+from bench_local import wait_for_server
+from protocol import (
+    Protocol, HOST, PORT, LOOPS, uvloop, new_event_loop, raise_open_file_limit,
+)
+
+# 数千台のワーカーをつないだときのサーバー（スケジューラ）の負荷試験
+#   python bench_server_load.py [--workers N] [--tasks M] [--task-time S] [--procs P] [--loop NAME]
+# server.py を本物のまま起動し、P 個のプロセスから合計 N 本の接続で「ワーカーのふり」をする。
+# 模擬ワーカーは入力を読まず、map / reduce を受け取ったら --task-time 秒後に完了を返すだけなので、
+# 測れるのはサーバー側の割り当て・完了処理の速さになる。
+#   tasks/s:  全ワーカーが hello を送ってから最後の mapdone までの map タスク数/秒
+#   p50/p99:  mapdone を送ってから次の map タスクが届くまでの時間（割り当ての遅延）
+# 負荷をかける側も同じマシンで動くので、コア数が少ないと数字はその分だけ悪くなる。
+
+WORKERS = 2000
+TASKS = 20000
+NUM_PARTITIONS = 4
+LINE = b"x" * 99 + b"\n"
+STATS = {"bytes_read": 0, "keys_emitted": 0, "seconds": 0.0, "pid": 0}
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+class SimWorker(Protocol):
+    def __init__(
+        self, task_time: float, latencies: T.List[float], lost: T.Callable[[], None]
+    ) -> None:
+        super().__init__()
+        self.task_time = task_time
+        self.latencies = latencies
+        self.lost = lost
+        self.outputs = [b""] * NUM_PARTITIONS  # インラインの空の map 出力
+        self.sent_at = 0.0  # 最後に mapdone を送った時刻（それ以外を送ったら 0）
+        self.maps = 0
+        self.last_done = 0.0
+    
+    def connection_lost(self, exc: T.Optional[Exception]) -> None:
+        self.lost()
+    
+    def hello(self) -> None:
+        self.send_command(command=b"hello", data={"data_dirs": []})
+    
+    def process_command(self, command: bytes, data: T.Any = None) -> None:
+        if command == b"disconnect":
+            self.close()
+            return
+        if command == b"map" and self.sent_at:
+            self.latencies.append(time.perf_counter() - self.sent_at)
+        job_id, _, task = data
+        # 本物のワーカーと同じく、実行を始めたことを知らせる（1 タスクあたりのメッセージ数を揃える）
+        self.send_command(command=b"taskstarted", data=(job_id, (command, task[0])))
+        if command == b"map":
+            reply = b"mapdone", (job_id, (task[0], self.outputs), STATS)
+        else:
+            reply = b"reducedone", (job_id, (task[0], os.devnull), STATS)
+        if self.task_time > 0:
+            asyncio.get_running_loop().call_later(self.task_time, self.reply, *reply)
+        else:
+            self.reply(*reply)
+    
+    def reply(self, command: bytes, data: T.Any) -> None:
+        if self.transport.is_closing():
+            return
+        self.sent_at = 0.0
+        if command == b"mapdone":
+            self.maps += 1
+            self.last_done = time.time()
+            self.sent_at = time.perf_counter()
+        self.send_command(command=command, data=data)
+
+async def simulate(
+    count: int, task_time: float, barrier: T.Any
+) -> T.Tuple[T.List[float], int, float]:
+    # count 本の接続を張り、全プロセスが揃ってから一斉に hello を送る
+    loop = asyncio.get_running_loop()
+    finished = loop.create_future()
+    latencies: T.List[float] = []
+    open_connections = [count]
+    
+    def lost() -> None:
+        open_connections[0] -= 1
+        if not open_connections[0] and not finished.done():
+            finished.set_result(None)
+    
+    workers = []
+    for _ in range(count):
+        _, worker = await loop.create_connection(
+            lambda: SimWorker(task_time, latencies, lost), HOST, PORT
+        )
+        workers.append(worker)
+    await loop.run_in_executor(None, barrier.wait)
+    for worker in workers:
+        worker.hello()
+    await finished
+    maps = sum(worker.maps for worker in workers)
+    return latencies, maps, max(worker.last_done for worker in workers)
+
+def run_loadgen(
+    loop_name: str, count: int, task_time: float, barrier: T.Any, results: T.Any
+) -> None:
+    raise_open_file_limit()
+    loop = new_event_loop(loop_name)
+    try:
+        results.put(loop.run_until_complete(simulate(count, task_time, barrier)))
+    finally:
+        loop.close()
+
+def write_job(work_dir: str, tasks: int) -> str:
+    # 100 バイトの行をタスク数分並べ、1 行ずつの分割にする（分割は境界の次の改行まで伸びるので 1 引く）
+    input_file = os.path.join(work_dir, "load.txt")
+    with open(input_file, "wb") as f:
+        f.write(LINE * tasks)
+    job = {
+        "name": "load", "inputs": [input_file], "split_size": len(LINE) - 1,
+        "num_partitions": NUM_PARTITIONS, "merge_results": False, "cache": False,
+    }
+    jobs_file = os.path.join(work_dir, "jobs.json")
+    with open(jobs_file, "w") as f:
+        json.dump([job], f)
+    return jobs_file
+
+def percentile(values: T.List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def run_load(args: argparse.Namespace, loop_name: str, work_dir: str) -> T.Dict[str, float]:
+    env = dict(os.environ, PYTHONUNBUFFERED="1")
+    log_file = os.path.join(work_dir, f"server-{loop_name}.log")
+    jobs_file = write_job(work_dir, args.tasks)
+    with open(log_file, "w") as log:
+        server = subprocess.Popen(
+            [
+                sys.executable, os.path.join(HERE, "server.py"),
+                "--jobs", jobs_file, "--loop", loop_name,
+            ],
+            cwd=work_dir, env=env, stdout=log, stderr=subprocess.STDOUT,
+        )
+    try:
+        wait_for_server(log_file, server)
+        barrier = multiprocessing.Barrier(args.procs + 1)
+        results: T.Any = multiprocessing.Queue()
+        counts = [
+            args.workers // args.procs + (i < args.workers % args.procs)
+            for i in range(args.procs)
+        ]
+        processes = [
+            multiprocessing.Process(
+                target=run_loadgen,
+                args=(loop_name, count, args.task_time, barrier, results),
+            )
+            for count in counts
+        ]
+        for process in processes:
+            process.start()
+        barrier.wait()
+        start = time.time()
+        latencies: T.List[float] = []
+        maps = 0
+        end = start
+        for _ in processes:
+            process_latencies, process_maps, last_done = results.get()
+            latencies.extend(process_latencies)
+            maps += process_maps
+            end = max(end, last_done)
+        for process in processes:
+            process.join()
+        server.wait()
+    finally:
+        if server.poll() is None:
+            server.kill()
+    latencies.sort()
+    return {
+        "maps": maps,
+        "tasks_per_second": maps / (end - start) if end > start else 0.0,
+        "p50": percentile(latencies, 0.50),
+        "p99": percentile(latencies, 0.99),
+        "max": latencies[-1] if latencies else 0.0,
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=WORKERS, help="模擬ワーカーの数")
+    parser.add_argument("--tasks", type=int, default=TASKS, help="map タスクの数")
+    parser.add_argument(
+        "--task-time", type=float, default=0.0, help="模擬ワーカーが 1 タスクにかける時間（秒）",
+    )
+    parser.add_argument(
+        "--procs", type=int, default=os.cpu_count() or 1, help="模擬ワーカーを動かすプロセス数",
+    )
+    parser.add_argument(
+        "--loop", choices=LOOPS, action="append",
+        help="比べるイベントループ（既定はインストールされているもの全部）",
+    )
+    args = parser.parse_args()
+    loops = args.loop or [name for name in LOOPS if name != "uvloop" or uvloop is not None]
+    
+    limit = raise_open_file_limit()
+    if args.workers + 64 > limit:
+        sys.exit(f"Open file limit {limit} is too low for {args.workers} workers (ulimit -n)")
+    
+    print(
+        f"{args.workers} workers in {args.procs} process(es), {args.tasks} map tasks, "
+        f"task time {args.task_time * 1000:.1f}ms"
+    )
+    print(
+        f"{'Loop':<8} {'Maps':>7} {'Tasks/s':>9} {'p50(ms)':>8} {'p99(ms)':>8} {'max(ms)':>8}"
+    )
+    print("-" * 53)
+    with tempfile.TemporaryDirectory() as work_dir:
+        for loop_name in loops:
+            result = run_load(args, loop_name, work_dir)
+            print(
+                f"{loop_name:<8} {result['maps']:>7} {result['tasks_per_second']:>9.0f} "
+                f"{result['p50'] * 1000:>8.2f} {result['p99'] * 1000:>8.2f} "
+                f"{result['max'] * 1000:>8.2f}"
+            )
+
+if __name__ == "__main__":
+    main()
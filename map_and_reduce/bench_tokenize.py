@@ -0,0 +1,75 @@
+import os
+import sys
+import time
+import tempfile
+import typing as T
+
+from bench_map_engine import make_corpus
+
+# map のトークナイズ部分のマイクロベンチマーク（MB/s）
+#   python bench_tokenize.py            # 合成コーパス（既定 100MB）で計測
+#   python bench_tokenize.py FILE ...   # 既存のファイルで計測
+#   mapfn+combinefn:  旧実装（行ごとにデコードして re.split、単語ごとに小文字のコピー）
+#   count_split:      str のチャンク + 正規表現（map_engine.count_words）
+#   count_split_bytes: mmap したバイト列を translate + split、キーは最後に 1 回だけデコード
+# どれも同じ結果になることを確かめてから、最良値を表示する
+
+SYNTHETIC_MB = 100
+REPEAT = 3
+
+def run_legacy(filename: str) -> T.Dict[str, int]:
+    from worker import Worker
+    worker = Worker()
+    return worker.combinefn(worker.mapfn(filename))
+
+def run_str(filename: str) -> T.Dict[str, int]:
+    from map_engine import count_split
+    return count_split(filename, 0, os.path.getsize(filename))
+
+def run_bytes(filename: str) -> T.Dict[str, int]:
+    from map_engine import count_split_bytes
+    return count_split_bytes(filename, 0, os.path.getsize(filename))
+
+VARIANTS: T.Dict[str, T.Callable[[str], T.Dict[str, int]]] = {
+    "mapfn+combinefn": run_legacy,
+    "count_split": run_str,
+    "count_split_bytes": run_bytes,
+}
+
+def main() -> None:
+    filenames = sys.argv[1:]
+    temp_dir = None
+    if not filenames:
+        temp_dir = tempfile.TemporaryDirectory()
+        corpus = os.path.join(temp_dir.name, "corpus.txt")
+        print(f"Generating {SYNTHETIC_MB}MB synthetic corpus...")
+        make_corpus(corpus, SYNTHETIC_MB)
+        filenames = [corpus]
+    
+    total_mb = sum(os.path.getsize(f) for f in filenames) / 1024 / 1024
+    print(f"Input: {len(filenames)} file(s), {total_mb:.1f}MB")
+    print(f"{'Variant':<18} {'Time(s)':>8} {'MB/s':>8} {'Speedup':>8}")
+    print("-" * 46)
+    expected = None
+    baseline = None
+    for name, run in VARIANTS.items():
+        timings = []
+        for _ in range(REPEAT):
+            start = time.perf_counter()
+            results = [run(filename) for filename in filenames]
+            timings.append(time.perf_counter() - start)
+        if expected is None:
+            expected = results
+        assert results == expected, f"{name} counts differ from mapfn+combinefn"
+        elapsed = min(timings)
+        baseline = baseline or elapsed
+        print(
+            f"{name:<18} {elapsed:>8.2f} {total_mb / elapsed:>8.1f} "
+            f"{baseline / elapsed:>7.2f}x"
+        )
+    
+    if temp_dir is not None:
+        temp_dir.cleanup()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+import typing as T
+
+from map_engine import WORD_RE, split_tail
+from jobs import iter_lines
+
+# jobs.py のジョブで使う map 関数の例（jobs.example.json 参照）
+# "example_jobs:first_letters" のように指定する。reduce にはモジュールの関数（operator:add や builtins:max）も使える
+
+def iter_words(chunks: T.Iterable[str]) -> T.Iterator[str]:
+    # count_words と同じ区切りで単語を 1 つずつ返す
+    carry = ""
+    for chunk in chunks:
+        chunk, carry = split_tail(carry + chunk.lower())
+        yield from WORD_RE.findall(chunk)
+    if carry:
+        yield carry
+
+def first_letters(chunks: T.Iterable[str]) -> T.Iterator[T.Tuple[str, int]]:
+    # 単語の頭文字ごとの出現回数（combiner: operator:add）
+    for word in iter_words(chunks):
+        yield word[0], 1
+
+def longest_words(chunks: T.Iterable[str]) -> T.Iterator[T.Tuple[str, int]]:
+    # 頭文字ごとの最長の単語の長さ（combiner: builtins:max）
+    for word in iter_words(chunks):
+        yield word[0], len(word)
+
+def line_lengths(chunks: T.Iterable[str]) -> T.Iterator[T.Tuple[str, T.List[int]]]:
+    # 行の長さの [最小, 最大]（combiner: example_jobs:min_max）。値は整数以外でもよい
+    for line in iter_lines(chunks):
+        yield "line", [len(line), len(line)]
+
+def min_max(a: T.List[int], b: T.List[int]) -> T.List[int]:
+    return [min(a[0], b[0]), max(a[1], b[1])]
@@ -0,0 +1,101 @@
+import os
+import json
+import heapq
+import operator
+import typing as T
+from uuid import uuid4
+
+from intermediate import INTERMEDIATE_SUFFIX, MapOutput, iter_records, write_stream
+
+# 語彙がワーカーのメモリに収まらないジョブ向けの reduce
+# map の出力はキーでソート済み（intermediate.py）なので、ヒープで k-way マージしながら
+# 同じキーのカウントを足し合わせ、結果もそのまま順に書き出す。
+# メモリに載るのは「入力ファイル数 × 1ブロック」だけで、キー数には依存しない。
+# 入力ファイルが MAX_FAN_IN を超える場合は、途中結果をディスクに書き出して多段でマージする。
+
+MAX_FAN_IN = 64  # 同時に開く中間ファイルの上限
+JSON_BATCH = 4096  # 結果ファイルへまとめて書き込むレコード数
+
+Record = T.Tuple[str, T.Any]
+Reducer = T.Callable[[T.Any, T.Any], T.Any]
+
+def merge_records(
+    sources: T.Iterable[T.Iterator[Record]], reducer: Reducer = operator.add
+) -> T.Iterator[Record]:
+    # 同じキーの値を reducer で畳み込む（ワードカウントなら足し算）
+    current_key: T.Optional[str] = None
+    total = None
+    for key, count in heapq.merge(*sources, key=operator.itemgetter(0)):
+        if key == current_key:
+            total = reducer(total, count)
+            continue
+        if current_key is not None:
+            yield current_key, total
+        current_key, total = key, count
+    if current_key is not None:
+        yield current_key, total
+
+def spill(filenames: T.List[MapOutput], spill_dir: str, reducer: Reducer) -> str:
+    # filenames をマージした結果を、同じ中間形式で一時ファイルに書き出す
+    spill_file = os.path.join(spill_dir, f"{uuid4()}{INTERMEDIATE_SUFFIX}")
+    records = merge_records((iter_records(f) for f in filenames), reducer)
+    write_stream(spill_file, records)
+    return spill_file
+
+def write_json_stream(filename: str, records: T.Iterable[Record]) -> int:
+    # 書き出したレコード数を返す
+    written = 0
+    with open(filename, "w") as f:
+        f.write("{")
+        separator = ""
+        batch: T.List[str] = []
+        for key, count in records:
+            written += 1
+            batch.append(f"{json.dumps(key)}: {json.dumps(count)}")
+            if len(batch) >= JSON_BATCH:
+                f.write(separator + ", ".join(batch))
+                separator = ", "
+                batch = []
+        if batch:
+            f.write(separator + ", ".join(batch))
+        f.write("}")
+    return written
+
+def iter_merged(
+    map_files: T.List[MapOutput],
+    spill_dir: str,
+    fan_in: int = MAX_FAN_IN,
+    reducer: Reducer = operator.add,
+) -> T.Iterator[Record]:
+    # map_files 全体をキー順にマージしたレコード（途中のスピルは読み終わったら消す）
+    spills: T.List[str] = []
+    filenames: T.List[MapOutput] = list(map_files)
+    try:
+        while len(filenames) > fan_in:
+            merged = []
+            for position in range(0, len(filenames), fan_in):
+                group = filenames[position:position + fan_in]
+                if len(group) == 1:
+                    # 1つだけ余ったファイルはそのまま次の段へ回す
+                    merged.append(group[0])
+                    continue
+                print(f"Spilling merge of {len(group)} files")
+                spill_file = spill(group, spill_dir, reducer)
+                spills.append(spill_file)
+                merged.append(spill_file)
+            filenames = merged
+        yield from merge_records((iter_records(f) for f in filenames), reducer)
+    finally:
+        # 元の map 出力は残し、途中で書き出したファイルだけ消す
+        for spill_file in spills:
+            os.remove(spill_file)
+
+def external_reduce(
+    map_files: T.List[MapOutput],
+    result_file: str,
+    spill_dir: str,
+    fan_in: int = MAX_FAN_IN,
+    reducer: Reducer = operator.add,
+) -> int:
+    records = iter_merged(map_files, spill_dir, fan_in, reducer)
+    return write_json_stream(result_file, records)
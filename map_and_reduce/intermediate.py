@@ -0,0 +1,224 @@
+import io
+import sys
+import gzip
+import pickle
+import typing as T
+from array import array
+from itertools import islice
+
+from protocol import Occurrences
+
+# map → reduce 間の中間ファイルのバイナリ形式
+#
+#   MAGIC  ブロック ... ブロック  終端(0)
+#
+# キーでソート済みのレコードを BLOCK_SIZE 件ずつ列指向のブロックにまとめる。
+#   varint  件数 n（0 なら終端）
+#   1バイト キーの格納方式（KEYS_SEPARATED / KEYS_LENGTH_PREFIXED）
+#   varint  キー部のバイト数 + キー部（UTF-8）
+#   [KEYS_LENGTH_PREFIXED のときのみ] 1バイト 幅 + n 個のキー長
+#   1バイト 値の格納方式（VALUES_INT / VALUES_PICKLED）
+#   VALUES_INT:    1バイト 幅 + n 個のカウント（リトルエンディアン、ブロック内の最大値に合わせた 1/2/4/8 バイト）
+#   VALUES_PICKLED: varint バイト数 + 値のリストの pickle（整数以外の値を出すジョブ向け、jobs.py 参照）
+#
+# JSON と違い、1レコードごとの Python ループを持たず、
+# "\0".join / split や array.tobytes / frombytes でブロック単位にまとめて変換する。
+# ブロック単位で読み進められるので、reduce 側はファイル全体を読み込まずに順に処理できる。
+# compress=True のときはファイル全体を gzip ストリームで書く。
+# 小さい map の出力はファイルにせず、同じ形式のバイト列のままメッセージで送ることもある
+# （MapOutput、tasks.py 参照）。読む側の関数はどちらでも受け付ける。
+
+MAGIC = b"MRI\x02"
+GZIP_MAGIC = b"\x1f\x8b"
+INTERMEDIATE_SUFFIX = ".bin"
+MapOutput = T.Union[str, bytes]  # 中間ファイルのパス、またはその中身
+BLOCK_SIZE = 4096
+COMPRESS_LEVEL = 1
+
+KEYS_SEPARATED = 0  # "\0" 区切り（キーに "\0" を含まない通常のケース）
+KEYS_LENGTH_PREFIXED = 1  # キーごとの長さを別の列に持つ
+VALUES_INT = 0  # 0以上の整数（ワードカウントなど）
+VALUES_PICKLED = 1  # それ以外の任意の値
+
+SEPARATOR = "\0"
+WIDTHS = (1, 2, 4, 8)
+# array の要素サイズは環境依存なので、実際のサイズから型コードを選ぶ
+TYPECODES = {
+    width: next(code for code in "BHILQ" if array(code).itemsize == width)
+    for width in WIDTHS
+}
+
+def encode_varint(value: int) -> bytes:
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+def read_varint(f: T.BinaryIO) -> int:
+    shift = 0
+    value = 0
+    while True:
+        byte = f.read(1)
+        if not byte:
+            raise EOFError("Truncated intermediate file")
+        value |= (byte[0] & 0x7F) << shift
+        if byte[0] < 0x80:
+            return value
+        shift += 7
+
+def read_exact(f: T.BinaryIO, size: int) -> bytes:
+    data = f.read(size)
+    if len(data) != size:
+        raise EOFError("Truncated intermediate file")
+    return data
+
+def encode_column(values: T.List[int]) -> bytes:
+    # ブロック内の最大値が収まる最小の幅で詰める
+    largest = max(values)
+    for width in WIDTHS:
+        if largest < 1 << (8 * width):
+            break
+    else:
+        raise OverflowError("Value does not fit in 64 bits")
+    column = array(TYPECODES[width], values)
+    if sys.byteorder == "big":
+        column.byteswap()
+    return bytes((width,)) + column.tobytes()
+
+def read_column(f: T.BinaryIO, count: int) -> T.List[int]:
+    width = read_exact(f, 1)[0]
+    column = array(TYPECODES[width])
+    column.frombytes(read_exact(f, width * count))
+    if sys.byteorder == "big":
+        column.byteswap()
+    return column.tolist()
+
+def encode_block(keys: T.List[str], counts: T.List[int]) -> bytes:
+    parts = [encode_varint(len(keys))]
+    joined = SEPARATOR.join(keys)
+    if joined.count(SEPARATOR) == len(keys) - 1:
+        key_bytes = joined.encode("utf-8")
+        parts += [bytes((KEYS_SEPARATED,)), encode_varint(len(key_bytes)), key_bytes]
+    else:
+        encoded = [key.encode("utf-8") for key in keys]
+        key_bytes = b"".join(encoded)
+        parts += [
+            bytes((KEYS_LENGTH_PREFIXED,)),
+            encode_varint(len(key_bytes)),
+            key_bytes,
+            encode_column([len(key) for key in encoded]),
+        ]
+    try:
+        parts += [bytes((VALUES_INT,)), encode_column(counts)]
+    except (TypeError, ValueError, OverflowError):
+        # 負の数や整数以外の値は列にまとめて pickle する
+        pickled = pickle.dumps(list(counts), pickle.HIGHEST_PROTOCOL)
+        parts += [bytes((VALUES_PICKLED,)), encode_varint(len(pickled)), pickled]
+    return b"".join(parts)
+
+def read_block(f: T.BinaryIO) -> T.Optional[T.Tuple[T.List[str], T.List[int]]]:
+    count = read_varint(f)
+    if count == 0:
+        return None
+    mode = read_exact(f, 1)[0]
+    key_bytes = read_exact(f, read_varint(f))
+    if mode == KEYS_SEPARATED:
+        keys = key_bytes.decode("utf-8").split(SEPARATOR)
+    else:
+        keys = []
+        position = 0
+        for length in read_column(f, count):
+            keys.append(key_bytes[position:position + length].decode("utf-8"))
+            position += length
+    if read_exact(f, 1)[0] == VALUES_PICKLED:
+        return keys, pickle.loads(read_exact(f, read_varint(f)))
+    return keys, read_column(f, count)
+
+def dump_records(f: T.BinaryIO, keys: T.List[str], counts: T.List[int]) -> None:
+    # keys はソート済みであること（reduce 側のマージがこの順序に依存する）
+    f.write(MAGIC)
+    for position in range(0, len(keys), BLOCK_SIZE):
+        f.write(
+            encode_block(
+                keys[position:position + BLOCK_SIZE],
+                counts[position:position + BLOCK_SIZE],
+            )
+        )
+    f.write(encode_varint(0))
+
+def write_records(
+    filename: str, keys: T.List[str], counts: T.List[int], compress: bool = False
+) -> None:
+    opener = gzip.open if compress else open
+    kwargs = {"compresslevel": COMPRESS_LEVEL} if compress else {}
+    with opener(filename, "wb", **kwargs) as f:
+        dump_records(f, keys, counts)
+
+def write_stream(
+    filename: str, records: T.Iterable[T.Tuple[str, int]], compress: bool = False
+) -> None:
+    # ソート済みのレコード列を BLOCK_SIZE 件ずつ書き出す（全体をメモリに載せない）
+    opener = gzip.open if compress else open
+    kwargs = {"compresslevel": COMPRESS_LEVEL} if compress else {}
+    records = iter(records)
+    with opener(filename, "wb", **kwargs) as f:
+        f.write(MAGIC)
+        while True:
+            block = list(islice(records, BLOCK_SIZE))
+            if not block:
+                break
+            keys, counts = zip(*block)
+            f.write(encode_block(list(keys), list(counts)))
+        f.write(encode_varint(0))
+
+def save_occurrences(
+    filename: str, results: Occurrences, compress: bool = False
+) -> None:
+    keys = sorted(results)
+    write_records(filename, keys, list(map(results.__getitem__, keys)), compress)
+
+def dump_occurrences(f: T.BinaryIO, results: Occurrences) -> None:
+    # ファイル以外（共有メモリに載せる BytesIO など）に書き出す
+    keys = sorted(results)
+    dump_records(f, keys, list(map(results.__getitem__, keys)))
+
+def open_intermediate(filename: MapOutput) -> T.BinaryIO:
+    if isinstance(filename, bytes):
+        data = filename
+        if data.startswith(GZIP_MAGIC):
+            data = gzip.decompress(data)
+        f: T.BinaryIO = io.BytesIO(data)
+        filename = "inline map output"
+    else:
+        with open(filename, "rb") as f:
+            compressed = f.read(2) == GZIP_MAGIC
+        f = gzip.open(filename, "rb") if compressed else open(filename, "rb")
+    if f.read(len(MAGIC)) != MAGIC:
+        f.close()
+        raise ValueError(f"{filename} is not an intermediate file")
+    return f
+
+def read_blocks(f: T.BinaryIO) -> T.Iterator[T.Tuple[T.List[str], T.List[int]]]:
+    # MAGIC を読み終えたストリームからブロックを順に返す
+    while True:
+        block = read_block(f)
+        if block is None:
+            return
+        yield block
+
+def iter_blocks(filename: MapOutput) -> T.Iterator[T.Tuple[T.List[str], T.List[int]]]:
+    with open_intermediate(filename) as f:
+        yield from read_blocks(f)
+
+def iter_records(filename: MapOutput) -> T.Iterator[T.Tuple[str, int]]:
+    # キー順にレコードを 1 件ずつ返す。メモリに載るのは 1 ブロック分だけ
+    for keys, counts in iter_blocks(filename):
+        yield from zip(keys, counts)
+
+def load_occurrences(filename: MapOutput) -> Occurrences:
+    results: Occurrences = {}
+    for keys, counts in iter_blocks(filename):
+        results.update(zip(keys, counts))
+    return results
@@ -0,0 +1,246 @@
+import asyncio
+import typing as T
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from scheduler import Scheduler
+from splits import Split
+from readers import make_splits
+from jobs import Job, TaskSpec
+from metrics import DISABLED, Metrics
+from map_cache import MapCache
+
+# 複数のジョブを、ワーカーを再起動せずに順に（または同時に）実行する
+#
+# ジョブごとに Scheduler を 1 つ作り、Server からは Scheduler と同じメソッドで呼ばれる。
+# ワーカーに送るタスクは (ジョブID, 関数の指定, Scheduler が作ったタスク) で、
+# ワーカーから届く結果 (ジョブID, 結果) を該当ジョブの Scheduler に渡す。
+# ワーカーの登録・ハートビート・切断は実行中の全ジョブに伝える。
+# 入力の glob の展開と分割はファイルシステムを見るので、イベントループの外（1 スレッドのエグゼキュータ）で行う。
+# 1 スレッドなので、投入した順に展開・分割が終わり、ジョブIDも投入順になる。
+
+MAX_CONCURRENT_JOBS = 1  # 同時に実行するジョブ数（1 なら投入順に 1 つずつ）
+
+# 投入の結果を受け取るコールバック: (ジョブID, None) か (None, 投入できなかった理由)
+SubmitCallback = T.Callable[[T.Optional[int], T.Optional[BaseException]], None]
+
+class JobManager:
+    def __init__(
+        self,
+        max_concurrent_jobs: int = MAX_CONCURRENT_JOBS,
+        exit_when_idle: bool = True,
+        metrics: Metrics = DISABLED,
+        cache: T.Optional[MapCache] = None,
+    ) -> None:
+        self.max_concurrent_jobs = max_concurrent_jobs
+        # 全ジョブの Scheduler で共有する（ジョブは "ジョブID-名前" のラベルで区別する）
+        self.metrics = metrics
+        # map 出力のキャッシュ（ジョブごとに Job.cache で使うかどうかを決める）
+        self.cache = cache
+        # 全ジョブが終わったらイベントループを止める（False なら次のジョブの投入を待ち続ける）
+        self.exit_when_idle = exit_when_idle
+        self.next_job_id = 0
+        # 入力を展開中のジョブの数 / 入力が決まって順番を待つジョブ (ジョブID, ジョブ, 入力ファイル)
+        # / 分割を作っているジョブ（同時実行数に数える）
+        self.resolving = 0
+        self.queued_jobs: T.Deque[T.Tuple[int, Job, T.List[str]]] = deque()
+        self.preparing: T.Set[int] = set()
+        self.executor = ThreadPoolExecutor(1)
+        # 実行中のジョブ: ジョブID → (Scheduler, 関数の指定)。投入順に割り当てる
+        self.active_jobs: "OrderedDict[int, T.Tuple[Scheduler, TaskSpec]]" = OrderedDict()
+        self.closing = False
+        # ワーカーID → 接続を切るコールバック / 手元のデータディレクトリ
+        # 後から始まったジョブの Scheduler にも同じワーカーを登録するために覚えておく
+        self.next_worker_id = 0
+        self.lost_callbacks: T.Dict[int, T.Callable[[], None]] = {}
+        self.data_dirs: T.Dict[int, T.List[str]] = {}
+        self.idle_workers: T.List[asyncio.Future] = []
+    
+    def submit(self, job: Job, on_submitted: T.Optional[SubmitCallback] = None) -> None:
+        # 入力を展開してからキューに入れ、on_submitted(ジョブID, None) を呼ぶ
+        # 入力が展開できないかファイルが 1 つもなければ、キューに入れず on_submitted(None, エラー)
+        self.resolving += 1
+        future = asyncio.get_running_loop().run_in_executor(self.executor, job.input_files)
+        future.add_done_callback(lambda f: self.job_resolved(job, on_submitted, f))
+    
+    def job_resolved(
+        self, job: Job, on_submitted: T.Optional[SubmitCallback], future: asyncio.Future
+    ) -> None:
+        self.resolving -= 1
+        error = future.exception()
+        if error is None and not future.result():
+            error = ValueError(f"No input files match {job.inputs}")
+        if error is not None:
+            print(f"REJECTED job ({job.name}): {error}")
+            if on_submitted is not None:
+                on_submitted(None, error)
+            self.check_idle()
+            return
+        job_id = self.next_job_id
+        self.next_job_id += 1
+        print(f"SUBMITTED job {job_id} ({job.name})")
+        self.queued_jobs.append((job_id, job, future.result()))
+        if on_submitted is not None:
+            on_submitted(job_id, None)
+        self.start_jobs()
+    
+    def start_jobs(self) -> None:
+        # 同時実行数に空きがあれば、待っているジョブの分割をイベントループの外で作る
+        loop = asyncio.get_running_loop()
+        while (
+            self.queued_jobs
+            and len(self.active_jobs) + len(self.preparing) < self.max_concurrent_jobs
+        ):
+            job_id, job, files = self.queued_jobs.popleft()
+            self.preparing.add(job_id)
+            future = loop.run_in_executor(
+                self.executor, make_splits, files, job.split_size, job.word_splits()
+            )
+            future.add_done_callback(
+                lambda f, job_id=job_id, job=job, files=files:
+                    self.job_prepared(job_id, job, files, f)
+            )
+    
+    def job_prepared(
+        self, job_id: int, job: Job, files: T.List[str], future: asyncio.Future
+    ) -> None:
+        self.preparing.discard(job_id)
+        if future.cancelled() or self.closing:
+            return
+        if future.exception() is not None:
+            print(f"FAILED job {job_id}: {future.exception()!r}")
+            self.start_jobs()
+            self.check_idle()
+            return
+        self.start_job(job_id, job, files, future.result())
+    
+    def start_job(
+        self, job_id: int, job: Job, files: T.List[str], splits: T.List[Split]
+    ) -> None:
+        scheduler = Scheduler(
+            files,
+            splits=splits,
+            split_size=job.split_size,
+            num_partitions=job.num_partitions,
+            merge_results=job.merge_results,
+            reduce_mode=job.reduce_mode,
+            summary=job.summary(),
+            output=job.output,
+            on_finished=lambda job_id=job_id: self.job_finished(job_id),
+            metrics=self.metrics,
+            job=f"{job_id}-{job.name}",
+            cache=self.cache if job.cache else None,
+            cache_version=job.map_version(),
+        )
+        for worker_id, on_lost in self.lost_callbacks.items():
+            scheduler.register_worker(on_lost, worker_id)
+            if worker_id in self.data_dirs:
+                scheduler.set_locality(worker_id, self.data_dirs[worker_id])
+        self.active_jobs[job_id] = (scheduler, job.task_spec())
+        print(f"STARTED job {job_id} ({job.name}): {scheduler.data_len} map tasks")
+        self.notify_work()
+    
+    def job_finished(self, job_id: int) -> None:
+        scheduler, _ = self.active_jobs.pop(job_id)
+        if scheduler.error is not None:
+            print(f"FAILED job {job_id}: {scheduler.error}")
+        else:
+            print(f"FINISHED job {job_id}")
+        # このジョブを待っていたワーカーを起こし、次のジョブのタスクを取りに行かせる
+        scheduler.notify_work()
+        self.start_jobs()
+        self.check_idle()
+    
+    def check_idle(self) -> None:
+        if not self.exit_when_idle or self.closing:
+            return
+        if not (self.resolving or self.queued_jobs or self.preparing or self.active_jobs):
+            self.close()
+    
+    def close(self) -> None:
+        # 待機中のワーカーに disconnect を送ってからイベントループを止める
+        self.closing = True
+        self.executor.shutdown(wait=False)
+        self.notify_work()
+        loop = asyncio.get_running_loop()
+        loop.call_soon(loop.stop)
+    
+    def get_next_task(self, worker_id: T.Optional[int] = None) -> T.Tuple[bytes, T.Any]:
+        # 先に投入されたジョブのタスクから順に渡す
+        for job_id, (scheduler, spec) in list(self.active_jobs.items()):
+            command, data = scheduler.get_next_task(worker_id)
+            if command in (b"map", b"reduce"):
+                return command, (job_id, spec, data)
+        if self.closing:
+            return b"disconnect", None
+        return b"wait", None
+    
+    def map_done(
+        self, data: T.Tuple[int, T.Any, T.Any], worker_id: T.Optional[int] = None
+    ) -> None:
+        job_id, result, stats = data
+        if job_id in self.active_jobs:
+            self.active_jobs[job_id][0].map_done(result, worker_id, stats)
+    
+    def reduce_done(
+        self, data: T.Tuple[int, T.Any, T.Any], worker_id: T.Optional[int] = None
+    ) -> None:
+        job_id, result, stats = data
+        if job_id in self.active_jobs:
+            self.active_jobs[job_id][0].reduce_done(result, worker_id, stats)
+    
+    def task_started(
+        self, data: T.Tuple[int, T.Tuple[bytes, int]], worker_id: T.Optional[int] = None
+    ) -> None:
+        job_id, (kind, task_id) = data
+        if job_id in self.active_jobs:
+            self.active_jobs[job_id][0].task_started(kind, task_id, worker_id)
+    
+    def task_failed(
+        self, data: T.Tuple[int, T.Tuple[bytes, int], str], worker_id: T.Optional[int] = None
+    ) -> None:
+        job_id, (kind, task_id), error = data
+        if job_id in self.active_jobs:
+            self.active_jobs[job_id][0].task_failed(kind, task_id, error, worker_id)
+    
+    def register_worker(self, on_lost: T.Callable[[], None]) -> int:
+        worker_id = self.next_worker_id
+        self.next_worker_id += 1
+        self.lost_callbacks[worker_id] = on_lost
+        self.metrics.worker_connected(worker_id)
+        for scheduler, _ in self.active_jobs.values():
+            scheduler.register_worker(on_lost, worker_id)
+        return worker_id
+    
+    def heartbeat(self, worker_id: int) -> None:
+        for scheduler, _ in self.active_jobs.values():
+            scheduler.heartbeat(worker_id)
+    
+    def set_locality(self, worker_id: int, data_dirs: T.List[str]) -> None:
+        self.data_dirs[worker_id] = data_dirs
+        for scheduler, _ in self.active_jobs.values():
+            scheduler.set_locality(worker_id, data_dirs)
+    
+    def worker_lost(self, worker_id: T.Optional[int]) -> None:
+        if self.lost_callbacks.pop(worker_id, None) is not None:
+            self.metrics.worker_disconnected(worker_id)
+        self.data_dirs.pop(worker_id, None)
+        for scheduler, _ in list(self.active_jobs.values()):
+            scheduler.worker_lost(worker_id)
+    
+    def wait_for_work(self) -> asyncio.Future:
+        # どのジョブに新しいタスクができても起きられるよう、全 Scheduler に同じ Future を預ける
+        # 別のジョブに起こされた Future は残り続けるので、接続中のワーカー数より十分多くなったら捨てる
+        future = asyncio.get_running_loop().create_future()
+        limit = 2 * len(self.lost_callbacks) + 16
+        for waiters in [self.idle_workers] + [s.idle_workers for s, _ in self.active_jobs.values()]:
+            if len(waiters) > limit:
+                waiters[:] = [waiter for waiter in waiters if not waiter.done()]
+            waiters.append(future)
+        return future
+    
+    def notify_work(self) -> None:
+        idle_workers, self.idle_workers = self.idle_workers, []
+        for future in idle_workers:
+            if not future.done():
+                future.set_result(None)
@@ -0,0 +1,146 @@
+import os
+import glob
+import json
+import functools
+import importlib
+import typing as T
+from collections.abc import Mapping
+
+from splits import SPLIT_SIZE
+from partition import NUM_PARTITIONS
+from summaries import SKETCH_MODES, SUMMARY_MODES, Summary, summary_options
+
+# ユーザー定義の map / combine / reduce 関数を持つジョブ
+#
+# 関数は "モジュール:属性" の文字列で指定し、ワーカー側で import する。
+# （関数そのものを送らないので、サーバーとワーカーで同じモジュールが import できればよい）
+#   mapper:   チャンク（str）のイテレータを受け取り、{キー: 値} か (キー, 値) の列を返す
+#             チャンクの境界は単語や行の途中にあり得る（行単位で処理するなら iter_lines を使う）
+#             @reads_split を付けた関数は、代わりに分割 (path, start, end) を直接受け取る
+#   field:    入力が JSON Lines のとき、各レコードのこのフィールド（"a.b" で入れ子）の値だけを
+#             1行ずつ mapper に渡す（readers.py 参照）
+# 入力は gzip / bz2 / zstd / BGZF で圧縮されていてもよい（中身で判別して伸長しながら読む）
+# reduce_mode が "topk" / "count-min" / "hyperloglog" なら、結果は全キーではなくその要約になる
+# （summaries.py 参照。reduce_options で k やスケッチの大きさを変えられる）
+#   combiner: 同じキーの値を 2 つずつ畳み込む（map 側で (キー, 値) の列を集約するとき）
+#   reducer:  reduce 側で同じキーの値を畳み込む（None なら combiner と同じ）
+# 既定値はワードカウント（map_engine.count_split_bytes + 足し算）
+
+DEFAULT_MAPPER = "map_engine:count_split_bytes"
+DEFAULT_COMBINER = "operator:add"
+DEFAULT_OUTPUT = "result"
+# 単語だけを数え、行の境界を必要としない mapper（入力を空白の直後で分割してもよい。splits.py 参照）
+WORD_MAPPERS = (DEFAULT_MAPPER, "map_engine:count_words")
+REDUCE_MODES = ("memory", "external") + SUMMARY_MODES
+DEFAULT_INPUTS = [
+    "input_files/*.txt", "input_files/*.gz", "input_files/*.bz2", "input_files/*.zst",
+]
+
+# ワーカーに送る関数の指定
+# (mapper, combiner, reducer, 出力ファイル名の接頭辞, JSON のフィールド, 要約モードとオプション)
+TaskSpec = T.Tuple[str, str, str, str, T.Optional[str], T.Optional[Summary]]
+
+class Job(T.NamedTuple):
+    name: str
+    inputs: T.List[str]  # 入力ファイルの glob パターン
+    mapper: str = DEFAULT_MAPPER
+    combiner: str = DEFAULT_COMBINER
+    reducer: T.Optional[str] = None
+    num_partitions: int = NUM_PARTITIONS
+    split_size: int = SPLIT_SIZE
+    reduce_mode: str = "memory"
+    output: str = DEFAULT_OUTPUT  # 結果は {output}-N.json（merge_results なら {output}.json も）
+    merge_results: bool = True
+    version: str = ""  # map 関数の中身を変えたら上げる（map_cache.py のキーに入る）
+    cache: bool = True  # サーバーが --cache-dir 付きで動いていれば map の出力を再利用する
+    field: T.Optional[str] = None  # JSON Lines の入力から取り出すフィールド
+    reduce_options: T.Optional[T.Dict[str, int]] = None  # 要約モードのオプション
+    
+    def input_files(self) -> T.List[str]:
+        files: T.List[str] = []
+        for pattern in self.inputs:
+            files.extend(sorted(glob.glob(os.path.abspath(pattern))))
+        return files
+    
+    def word_splits(self) -> bool:
+        # JSON Lines のフィールドを取り出すなら、ワードカウントでもレコード（行）の境界で分ける
+        return self.mapper in WORD_MAPPERS and self.field is None
+    
+    def map_version(self) -> str:
+        # 同じ版の map 関数なら同じ入力から同じ出力が得られる
+        # スケッチのモードでは map の出力がスケッチになるので、その設定も含める
+        summary = self.summary()
+        sketch = json.dumps(summary) if summary and summary[0] in SKETCH_MODES else ""
+        return f"{self.mapper}|{self.combiner}|{self.field}|{sketch}|{self.version}"
+    
+    def summary(self) -> T.Optional[Summary]:
+        if self.reduce_mode not in SUMMARY_MODES:
+            return None
+        return self.reduce_mode, summary_options(self.reduce_mode, self.reduce_options)
+    
+    def task_spec(self) -> TaskSpec:
+        reducer = self.reducer or self.combiner
+        output = os.path.abspath(self.output)
+        return self.mapper, self.combiner, reducer, output, self.field, self.summary()
+
+def job_from_dict(spec: T.Dict[str, T.Any]) -> Job:
+    # JSON で書いたジョブ定義から Job を作る（未知のキーはエラーにする）
+    unknown = set(spec) - set(Job._fields)
+    if unknown:
+        raise ValueError(f"Unknown job fields: {sorted(unknown)}")
+    job = Job(**spec)
+    if job.reduce_mode not in REDUCE_MODES:
+        raise ValueError(f"Unknown reduce mode: {job.reduce_mode}")
+    # オプションの誤りも投入した時点で分かるようにする
+    job.summary()
+    return job
+
+def reads_split(
+    chunk_mapper: T.Optional[T.Callable[..., T.Any]] = None,
+) -> T.Callable[[T.Callable[..., T.Any]], T.Callable[..., T.Any]]:
+    # チャンクではなく (path, start, end) を受け取る mapper の印
+    # 自分でファイルを mmap してバイト列のまま処理したい場合に使う
+    # 圧縮された入力や JSON Lines はそのまま読めないので、代わりに chunk_mapper にチャンクを渡す
+    def decorate(mapper: T.Callable[..., T.Any]) -> T.Callable[..., T.Any]:
+        mapper.reads_split = True  # type: ignore[attr-defined]
+        mapper.chunk_mapper = chunk_mapper  # type: ignore[attr-defined]
+        return mapper
+    return decorate
+
+@functools.lru_cache(maxsize=None)
+def load_callable(path: str) -> T.Callable[..., T.Any]:
+    # "モジュール:属性" を import する。プロセスごとに一度だけ import してキャッシュする
+    module_name, _, attribute = path.partition(":")
+    if not module_name or not attribute:
+        raise ValueError(f"Expected 'module:attribute', got {path!r}")
+    target: T.Any = importlib.import_module(module_name)
+    for name in attribute.split("."):
+        target = getattr(target, name)
+    if not callable(target):
+        raise TypeError(f"{path} is not callable")
+    return target
+
+def combine(
+    output: T.Union[T.Mapping[str, T.Any], T.Iterable[T.Tuple[str, T.Any]]],
+    combiner: T.Callable[[T.Any, T.Any], T.Any],
+) -> T.Dict[str, T.Any]:
+    # mapper の出力を {キー: 値} にまとめる
+    if isinstance(output, Mapping):
+        return dict(output)
+    combined: T.Dict[str, T.Any] = {}
+    for key, value in output:
+        if key in combined:
+            combined[key] = combiner(combined[key], value)
+        else:
+            combined[key] = value
+    return combined
+
+def iter_lines(chunks: T.Iterable[str]) -> T.Iterator[str]:
+    # チャンクの境界で途切れた行をつなぎ直して 1 行ずつ返す（改行は含まない）
+    carry = ""
+    for chunk in chunks:
+        lines = (carry + chunk).split("\n")
+        carry = lines.pop()
+        yield from lines
+    if carry:
+        yield carry
@@ -0,0 +1,242 @@
+import io
+import os
+import json
+import time
+import asyncio
+import argparse
+import contextlib
+import typing as T
+from concurrent.futures import Executor, ProcessPoolExecutor
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+from scheduler import Scheduler
+from jobs import DEFAULT_INPUTS, Job, job_from_dict, load_callable
+from intermediate import MAGIC, dump_occurrences, read_blocks
+from external_merge import merge_records, write_json_stream
+from metrics import DISABLED, Metrics
+from summaries import (
+    SKETCH_MODES, Sketch, build_sketch, merge_sketches, sketch_from_bytes, top_records,
+    write_sketch_result,
+)
+from tasks import (
+    RESULT_FILENAME, TaskStats, map_partitions, map_stats, reduce_blocks,
+    reduce_stats, write_result,
+)
+
+# 1台のマシンだけで完結する実行モード
+#   python local_executor.py [--processes N] [--jobs FILE.json]
+#
+# server.py / worker.py と同じ Scheduler と map / reduce 関数を使うが、
+# TCP 接続やワーカープロセスの起動を待たず、手元のプロセスプールでタスクを直接実行する。
+# map の出力はディスク上の中間ファイルではなく共有メモリ（multiprocessing.shared_memory）に置き、
+# reduce タスクは名前で共有メモリを開き、バッファ全体をコピーせずに memoryview のまま読む。
+# 共有メモリはジョブが終わったら親プロセスで解放する
+# （途中で落ちても、multiprocessing の resource_tracker が後始末する）。
+
+# 共有メモリ上の中間データ (名前, バイト数)
+SharedBuffer = T.Tuple[str, int]
+
+def save_shared(results: T.Dict[str, T.Any]) -> SharedBuffer:
+    # 中間ファイルと同じバイナリ形式で共有メモリに書く（メモリ上なので圧縮はしない）
+    buffer = io.BytesIO()
+    dump_occurrences(buffer, results)
+    return share_bytes(buffer.getbuffer())
+
+def share_bytes(data: T.Any) -> SharedBuffer:
+    shm = SharedMemory(create=True, size=max(len(data), 1))
+    shm.buf[:len(data)] = data
+    shm.close()
+    return shm.name, len(data)
+
+@contextlib.contextmanager
+def attach_shared(shared: SharedBuffer) -> T.Iterator[memoryview]:
+    # 共有メモリを開き、中身の memoryview を渡す。with を抜けたら view を手放してから閉じる
+    name, size = shared
+    shm = SharedMemory(name=name)
+    view = shm.buf[:size]
+    try:
+        yield view
+    finally:
+        view.release()
+        shm.close()
+
+class SharedReader:
+    # memoryview を read() で少しずつ読む（読んだ分だけをコピーする）
+    def __init__(self, view: memoryview) -> None:
+        self.view = view
+        self.position = 0
+    
+    def read(self, size: int = -1) -> bytes:
+        end = len(self.view) if size < 0 else min(len(self.view), self.position + size)
+        data = self.view[self.position:end].tobytes()
+        self.position = end
+        return data
+
+def open_shared(view: memoryview, name: str) -> SharedReader:
+    f = SharedReader(view)
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError(f"{name} is not an intermediate buffer")
+    return f
+
+def iter_shared_records(shared: SharedBuffer) -> T.Iterator[T.Tuple[str, T.Any]]:
+    with attach_shared(shared) as view:
+        for keys, counts in read_blocks(open_shared(view, shared[0])):
+            yield from zip(keys, counts)
+
+def load_shared_sketch(shared: SharedBuffer) -> Sketch:
+    with attach_shared(shared) as view:
+        return sketch_from_bytes(view)
+
+def unlink_shared(shared: SharedBuffer) -> None:
+    try:
+        shm = SharedMemory(name=shared[0])
+    except FileNotFoundError:
+        return
+    shm.close()
+    shm.unlink()
+
+def run_local_map_task(
+    map_file: T.Any,
+) -> T.Tuple[int, T.Tuple[int, T.List[SharedBuffer]], TaskStats]:
+    # tasks.run_map_task と同じだが、パーティションごとの出力を共有メモリに置く
+    start = time.perf_counter()
+    job_id, spec, (task_id, split, num_partitions, _) = map_file
+    partitions = map_partitions(spec, split, num_partitions)
+    summary = spec[5]
+    if summary is not None and summary[0] in SKETCH_MODES:
+        sketches = [build_sketch(summary, partition) for partition in partitions]
+        buffers = [share_bytes(sketch.to_bytes()) for sketch in sketches]
+    else:
+        buffers = [save_shared(partition) for partition in partitions]
+    return job_id, (task_id, buffers), map_stats(split, partitions, start)
+
+def run_local_reduce_task(data: T.Any) -> T.Tuple[int, T.Tuple[int, str], TaskStats]:
+    start = time.perf_counter()
+    job_id, (_, _, reducer_path, output, _, summary), task = data
+    partition, buffers, reduce_mode = task
+    reducer = load_callable(reducer_path)
+    result_file = RESULT_FILENAME.format(output, partition)
+    if reduce_mode in SKETCH_MODES:
+        sketches = (load_shared_sketch(b) for b in buffers)
+        write_sketch_result(result_file, merge_sketches(summary, sketches))
+        keys = 1
+    elif reduce_mode == "topk":
+        records = merge_records((iter_shared_records(b) for b in buffers), reducer)
+        keys = write_json_stream(result_file, top_records(records, summary[1]["k"]))
+    elif reduce_mode == "external":
+        # バッファはすでにメモリ上にあるので、段階的なスピルはせず一度に k-way マージする
+        records = merge_records((iter_shared_records(b) for b in buffers), reducer)
+        keys = write_json_stream(result_file, records)
+    else:
+        results: T.Dict[str, T.Any] = {}
+        for shared in buffers:
+            with attach_shared(shared) as view:
+                reduce_blocks(read_blocks(open_shared(view, shared[0])), reducer, results)
+        write_result(results, result_file)
+        keys = len(results)
+    return job_id, (partition, result_file), reduce_stats(buffers, keys, start)
+
+class LocalExecutor:
+    def __init__(
+        self, processes: T.Optional[int] = None, metrics: Metrics = DISABLED
+    ) -> None:
+        self.processes = processes or os.cpu_count() or 1
+        self.executor: T.Optional[Executor] = None
+        self.metrics = metrics
+    
+    def __enter__(self) -> "LocalExecutor":
+        # プールのプロセスが親と同じ resource_tracker を使うよう、先に起動しておく
+        resource_tracker.ensure_running()
+        self.executor = ProcessPoolExecutor(self.processes)
+        return self
+    
+    def __exit__(self, *exc_info: T.Any) -> None:
+        self.executor.shutdown()
+    
+    def run(self, job: Job) -> T.Dict[int, str]:
+        # ジョブを 1 つ実行し、パーティション → 結果ファイル を返す
+        # 同じプールで続けて実行できるので、複数のジョブでもプロセスは起動し直さない
+        return asyncio.run(self.run_job(job))
+    
+    async def run_job(self, job: Job) -> T.Dict[int, str]:
+        scheduler = Scheduler(
+            job.input_files(),
+            split_size=job.split_size,
+            word_boundaries=job.word_splits(),
+            num_partitions=job.num_partitions,
+            merge_results=job.merge_results,
+            # 同じマシンのプロセスなので、複製を走らせてもコアを取り合うだけ
+            speculative=False,
+            reduce_mode=job.reduce_mode,
+            summary=job.summary(),
+            output=job.output,
+            # 待機中のスロットを起こして終了させる
+            on_finished=lambda: scheduler.notify_work(),
+            metrics=self.metrics,
+            job=job.name,
+        )
+        spec = job.task_spec()
+        try:
+            # プロセス数だけスロットを作り、それぞれが Worker のようにタスクを取りに行く
+            # ワーカーとしては登録しないので、リースや局所性の待ち合わせは起きない
+            await asyncio.gather(
+                *(self.run_slot(scheduler, spec) for _ in range(self.processes))
+            )
+        finally:
+            for buffers in scheduler.map_results.values():
+                for shared in buffers:
+                    unlink_shared(shared)
+        return scheduler.reduce_results
+    
+    async def run_slot(self, scheduler: Scheduler, spec: T.Any) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            command, data = scheduler.get_next_task()
+            if command == b"wait":
+                await scheduler.wait_for_work()
+            elif command == b"map":
+                # スロットの数とプールのプロセス数は同じなので、渡したタスクはすぐに始まる
+                scheduler.task_started(command, data[0])
+                _, result, stats = await loop.run_in_executor(
+                    self.executor, run_local_map_task, (0, spec, data)
+                )
+                scheduler.map_done(result, stats=stats)
+            elif command == b"reduce":
+                scheduler.task_started(command, data[0])
+                _, result, stats = await loop.run_in_executor(
+                    self.executor, run_local_reduce_task, (0, spec, data)
+                )
+                scheduler.reduce_done(result, stats=stats)
+            else:
+                return
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--processes", type=int, default=os.cpu_count(), help="プロセスプールの大きさ",
+    )
+    parser.add_argument(
+        "--jobs", help="実行するジョブの JSON ファイル（server.py --jobs と同じ形式）",
+    )
+    parser.add_argument(
+        "--trace", help="タスクとフェーズの時間を Chrome トレース形式で書き出すファイル",
+    )
+    args = parser.parse_args()
+    
+    jobs = [Job("wordcount", DEFAULT_INPUTS)]
+    if args.jobs:
+        with open(args.jobs, "r") as f:
+            jobs = [job_from_dict(spec) for spec in json.load(f)]
+    
+    metrics = Metrics() if args.trace else DISABLED
+    with LocalExecutor(args.processes, metrics) as executor:
+        for job in jobs:
+            print(f"STARTED job {job.name}")
+            executor.run(job)
+            print(f"FINISHED job {job.name}")
+    if args.trace:
+        metrics.write_trace(args.trace)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import os
+import json
+import shutil
+import hashlib
+import typing as T
+from uuid import uuid4
+from collections import Counter
+
+from splits import Split
+
+# map の出力のキャッシュ（前回から変わっていない入力は map し直さない）
+#
+# キーは分割 (path, start, end) の中身と map 関数の版から作る:
+#   "stat":    ファイルの (path, サイズ, 更新時刻) … stat だけなので速い
+#   "content": 担当範囲のバイト列のハッシュ … 更新時刻が当てにならないとき
+# どちらもジョブの mapper / combiner / version とパーティション数を含めるので、
+# 関数を変えたら（version を上げたら）別のエントリになる。
+#
+# エントリはパーティションごとの中間ファイルのコピーで、ファイル名はキーのダイジェスト。
+# index.json にエントリごとのファイル・サイズ・最後に使った順番を持ち、
+# 合計サイズが max_bytes を超えたら、使われていない古いものから消す。
+
+INDEX_FILENAME = "index.json"
+MAX_CACHE_BYTES = 1024 * 1024 * 1024  # 1GiB
+HASH_CHUNK_SIZE = 1 << 20
+KEY_MODES = ("stat", "content")
+
+class MapCache:
+    def __init__(
+        self,
+        cache_dir: str,
+        max_bytes: int = MAX_CACHE_BYTES,
+        key_mode: str = "stat",
+    ) -> None:
+        if key_mode not in KEY_MODES:
+            raise ValueError(f"Unknown cache key mode: {key_mode}")
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_bytes = max_bytes
+        self.key_mode = key_mode
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.index_file = os.path.join(self.cache_dir, INDEX_FILENAME)
+        # ダイジェスト → {"files": [...], "size": バイト数, "used": 最後に使った順番}
+        self.entries: T.Dict[str, T.Dict[str, T.Any]] = {}
+        if os.path.exists(self.index_file):
+            with open(self.index_file, "r") as f:
+                self.entries = json.load(f)
+        # 実行中のジョブが参照しているエントリ（reduce が読むので消さない）と参照数
+        self.in_use: T.Counter[str] = Counter()
+        self.clock = max((e["used"] for e in self.entries.values()), default=0)
+    
+    def key(self, split: Split, version: str, num_partitions: int) -> str:
+        path, start, end = split
+        digest = hashlib.sha256()
+        digest.update(json.dumps([version, num_partitions, start, end]).encode())
+        if self.key_mode == "content":
+            with open(path, "rb") as f:
+                f.seek(start)
+                remaining = end - start
+                while remaining > 0:
+                    chunk = f.read(min(HASH_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    remaining -= len(chunk)
+        else:
+            stat = os.stat(path)
+            identity = [os.path.abspath(path), stat.st_size, stat.st_mtime_ns]
+            digest.update(json.dumps(identity).encode())
+        return digest.hexdigest()
+    
+    def touch(self, digest: str) -> None:
+        # 最終使用の順序だけ分かればよいので、時刻ではなく単調に増える番号を使う
+        self.clock += 1
+        self.entries[digest]["used"] = self.clock
+        self.in_use[digest] += 1
+    
+    def lookup(self, digest: str) -> T.Optional[T.List[str]]:
+        entry = self.entries.get(digest)
+        if entry is None:
+            return None
+        if not all(os.path.exists(f) for f in entry["files"]):
+            # 手で消されたなどで壊れたエントリは捨てる
+            self.remove(digest)
+            return None
+        self.touch(digest)
+        return list(entry["files"])
+    
+    def store(self, digest: str, files: T.List[T.Union[str, bytes]]) -> None:
+        self.add(digest, self.copy_files(digest, files))
+    
+    def copy_files(self, digest: str, files: T.List[T.Union[str, bytes]]) -> T.List[str]:
+        # 中間ファイルをキャッシュにコピーする（同じファイルシステムならハードリンク）
+        # メッセージで届いた小さい出力（バイト列）はそのままファイルに書く
+        # ファイルを書くだけで索引には触らないので、別のスレッドで呼んでよい（key も同じ）
+        # 同じダイジェストのエントリを別のジョブが読んでいるかもしれないので、既存のファイルは消さず、
+        # 一時ファイルに書いてから os.replace で置き換える（開いている側は古い中身を最後まで読める）
+        cached = []
+        for partition, output in enumerate(files):
+            target = os.path.join(self.cache_dir, f"{digest}-{partition}.bin")
+            cached.append(target)
+            if isinstance(output, str) and os.path.exists(target):
+                if os.path.samefile(output, target):
+                    # 同じ中間ファイルがもうリンクしてある
+                    continue
+            temp_file = f"{target}.{uuid4().hex}.tmp"
+            try:
+                if isinstance(output, bytes):
+                    with open(temp_file, "wb") as f:
+                        f.write(output)
+                else:
+                    try:
+                        os.link(output, temp_file)
+                    except OSError:
+                        shutil.copyfile(output, temp_file)
+                os.replace(temp_file, target)
+            except BaseException:
+                if os.path.exists(temp_file):
+                    os.remove(temp_file)
+                raise
+        return cached
+    
+    def add(self, digest: str, cached: T.List[str]) -> None:
+        # copy_files で書いたファイルをエントリとして索引に載せる
+        size = sum(os.path.getsize(f) for f in cached)
+        self.entries[digest] = {"files": cached, "size": size, "used": 0}
+        self.touch(digest)
+        self.evict()
+        self.save()
+    
+    def remove(self, digest: str) -> None:
+        for filename in self.entries.pop(digest)["files"]:
+            if os.path.exists(filename):
+                os.remove(filename)
+        self.in_use.pop(digest, None)
+    
+    def evict(self) -> None:
+        total = sum(entry["size"] for entry in self.entries.values())
+        if total <= self.max_bytes:
+            return
+        for digest in sorted(self.entries, key=lambda d: self.entries[d]["used"]):
+            if total <= self.max_bytes:
+                break
+            if digest in self.in_use:
+                continue
+            total -= self.entries[digest]["size"]
+            print(f"Evicting cached map output {digest[:12]}")
+            self.remove(digest)
+    
+    def save(self) -> None:
+        # 途中で落ちても壊れた index.json が残らないよう、書いてから置き換える
+        temp_file = f"{self.index_file}.tmp"
+        with open(temp_file, "w") as f:
+            json.dump(self.entries, f)
+        os.replace(temp_file, self.index_file)
+    
+    def release(self, digests: T.Iterable[str]) -> None:
+        # ジョブが終わったら、そのジョブが使ったエントリも追い出せるようにする
+        self.in_use.subtract(digests)
+        self.in_use += Counter()  # 0 以下になったものを取り除く
+        self.evict()
+        self.save()
@@ -0,0 +1,112 @@
+import re
+import mmap
+import typing as T
+from collections import Counter
+
+from protocol import Occurrences
+from jobs import reads_split
+
+ENCODING = "ISO-8859-1"
+CHUNK_SIZE = 1 << 20  # 1MiB ずつ読み込む
+
+# トークナイザはモジュール読み込み時に一度だけコンパイルする
+WORD_RE = re.compile(r"\w+")
+WORD_CHAR_RE = re.compile(r"\w")
+
+# バイト列のまま数えるための表（count_split_bytes）
+# ISO-8859-1 は 1バイト = 1文字なので、str の \w と lower() をバイトごとの表に置き換えられる。
+# 単語の文字は小文字に、それ以外は空白に写す表で translate すると、
+# bytes.split()（C 実装）だけで小文字化済みの単語に分かれる。
+WORD_BYTES = bytes(b for b in range(256) if WORD_CHAR_RE.match(chr(b)))
+TOKENIZE_TABLE = bytes(
+    ord(chr(b).lower()) if b in WORD_BYTES else ord(" ") for b in range(256)
+)
+IS_WORD_BYTE = [b in WORD_BYTES for b in range(256)]
+
+# Worker.mapfn は単語ごとに [1, 1, 1, ...] のリストを作り combinefn で合計していたため、
+# 出現回数に比例してメモリを消費していた。
+# ここではファイルを固定サイズのチャンクで読みながら Counter に直接加算するので、
+# メモリ使用量は「語彙数 + チャンクサイズ」で抑えられる。
+
+def iter_chunks(filename: str, chunk_size: int = CHUNK_SIZE) -> T.Iterator[str]:
+    with open(filename, "r", encoding=ENCODING, newline="") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+def iter_split_chunks(
+    filename: str, start: int, end: int, chunk_size: int = CHUNK_SIZE
+) -> T.Iterator[str]:
+    # 自分の担当範囲 [start, end) だけを mmap 経由で読む
+    # ISO-8859-1 は 1バイト = 1文字なので、任意の位置で切ってデコードしてよい
+    if start >= end:
+        return
+    with open(filename, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for position in range(start, end, chunk_size):
+                yield mm[position:min(position + chunk_size, end)].decode(ENCODING)
+
+def split_tail(chunk: str) -> T.Tuple[str, str]:
+    # チャンク末尾で途切れている可能性のある単語を切り離す
+    # （正規表現 \w+\Z はチャンク全体を走査してしまうので、末尾から1文字ずつ戻る）
+    end = len(chunk)
+    while end > 0 and WORD_CHAR_RE.match(chunk, end - 1):
+        end -= 1
+    return chunk[:end], chunk[end:]
+
+def count_words(chunks: T.Iterable[str]) -> Occurrences:
+    counts: T.Counter[str] = Counter()
+    carry = ""
+    for chunk in chunks:
+        chunk = carry + chunk.lower()
+        # 途切れた単語は次のチャンクと連結してから数える
+        chunk, carry = split_tail(chunk)
+        # Counter.update は C 実装の集計ループを使うので、Python の for 文より速い
+        counts.update(WORD_RE.findall(chunk))
+    if carry:
+        counts[carry] += 1
+    return counts
+
+def count_file(filename: str, chunk_size: int = CHUNK_SIZE) -> Occurrences:
+    return count_words(iter_chunks(filename, chunk_size))
+
+def count_split(
+    filename: str, start: int, end: int, chunk_size: int = CHUNK_SIZE
+) -> Occurrences:
+    return count_words(iter_split_chunks(filename, start, end, chunk_size))
+
+def word_boundary(buffer: T.Any, position: int, start: int, end: int) -> int:
+    # position を単語の途中にならない位置（直前が単語の文字でない位置）までずらす
+    cut = position
+    while cut > start and IS_WORD_BYTE[buffer[cut - 1]]:
+        cut -= 1
+    if cut > start:
+        return cut
+    # チャンク全体が 1 つの単語だったので、単語の終わりまで先に進める
+    cut = position
+    while cut < end and IS_WORD_BYTE[buffer[cut]]:
+        cut += 1
+    return cut
+
+@reads_split(chunk_mapper=count_words)
+def count_split_bytes(
+    filename: str, start: int, end: int, chunk_size: int = CHUNK_SIZE
+) -> Occurrences:
+    # count_split と同じ結果を、デコードせずにバイト列のまま数える
+    # チャンクごとに translate（小文字化と区切り文字の置き換え）と split をするだけで、
+    # 行ごとの str や単語ごとの小文字のコピーは作らない。
+    # str へのデコードは最後に異なり語ごとに 1 回だけ行う。
+    raw: T.Counter[bytes] = Counter()
+    if start < end:
+        with open(filename, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                position = start
+                while position < end:
+                    cut = min(position + chunk_size, end)
+                    if cut < end:
+                        cut = word_boundary(mm, cut, position, end)
+                    raw.update(mm[position:cut].translate(TOKENIZE_TABLE).split())
+                    position = cut
+    return {word.decode(ENCODING): count for word, count in raw.items()}
@@ -0,0 +1,257 @@
+import json
+import time
+import asyncio
+import typing as T
+from collections import defaultdict
+
+# ジョブ単位のメトリクスとトレース
+#
+#   - タスクごとのスパン（ワーカーが実行し始めた時刻 → 完了、ワーカーが測った処理時間・読んだバイト数・キー数）
+#   - ワーカーごとのカウンタ（タスク数、読んだバイト数、出力したキー数）
+#   - フェーズごとの時間（map / reduce / 結果のマージ）と、タスクが割り当てを待った時間
+#   - 時間の分布（タスクの実行時間・割り当て待ちの時間）は Prometheus の summary（_sum と _count）
+#
+# Chrome トレース形式の JSON（chrome://tracing や Perfetto で開ける）に書き出すか、
+# serve() でサーバーのイベントループ上に Prometheus 形式のテキストを返すエンドポイントを立てる。
+# enabled=False のときはどのメソッドもすぐ戻るので、計測しないときのコストはほぼない。
+# ワーカー側の統計はタスクの戻り値に載せて送られてくる（tasks.py 参照）。
+
+Labels = T.Tuple[T.Tuple[str, str], ...]
+TaskKey = T.Tuple[str, bytes, int]  # (ジョブ, b"map" | b"reduce", タスクID)
+
+# Prometheus の TYPE 行（ここにない名前は counter とみなす）
+METRIC_TYPES = {
+    "mapreduce_workers_connected": "gauge",
+    "mapreduce_phase_seconds": "gauge",
+}
+# summary の型で出すもの（observe() で記録する。snapshot() では _sum / _count の 2 つになる）
+SUMMARY_SUFFIXES = ("_sum", "_count")
+
+def format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(f'{name}="{value}"' for name, value in labels)
+    return f"{{{pairs}}}"
+
+class Metrics:
+    def __init__(self, enabled: bool = True) -> None:
+        self.enabled = enabled
+        self.origin = time.monotonic()
+        self.counters: T.Dict[T.Tuple[str, Labels], float] = defaultdict(float)
+        # summary ごとの [合計, 回数]
+        self.summaries: T.Dict[T.Tuple[str, Labels], T.List[float]] = {}
+        self.events: T.List[T.Dict[str, T.Any]] = []
+        # 実行待ちになった時刻 / ワーカーごとの割り当て時刻 / フェーズの開始時刻
+        self.ready: T.Dict[TaskKey, float] = {}
+        self.started: T.Dict[TaskKey, T.Dict[T.Optional[int], float]] = {}
+        self.phases: T.Dict[T.Tuple[str, str], float] = {}
+        # Chrome トレースの pid / tid は数値なので、ジョブ名・トラック名に番号を振る
+        self.pids: T.Dict[str, int] = {}
+        self.tids: T.Dict[T.Tuple[str, str], int] = {}
+    
+    def inc(self, name: str, value: float = 1.0, **labels: T.Any) -> None:
+        if not self.enabled:
+            return
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        self.counters[(name, key)] += value
+    
+    def set(self, name: str, value: float, **labels: T.Any) -> None:
+        if not self.enabled:
+            return
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        self.counters[(name, key)] = value
+    
+    def observe(self, name: str, value: float, **labels: T.Any) -> None:
+        if not self.enabled:
+            return
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        observed = self.summaries.setdefault((name, key), [0.0, 0.0])
+        observed[0] += value
+        observed[1] += 1
+    
+    def timestamp(self, when: float) -> float:
+        # Chrome トレースの ts はマイクロ秒
+        return (when - self.origin) * 1e6
+    
+    def span(
+        self,
+        name: str,
+        category: str,
+        start: float,
+        end: float,
+        job: str,
+        track: str,
+        args: T.Optional[T.Dict[str, T.Any]] = None,
+    ) -> None:
+        # pid をジョブ、tid をワーカー（またはスケジューラ）に割り当てる
+        pid = self.pids.setdefault(job, len(self.pids) + 1)
+        tid = self.tids.setdefault((job, track), len(self.tids) + 1)
+        self.events.append({
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": self.timestamp(start),
+            "dur": (end - start) * 1e6,
+            "pid": pid,
+            "tid": tid,
+            "args": args or {},
+        })
+    
+    def worker_connected(self, worker_id: int) -> None:
+        self.inc("mapreduce_workers_connected")
+    
+    def worker_disconnected(self, worker_id: int) -> None:
+        self.inc("mapreduce_workers_connected", -1)
+    
+    def phase_started(self, job: str, phase: str) -> None:
+        if not self.enabled:
+            return
+        self.phases[(job, phase)] = time.monotonic()
+    
+    def phase_finished(self, job: str, phase: str) -> None:
+        if not self.enabled:
+            return
+        start = self.phases.pop((job, phase), None)
+        if start is None:
+            return
+        end = time.monotonic()
+        self.span(phase, "phase", start, end, job, "scheduler")
+        self.set("mapreduce_phase_seconds", end - start, job=job, phase=phase)
+    
+    def task_ready(self, job: str, kind: bytes, task_id: int) -> None:
+        # タスクが割り当て可能になった（ジョブ開始・reduce 開始・再実行待ち）
+        if not self.enabled:
+            return
+        self.ready.setdefault((job, kind, task_id), time.monotonic())
+    
+    def task_assigned(self, job: str, kind: bytes, task_id: int) -> None:
+        # 割り当て可能になってからワーカーに渡すまでの時間
+        if not self.enabled:
+            return
+        ready = self.ready.pop((job, kind, task_id), None)
+        if ready is not None:
+            wait = time.monotonic() - ready
+            self.observe("mapreduce_queue_wait_seconds", wait, kind=kind.decode())
+    
+    def task_started(
+        self, job: str, kind: bytes, task_id: int, worker_id: T.Optional[int]
+    ) -> None:
+        # ワーカーが実際に実行し始めた（b"taskstarted"）。窓で待っていた時間はスパンに含めない
+        if not self.enabled:
+            return
+        self.started.setdefault((job, kind, task_id), {})[worker_id] = time.monotonic()
+    
+    def task_finished(
+        self,
+        job: str,
+        kind: bytes,
+        task_id: int,
+        worker_id: T.Optional[int],
+        stats: T.Optional[T.Dict[str, T.Any]] = None,
+    ) -> None:
+        if not self.enabled:
+            return
+        attempts = self.started.pop((job, kind, task_id), {})
+        start = attempts.get(worker_id)
+        if start is None:
+            return
+        end = time.monotonic()
+        stats = stats or {}
+        name = kind.decode()
+        worker = "local" if worker_id is None else worker_id
+        # ローカル実行（local_executor.py）ではプールのプロセスごとに行を分ける
+        track = f"worker {worker}"
+        if worker_id is None and "pid" in stats:
+            track = f"pid {stats['pid']}"
+        self.span(
+            f"{name} {task_id}", name, start, end, job, track,
+            dict(stats, attempts=len(attempts)),
+        )
+        self.inc("mapreduce_tasks_completed_total", job=job, kind=name)
+        self.observe("mapreduce_task_seconds", end - start, kind=name)
+        self.inc("mapreduce_worker_tasks_total", worker=worker, kind=name)
+        for stat in ("bytes_read", "keys_emitted", "seconds"):
+            if stat in stats:
+                metric = f"mapreduce_worker_{stat}_total"
+                self.inc(metric, stats[stat], worker=worker, kind=name)
+    
+    def task_retried(self, job: str, kind: bytes, task_id: int) -> None:
+        self.inc("mapreduce_task_retries_total", job=job, kind=kind.decode())
+        self.task_ready(job, kind, task_id)
+    
+    def task_speculated(self, job: str, task_id: int) -> None:
+        self.inc("mapreduce_speculative_tasks_total", job=job)
+    
+    def chrome_trace(self) -> T.Dict[str, T.Any]:
+        # ジョブ名・ワーカー名はメタデータイベントで pid / tid に付ける
+        names = [
+            {"name": "process_name", "ph": "M", "pid": pid, "args": {"name": job}}
+            for job, pid in self.pids.items()
+        ]
+        names += [
+            {
+                "name": "thread_name", "ph": "M", "pid": self.pids[job], "tid": tid,
+                "args": {"name": track},
+            }
+            for (job, track), tid in self.tids.items()
+        ]
+        return {
+            "traceEvents": names + self.events,
+            "displayTimeUnit": "ms",
+            "otherData": {"counters": self.snapshot()},
+        }
+    
+    def snapshot(self) -> T.Dict[str, float]:
+        values = {
+            f"{name}{format_labels(labels)}": value
+            for (name, labels), value in sorted(self.counters.items())
+        }
+        for (name, labels), observed in sorted(self.summaries.items()):
+            for suffix, value in zip(SUMMARY_SUFFIXES, observed):
+                values[f"{name}{suffix}{format_labels(labels)}"] = value
+        return values
+    
+    def write_trace(self, filename: str) -> None:
+        with open(filename, "w") as f:
+            json.dump(self.chrome_trace(), f)
+    
+    def prometheus_text(self) -> str:
+        lines: T.List[str] = []
+        current = None
+        for (name, labels), value in sorted(self.counters.items()):
+            if name != current:
+                lines.append(f"# TYPE {name} {METRIC_TYPES.get(name, 'counter')}")
+                current = name
+            lines.append(f"{name}{format_labels(labels)} {value}")
+        current = None
+        for (name, labels), observed in sorted(self.summaries.items()):
+            if name != current:
+                lines.append(f"# TYPE {name} summary")
+                current = name
+            for suffix, value in zip(SUMMARY_SUFFIXES, observed):
+                lines.append(f"{name}{suffix}{format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+    
+    async def handle_scrape(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        # リクエストの中身は見ずに、ヘッダーを読み切ったら現在の値を返す
+        try:
+            while (await reader.readline()).strip():
+                pass
+            body = self.prometheus_text().encode("utf-8")
+            writer.write(
+                b"HTTP/1.0 200 OK\r\n"
+                b"Content-Type: text/plain; version=0.0.4\r\n"
+                b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body
+            )
+            await writer.drain()
+        finally:
+            writer.close()
+    
+    async def serve(self, host: str, port: int) -> asyncio.AbstractServer:
+        # Prometheus がスクレイプする HTTP エンドポイント（サーバーと同じイベントループで動く）
+        return await asyncio.start_server(self.handle_scrape, host, port)
+
+# 計測しないときに使う共有インスタンス
+DISABLED = Metrics(enabled=False)
@@ -0,0 +1,49 @@
+import os
+import zlib
+import typing as T
+
+from protocol import Occurrences
+
+# map の出力をキーのハッシュで R 個のパーティションに分け、
+# パーティションごとに独立した reduce タスクを作る。
+# 組み込みの hash() はプロセスごとにランダム化されるため、
+# ワーカー間で結果が一致する crc32 を使う。
+
+NUM_PARTITIONS = 4
+COPY_CHUNK = 1024 * 1024  # 結果をまとめるときに一度に写す量
+
+def partition_of(key: str, num_partitions: int) -> int:
+    return zlib.crc32(key.encode("utf-8")) % num_partitions
+
+def partition_results(
+    results: Occurrences, num_partitions: int
+) -> T.List[Occurrences]:
+    partitions: T.List[Occurrences] = [{} for _ in range(num_partitions)]
+    for key, count in results.items():
+        partitions[partition_of(key, num_partitions)][key] = count
+    return partitions
+
+def merge_result_files(result_files: T.Iterable[str], merged_file: str) -> None:
+    # パーティション同士はキーが重ならないので、各ファイルの "{" と "}" の内側を順に書き足すだけでよい
+    # 中身は解釈せずに COPY_CHUNK ずつ写すので、external モードの大きな結果でもメモリは一定
+    with open(merged_file, "wb") as out:
+        out.write(b"{")
+        separator = b""
+        for filename in result_files:
+            size = os.path.getsize(filename)
+            with open(filename, "rb") as f:
+                if f.read(1) != b"{" or size < 2:
+                    raise ValueError(f"{filename} is not a JSON object")
+                remaining = size - 2
+                if remaining:
+                    out.write(separator)
+                    separator = b", "
+                while remaining:
+                    chunk = f.read(min(COPY_CHUNK, remaining))
+                    if not chunk:
+                        raise ValueError(f"{filename} was truncated")
+                    out.write(chunk)
+                    remaining -= len(chunk)
+                if f.read(1) != b"}":
+                    raise ValueError(f"{filename} is not a JSON object")
+        out.write(b"}")
@@ -0,0 +1,183 @@
+import struct
+import pickle
+import asyncio
+import typing as T
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None  # type: ignore[assignment]
+
+try:
+    import uvloop
+except ImportError:  # --loop uvloop を指定したときだけ必要
+    uvloop = None
+# サーバー・ワーカー・submit.py が共有する通信の層
+#
+# 1つのコマンドを 1 フレームで送る:
+#   4バイト（ビッグエンディアン）のペイロード長 + pickle((command, data))
+# pickle は最新のプロトコル（C 実装）を使う。サーバーとワーカーは同じコードを動かす前提で、
+# 信頼できないピアとの通信には使わない。
+#
+# 受信したフレームを処理している間（data_received の中）に送ったコマンドはすぐには書かず、
+# 処理し終えてから 1 回の write でまとめて送る（mapdone への応答で次のタスクを送る、など）。
+# それ以外（タイマーや別スレッド・別プロセスの完了通知から）の送信はその場で書く。
+#
+# 送信バッファが溜まると asyncio が pause_writing を呼ぶので、writing_paused を立てる。
+# 送る側はこれを見て新しいコマンドを作るのを控え（サーバーのタスク割り当てなど）、
+# resume_writing で writing_resumed() が呼ばれたら再開する。コルーチンからは drain() で待てる。
+#
+# 数千台のワーカーをつなぐときは、標準の asyncio の代わりに uvloop（libuv ベースの互換イベントループ）を
+# 選べる（new_event_loop）。ワーカー 1 台につきソケットを 1 つ使うので、開けるファイル数の上限も上げておく。
+
+HOST = "127.0.0.1"
+PORT = 8888
+
+FRAME_HEADER = struct.Struct("!I")
+MAX_FRAME_SIZE = 1 << 30  # これより大きい長さは壊れたストリームとみなす
+MAX_BATCH_BYTES = 256 * 1024  # まとめている途中でもこの大きさを超えたら書き出す
+PICKLE_PROTOCOL = pickle.HIGHEST_PROTOCOL
+BACKLOG = 4096  # 多数のワーカーが一度に接続してきても取りこぼさないよう、listen の待ち行列を長くする
+LOOPS = ("asyncio", "uvloop")
+
+Occurrences = T.Dict[str, int]
+# 完了したタスクの (タスクID, 結果)。map なら出力の一覧、reduce なら結果ファイル
+FileWithId = T.Tuple[int, T.Any]
+
+def new_event_loop(name: str = "asyncio") -> asyncio.AbstractEventLoop:
+    # name のイベントループを作り、このスレッドの現在のループにする
+    if name == "uvloop":
+        if uvloop is None:
+            raise RuntimeError("--loop uvloop requires the uvloop package")
+        loop = uvloop.new_event_loop()
+    elif name == "asyncio":
+        loop = asyncio.new_event_loop()
+    else:
+        raise ValueError(f"Unknown event loop: {name}")
+    asyncio.set_event_loop(loop)
+    return loop
+
+def raise_open_file_limit() -> int:
+    # 開けるファイル数のソフトリミットをハードリミットまで上げ、上げた後の値を返す
+    if resource is None:
+        return 0
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+            soft = hard
+        except (ValueError, OSError):
+            pass
+    return soft
+
+class Protocol(asyncio.Protocol):
+    # まとめて書くかどうか（bench_protocol.py で比べるときに切り替える）
+    batch_writes = True
+    
+    def __init__(self) -> None:
+        super().__init__()
+        self.transport: T.Optional[asyncio.Transport] = None
+        self.buffer = bytearray()
+        # 送信待ちのフレームと、その合計バイト数
+        self.outgoing: T.List[bytes] = []
+        self.outgoing_bytes = 0
+        self.corked = 0  # data_received の中にいる間は 1 以上
+        self.writing_paused = False
+        self.drain_waiters: T.List[asyncio.Future] = []
+    
+    def connection_made(self, transport: asyncio.Transport) -> None:
+        self.transport = transport
+    
+    def data_received(self, data: bytes) -> None:
+        self.buffer += data
+        try:
+            frames, offset = self.parse_frames()
+        except ValueError as e:
+            print(f"{e}; closing the connection")
+            self.transport.abort()
+            return
+        del self.buffer[:offset]
+        # 受け取ったコマンドへの応答はまとめて 1 回で書く
+        self.corked += 1
+        try:
+            for command, payload in frames:
+                self.process_command(command, payload)
+        finally:
+            self.corked -= 1
+            if not self.corked:
+                self.flush()
+    
+    def parse_frames(self) -> T.Tuple[T.List[T.Tuple[bytes, T.Any]], int]:
+        # 揃っているフレームを全部デコードし、(コマンドの列, 読み終えた位置) を返す
+        frames = []
+        offset = 0
+        with memoryview(self.buffer) as view:
+            while len(view) - offset >= FRAME_HEADER.size:
+                (size,) = FRAME_HEADER.unpack_from(view, offset)
+                if size > MAX_FRAME_SIZE:
+                    raise ValueError(f"Invalid frame of {size} bytes")
+                end = offset + FRAME_HEADER.size + size
+                if len(view) < end:
+                    break
+                frames.append(pickle.loads(view[offset + FRAME_HEADER.size:end]))
+                offset = end
+        return frames, offset
+    
+    def send_command(self, command: bytes, data: T.Any = None) -> None:
+        payload = pickle.dumps((command, data), PICKLE_PROTOCOL)
+        self.outgoing.append(FRAME_HEADER.pack(len(payload)))
+        self.outgoing.append(payload)
+        self.outgoing_bytes += FRAME_HEADER.size + len(payload)
+        if (
+            not self.corked or not self.batch_writes
+            or self.outgoing_bytes >= MAX_BATCH_BYTES
+        ):
+            self.flush()
+    
+    def flush(self) -> None:
+        if not self.outgoing:
+            return
+        frames = self.outgoing
+        self.outgoing = []
+        self.outgoing_bytes = 0
+        if self.transport is None or self.transport.is_closing():
+            return
+        self.transport.write(b"".join(frames))
+    
+    def close(self) -> None:
+        # まとめている途中のフレームを書いてから閉じる
+        self.flush()
+        self.transport.close()
+    
+    def pause_writing(self) -> None:
+        self.writing_paused = True
+    
+    def resume_writing(self) -> None:
+        self.writing_paused = False
+        waiters = self.drain_waiters
+        self.drain_waiters = []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        # 再開して送るコマンドもまとめて書く
+        self.corked += 1
+        try:
+            self.writing_resumed()
+        finally:
+            self.corked -= 1
+            if not self.corked:
+                self.flush()
+    
+    def writing_resumed(self) -> None:
+        # 送信バッファが空いた。止めていた送信を再開するときに上書きする
+        pass
+    
+    async def drain(self) -> None:
+        if not self.writing_paused or self.transport.is_closing():
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self.drain_waiters.append(waiter)
+        await waiter
+    
+    def process_command(self, command: bytes, data: T.Any = None) -> None:
+        raise NotImplementedError
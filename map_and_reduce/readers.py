@@ -0,0 +1,262 @@
+import bz2
+import gzip
+import json
+import mmap
+import zlib
+import struct
+import typing as T
+
+from splits import SPLIT_SIZE, Split, split_file
+
+try:
+    import zstandard
+except ImportError:  # .zst を読むときだけ必要
+    zstandard = None
+
+# map の入力を読む層
+#
+# 圧縮はファイル先頭のマジックバイトで判別し、チャンクずつ伸長しながら読む（全体を展開しない）。
+#   なし:  そのまま mmap で読む。改行位置で分割できる（splits.py）
+#   gzip / bz2 / zstd: 途中から読めないので 1 ファイル = 1 分割
+#   BGZF:  64KiB 以下の gzip メンバーを連結した形式（bgzip が書く、gzip としても読める）。
+#          ブロックの先頭から独立に伸長できるので、ブロック境界で分割する
+# field を指定すると、各行を JSON として読み、そのフィールドの値だけを map に渡す（JSON Lines）。
+# map に渡すのはどの形式でも str のチャンク（テキストは ISO-8859-1 でデコード）。
+
+ENCODING = "ISO-8859-1"
+CHUNK_SIZE = 1 << 20
+
+GZIP_MAGIC = b"\x1f\x8b"
+BZ2_MAGIC = b"BZh"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+# BGZF のブロックヘッダー（固定部 12 バイト + 追加フィールド）
+BGZF_HEADER = struct.Struct("<4BIBBH")
+BGZF_MAX_INPUT = 0xFF00  # 1ブロックに入れる非圧縮データの上限（bgzip と同じ）
+BGZF_EOF = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+
+def detect_compression(path: str) -> T.Optional[str]:
+    with open(path, "rb") as f:
+        head = f.read(BGZF_HEADER.size + 6)
+    if head.startswith(GZIP_MAGIC):
+        return "bgzf" if is_bgzf_header(head) else "gzip"
+    if head.startswith(BZ2_MAGIC):
+        return "bz2"
+    if head.startswith(ZSTD_MAGIC):
+        return "zstd"
+    return None
+
+def is_bgzf_header(head: bytes) -> bool:
+    # FEXTRA フラグが立っていて、最初の追加フィールドが "BC"（ブロックサイズ）
+    if len(head) < BGZF_HEADER.size + 6:
+        return False
+    flags = head[3]
+    return bool(flags & 4) and head[12:14] == b"BC"
+
+def read_bgzf_block(f: T.BinaryIO) -> T.Optional[bytes]:
+    # 次のブロックを伸長して返す（ファイル末尾なら None）
+    header = f.read(BGZF_HEADER.size)
+    if len(header) < BGZF_HEADER.size:
+        return None
+    extra_length = BGZF_HEADER.unpack(header)[-1]
+    extra = f.read(extra_length)
+    block_size = bgzf_block_size(extra)
+    rest = f.read(block_size - BGZF_HEADER.size - extra_length)
+    # 1ブロックは完結した gzip メンバーなので、単独で伸長できる
+    return zlib.decompress(header + extra + rest, 31)
+
+def bgzf_block_size(extra: bytes) -> int:
+    position = 0
+    while position + 4 <= len(extra):
+        tag, length = extra[position:position + 2], extra[position + 2]
+        if tag == b"BC":
+            return struct.unpack_from("<H", extra, position + 4)[0] + 1
+        position += 4 + length
+    raise ValueError("Not a BGZF block")
+
+def bgzf_block_offsets(path: str) -> T.List[int]:
+    # 各ブロックの先頭位置（ヘッダーだけ読んで次へ飛ぶ）
+    offsets = []
+    with open(path, "rb") as f:
+        position = 0
+        while True:
+            header = f.read(BGZF_HEADER.size)
+            if len(header) < BGZF_HEADER.size:
+                return offsets
+            offsets.append(position)
+            extra_length = BGZF_HEADER.unpack(header)[-1]
+            position += bgzf_block_size(f.read(extra_length))
+            f.seek(position)
+
+def split_bgzf(path: str, split_size: int = SPLIT_SIZE) -> T.List[Split]:
+    # 圧縮後のバイト数で split_size ごとに、ブロックの先頭で区切る
+    offsets = bgzf_block_offsets(path)
+    if not offsets:
+        return []
+    with open(path, "rb") as f:
+        f.seek(0, 2)
+        end_of_file = f.tell()
+    splits: T.List[Split] = []
+    start = 0
+    for offset in offsets:
+        if offset - start >= split_size:
+            splits.append((path, start, offset))
+            start = offset
+    splits.append((path, start, end_of_file))
+    return splits
+
+def split_input(
+    path: str, split_size: int = SPLIT_SIZE, word_boundaries: bool = False
+) -> T.List[Split]:
+    # word_boundaries は非圧縮の入力だけに効く（BGZF は常に行の規則で分ける）
+    compression = detect_compression(path)
+    if compression is None:
+        return split_file(path, split_size, word_boundaries)
+    if compression == "bgzf":
+        return split_bgzf(path, split_size)
+    # 途中から伸長できない形式は 1 ファイルを丸ごと 1 つの map タスクにする
+    with open(path, "rb") as f:
+        f.seek(0, 2)
+        return [(path, 0, f.tell())]
+
+def make_splits(
+    file_locations: T.Iterable[str], split_size: int = SPLIT_SIZE, word_boundaries: bool = False
+) -> T.List[Split]:
+    splits: T.List[Split] = []
+    for path in file_locations:
+        splits.extend(split_input(path, split_size, word_boundaries))
+    return splits
+
+def iter_plain_bytes(path: str, start: int, end: int) -> T.Iterator[bytes]:
+    if start >= end:
+        return
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for position in range(start, end, CHUNK_SIZE):
+                yield mm[position:min(position + CHUNK_SIZE, end)]
+
+def iter_stream_bytes(path: str, compression: str) -> T.Iterator[bytes]:
+    if compression == "zstd":
+        if zstandard is None:
+            raise RuntimeError(f"Reading {path} requires the zstandard package")
+        f = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+    else:
+        f = (gzip.open if compression == "gzip" else bz2.open)(path, "rb")
+    with f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+def iter_bgzf_bytes(path: str, start: int, end: int) -> T.Iterator[bytes]:
+    # Hadoop の分割と同じ規則で行を割り当てる
+    # 先頭の分割以外は最初の改行までを必ず前の分割に任せ（行の先頭から始まっていても飛ばす）、
+    # end を越えたら end のブロックの最初の改行までを読む。
+    # 読みかけの行の続きだけでなく、end のブロックの先頭から始まる行もこの分割が読む
+    # （次の分割はその行を飛ばすので、ここで読まないとどちらの分割からも抜け落ちる）
+    skip_head = start > 0
+    with open(path, "rb") as f:
+        f.seek(start)
+        while True:
+            block_start = f.tell()
+            data = read_bgzf_block(f)
+            if data is None:
+                return
+            if block_start >= end:
+                if skip_head:
+                    # 分割の中に行の先頭がなかった
+                    return
+                newline = data.find(b"\n")
+                if newline >= 0:
+                    yield data[:newline + 1]
+                    return
+                yield data
+                continue
+            if skip_head:
+                newline = data.find(b"\n")
+                if newline < 0:
+                    continue
+                data = data[newline + 1:]
+                skip_head = False
+            if data:
+                yield data
+
+def iter_split_bytes(split: Split) -> T.Iterator[bytes]:
+    path, start, end = split
+    compression = detect_compression(path)
+    if compression is None:
+        return iter_plain_bytes(path, start, end)
+    if compression == "bgzf":
+        return iter_bgzf_bytes(path, start, end)
+    return iter_stream_bytes(path, compression)
+
+def iter_lines_bytes(chunks: T.Iterable[bytes]) -> T.Iterator[bytes]:
+    carry = b""
+    for chunk in chunks:
+        lines = (carry + chunk).split(b"\n")
+        carry = lines.pop()
+        yield from lines
+    if carry:
+        yield carry
+
+def select_field(record: T.Any, field: str) -> T.Any:
+    # "a.b" のようにドットで入れ子のフィールドをたどる
+    for name in field.split("."):
+        if not isinstance(record, dict) or name not in record:
+            return None
+        record = record[name]
+    return record
+
+def iter_field_chunks(chunks: T.Iterable[bytes], field: str) -> T.Iterator[str]:
+    # 1行1レコードの JSON から field の値だけを取り出し、改行区切りのチャンクにまとめる
+    values: T.List[str] = []
+    size = 0
+    for line in iter_lines_bytes(chunks):
+        if not line.strip():
+            continue
+        value = select_field(json.loads(line), field)
+        if value is None:
+            continue
+        if not isinstance(value, str):
+            value = json.dumps(value)
+        values.append(value)
+        size += len(value) + 1
+        if size >= CHUNK_SIZE:
+            yield "\n".join(values) + "\n"
+            values = []
+            size = 0
+    if values:
+        yield "\n".join(values) + "\n"
+
+def is_plain_split(split: Split, field: T.Optional[str]) -> bool:
+    # mapper が自分でファイルを mmap して読める（圧縮も JSON もない）か
+    return field is None and detect_compression(split[0]) is None
+
+def iter_input_chunks(split: Split, field: T.Optional[str] = None) -> T.Iterator[str]:
+    chunks = iter_split_bytes(split)
+    if field is not None:
+        return iter_field_chunks(chunks, field)
+    return (chunk.decode(ENCODING) for chunk in chunks)
+
+def write_bgzf(path: str, chunks: T.Iterable[bytes], level: int = 6) -> None:
+    # BGZF 形式で書き出す（bgzip コマンドがない環境での変換やベンチマーク用）
+    with open(path, "wb") as f:
+        pending = b""
+        for chunk in chunks:
+            pending += chunk
+            while len(pending) >= BGZF_MAX_INPUT:
+                f.write(encode_bgzf_block(pending[:BGZF_MAX_INPUT], level))
+                pending = pending[BGZF_MAX_INPUT:]
+        if pending:
+            f.write(encode_bgzf_block(pending, level))
+        f.write(BGZF_EOF)
+
+def encode_bgzf_block(data: bytes, level: int) -> bytes:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    body = compressor.compress(data) + compressor.flush()
+    trailer = struct.pack("<II", zlib.crc32(data), len(data))
+    block_size = BGZF_HEADER.size + 6 + len(body) + len(trailer)
+    header = BGZF_HEADER.pack(0x1F, 0x8B, 8, 4, 0, 0, 0xFF, 6)
+    extra = b"BC" + struct.pack("<HH", 2, block_size - 1)
+    return header + extra + body + trailer
@@ -1,55 +1,720 @@
+import os
+import time
 import asyncio
+import statistics
 from enum import Enum
 import typing as T
+from collections import OrderedDict, deque
 
 from protocol import FileWithId
+from splits import SPLIT_SIZE, Split
+from readers import make_splits
+from partition import NUM_PARTITIONS, merge_result_files
+from metrics import DISABLED, Metrics
+from map_cache import MapCache
+from intermediate import MapOutput
+from summaries import Summary, merge_summary_files
+from tasks import INLINE_MAP_OUTPUT_BYTES
+
+MERGED_RESULT_FILENAME = "{}.json"  # 出力名（jobs.Job.output）
+
+# 投機的実行: map フェーズの終盤、予想より大幅に遅いタスクの複製を空いているワーカーに渡す
+SPECULATIVE_SLOWDOWN = 1.5  # 予想時間の何倍かかっていたら遅いとみなすか
+SPECULATIVE_MIN_ELAPSED = 1.0  # 短いタスクは複製しない（秒）
+MAX_MAP_ATTEMPTS = 2  # 1タスクあたりの最大同時実行数
+STRAGGLER_CHECK_INTERVAL = 0.5  # 待機中のワーカーがいるときに遅いタスクを探す間隔（秒）
+# 実行中の全タスクを見て回るのは、この間隔に 1 回まで（ワーカーが数千台でも割り当てのたびには走査しない）
+
+# 障害対策: ワーカーはハートビートでリース（担当タスクの保持期限）を更新する
+# 接続が切れるか期限が切れたら、そのワーカーのタスクを再実行待ちに戻す
+LEASE_TIMEOUT = 30.0  # ハートビートが途絶えてから見切るまでの時間（秒）
+LEASE_CHECK_INTERVAL = 1.0
+# タスクが例外で終わったら（ワーカーから b"taskfailed"）、失敗したワーカー以外で再実行する
+# 同じタスクがこの回数失敗したら、入力か関数が悪いとみなしてジョブを失敗にする
+MAX_TASK_FAILURES = 4
+
+# 局所性を考慮したスケジューリング（遅延スケジューリング）
+# ワーカーは接続時に手元のデータディレクトリを知らせてくる。
+# 手元にないデータのタスクしか残っていなければ、他のワーカーに譲るため最大 LOCALITY_DELAY 秒待たせ、
+# それでも局所的なタスクが回ってこなければ何でも渡す。
+LOCALITY_DELAY = 3.0
+
+# 小さな map の出力はファイルではなくバイト列のまま mapdone で届き、reduce まで map_results に持つ
+# ジョブごとにその合計がこれを超えたら、以降の map にはファイルに書かせる（インラインの上限 0 で渡す）
+# 実行中の map の分だけは超え得る（ワーカー数 × 窓 × パーティション数 × INLINE_MAP_OUTPUT_BYTES まで）
+# reduce が終わったパーティションのバイト列は手放す
+MAX_INLINE_BYTES = 64 * 1024 * 1024
+
+# map 完了時にワーカーから届く (タスクID, パーティションごとの中間ファイル)
+MapResult = T.Tuple[int, T.List[MapOutput]]
 
 class State(Enum):
     START = 0
     MAPPING = 1
     REDUCING = 2
     FINISHED = 3
+    FAILED = 4
 
 class Scheduler:
-    def __init__(self, file_locations: T.List[str]) -> None:
+    def __init__(
+        self,
+        file_locations: T.List[str],
+        split_size: int = SPLIT_SIZE,
+        num_partitions: int = NUM_PARTITIONS,
+        merge_results: bool = False,
+        speculative: bool = True,
+        reduce_mode: str = "memory",
+        summary: T.Optional[Summary] = None,
+        locality_delay: float = LOCALITY_DELAY,
+        output: str = "result",
+        on_finished: T.Optional[T.Callable[[], None]] = None,
+        metrics: Metrics = DISABLED,
+        job: str = "default",
+        cache: T.Optional[MapCache] = None,
+        cache_version: str = "",
+        splits: T.Optional[T.List[Split]] = None,
+        word_boundaries: bool = False,
+    ) -> None:
         self.state = State.START
-        self.data_len = len(file_locations)
-        self.file_locations: T.Iterator = iter(enumerate(file_locations))
-        self.working_maps: T.Dict[str, str] = {}
-        self.map_results: T.Dict[str, str] = {}
+        # タスクのスパンやフェーズの時間を記録する（metrics.py 参照）。job はラベルに使う名前
+        self.metrics = metrics
+        self.job = job
+        # 大きなファイルはバイト範囲ごとの map タスクに分割する
+        # 分割は入力を読むので、JobManager はイベントループの外で作ってから渡す
+        if splits is None:
+            splits = make_splits(file_locations, split_size, word_boundaries)
+        self.data_len = len(splits)
+        # 未割り当ての map タスクをファイルごとにまとめておく（局所性で選べるように）
+        # 割り当て・完了・再実行のどれも辞書と deque の O(1) の操作で済むようにしている
+        self.file_locations: T.Dict[str, T.Deque[int]] = {}
+        self.splits: T.Dict[int, T.Any] = {}
+        self.working_maps: T.Dict[int, T.Any] = {}
+        self.map_results: T.Dict[int, T.List[MapOutput]] = {}
+        # map_results のうちバイト列で持っている分の合計
+        self.inline_bytes = 0
+        # 前回と同じ入力・同じ map 関数（cache_version）の分割は、キャッシュの出力を使い map しない
+        # キーを求めるには入力を読む（"content" なら全体のハッシュを取る）ので、map フェーズが始まったら
+        # イベントループの外で求め（load_cache）、求まるまでワーカーには map を配らず待たせる
+        self.cache = cache
+        self.cache_version = cache_version
+        self.cache_loaded = cache is None
+        self.cache_keys: T.Dict[int, str] = {}
+        # このジョブが参照しているキャッシュのエントリ（終わったら手放す）
+        self.cache_held: T.List[str] = []
+        for task_id, split in enumerate(splits):
+            self.splits[task_id] = split
+            self.file_locations.setdefault(split[0], deque()).append(task_id)
+            metrics.task_ready(job, b"map", task_id)
+        # 実行中タスクのワーカーごとの開始時刻と試行回数、完了したタスクのスループット（バイト/秒）
+        # 開始時刻はワーカーが実際に実行し始めた時刻（b"taskstarted"）。窓で待っている間は数えない
+        self.speculative = speculative
+        self.map_started: T.Dict[int, T.Dict[T.Optional[int], float]] = {}
+        self.map_attempts: T.Dict[int, int] = {}
+        self.map_throughputs: T.List[float] = []
+        self.straggler_check: T.Optional[asyncio.TimerHandle] = None
+        # 前回の走査で見つけた遅いタスク（遅い順に後ろから取り出す）と、次に走査してよい時刻
+        self.stragglers: T.List[int] = []
+        self.straggler_scan_due = 0.0
+        # map の出力は num_partitions 個に分かれ、パーティションごとに reduce する
+        self.num_partitions = num_partitions
+        self.merge_results = merge_results
+        self.output = output
+        # 全 reduce が終わったときに呼ぶ。None ならイベントループを止める
+        self.on_finished = on_finished
+        # "memory": 辞書で集計 / "external": ソート済み中間ファイルの k-way マージ
+        # 要約モード（summaries.py）では、結果のマージも要約同士のマージになる
+        self.reduce_mode = reduce_mode
+        self.summary = summary
+        self.partitions: T.Iterator[int] = iter(range(num_partitions))
+        self.working_reduces: T.Set[int] = set()
+        self.reduce_results: T.Dict[int, str] = {}
+        # 今すぐ渡せるタスクがないワーカーは切断せず、Future で待たせておく
+        self.idle_workers: T.List[asyncio.Future] = []
+        # ワーカーID → リース期限 / 見切ったときに接続を切るコールバック / 担当タスク
+        # タスク ((b"map" | b"reduce"), ID) → 実行中のワーカー（投機的実行では複数）
+        # リースは期限の早い順に並べておき（更新したら末尾に移す）、期限切れを先頭から探す
+        self.next_worker_id = 0
+        self.leases: "OrderedDict[int, float]" = OrderedDict()
+        self.lost_callbacks: T.Dict[int, T.Callable[[], None]] = {}
+        self.assignments: T.Dict[int, T.Set[T.Tuple[bytes, int]]] = {}
+        self.owners: T.Dict[T.Tuple[bytes, int], T.Set[int]] = {}
+        self.retry_maps: T.Deque[int] = deque()
+        self.retry_reduces: T.Deque[int] = deque()
+        # タスク → 失敗したワーカー（失敗の回数と、再実行を避けるワーカー）
+        self.failed_workers: T.Dict[T.Tuple[bytes, int], T.List[T.Optional[int]]] = {}
+        # ジョブが失敗した理由（失敗していなければ None）
+        self.error: T.Optional[str] = None
+        self.lease_check: T.Optional[asyncio.TimerHandle] = None
+        # 入力ファイル → そのファイルをローカルディスクに持つワーカー（とその逆引き）
+        self.locality_delay = locality_delay
+        self.local_workers: T.Dict[str, T.Set[int]] = {}
+        self.worker_paths: T.Dict[int, T.List[str]] = {}
+        self.locality_waits: T.Dict[int, float] = {}
+        self.locality_timers: T.Dict[int, asyncio.TimerHandle] = {}
+        # 未割り当てのタスクが残っていそうなファイル: ワーカーごとの手元のファイル / 誰の手元にもないファイル
+        # 順序付きの集合として辞書を使い、もう残っていないものは取り出すときに捨てる
+        self.local_files: T.Dict[int, T.Dict[str, None]] = {}
+        self.remote_files: T.Dict[str, None] = dict.fromkeys(self.file_locations)
+        self.real_paths: T.Optional[T.Dict[str, str]] = None
+        # 中間ファイルを書いたワーカーのうち、まだつながっているもの
+        self.producers: T.Set[int] = set()
     
-    def get_next_task(self) -> T.Tuple[bytes, T.Any]:
+    def get_next_task(self, worker_id: T.Optional[int] = None) -> T.Tuple[bytes, T.Any]:
         # dataとcommandを返す
         if self.state == State.START:
             print("STARTED")
             self.state = State.MAPPING
+            self.metrics.phase_started(self.job, "map")
+            self.load_cache()
         
         if self.state == State.MAPPING:
-            try:
-                map_item = next(self.file_locations)
-                self.working_maps[map_item[0]] = map_item[1]
-                return b"map", map_item
-            except StopIteration:
-                if len(self.working_maps) > 0:
-                    return b"disconnect", None
-                self.state = State.REDUCING
+            if not self.cache_loaded:
+                # キャッシュのキーを求めている間は、どのタスクを map するかが決まらない
+                return b"wait", None
+            task_id = self.next_map_task(worker_id)
+            if task_id is not None:
+                self.assign(worker_id, b"map", task_id)
+                split = self.working_maps[task_id]
+                inline_limit = INLINE_MAP_OUTPUT_BYTES
+                if self.inline_bytes >= MAX_INLINE_BYTES:
+                    inline_limit = 0
+                return b"map", (task_id, split, self.num_partitions, inline_limit)
+            if self.file_locations or self.working_maps:
+                # まだ map が終わっていない。reduce が始まるまで待機させる
+                self.schedule_straggler_check()
+                return b"wait", None
+            self.state = State.REDUCING
+            self.metrics.phase_finished(self.job, "map")
+            self.metrics.phase_started(self.job, "reduce")
+            for partition in range(self.num_partitions):
+                self.metrics.task_ready(self.job, b"reduce", partition)
         
         if self.state == State.REDUCING:
-            return b"reduce", self.map_results
+            # パーティションごとに reduce タスクを配るので、接続中のワーカー全員で並列に reduce できる
+            partition = None
+            if self.holds_intermediate(worker_id) or self.locality_wait_expired(worker_id):
+                partition = self.next_reduce_task(worker_id)
+            if partition is not None:
+                self.assign(worker_id, b"reduce", partition)
+                files = self.partition_files(partition)
+                return b"reduce", (partition, files, self.reduce_mode)
+            return b"wait", None
         
-        if self.state == State.FINISHED:
-            print("FINISHED.")
-            asyncio.get_running_loop().stop()
+        if self.state in (State.FINISHED, State.FAILED):
             return b"disconnect", None
     
-    def map_done(self, data: FileWithId) -> None:
+    def load_cache(self) -> None:
+        if self.cache is None:
+            return
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(None, self.compute_cache_keys, dict(self.splits))
+        future.add_done_callback(self.apply_cache)
+    
+    def compute_cache_keys(self, splits: T.Dict[int, T.Any]) -> T.Dict[int, str]:
+        # 別のスレッドで動く。MapCache.key はファイルを読むだけで索引には触らない
+        return {
+            task_id: self.cache.key(split, self.cache_version, self.num_partitions)
+            for task_id, split in splits.items()
+        }
+    
+    def apply_cache(self, future: asyncio.Future) -> None:
+        # キャッシュに出力があるタスクを取り除いてから、待たせていたワーカーに map を配り始める
+        if future.cancelled():
+            return
+        self.cache_loaded = True
+        self.notify_work()
+        if future.exception() is not None:
+            # 入力が読めないなどの場合は、キャッシュを使わずに全部 map する
+            print(f"Could not compute cache keys: {future.exception()!r}")
+            return
+        self.cache_keys = future.result()
+        hits = 0
+        for path in list(self.file_locations):
+            remaining: T.Deque[int] = deque()
+            for task_id in self.file_locations[path]:
+                digest = self.cache_keys[task_id]
+                files = self.cache.lookup(digest)
+                if files is None:
+                    remaining.append(task_id)
+                    continue
+                self.map_results[task_id] = files
+                self.cache_held.append(digest)
+                self.metrics.inc("mapreduce_cached_maps_total", job=self.job)
+                hits += 1
+            if remaining:
+                self.file_locations[path] = remaining
+            else:
+                del self.file_locations[path]
+        print(f"CACHED {hits}/{self.data_len} map tasks")
+    
+    def store_map_output(self, task_id: int) -> None:
+        # 中間ファイルのコピー（別のファイルシステムなら中身ごと）はイベントループの外で行い、
+        # 索引への登録だけをループに戻ってから行う
+        digest = self.cache_keys.get(task_id)
+        if digest is None:
+            return
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(
+            None, self.cache.copy_files, digest, list(self.map_results[task_id])
+        )
+        future.add_done_callback(lambda f: self.map_output_stored(task_id, digest, f))
+    
+    def map_output_stored(self, task_id: int, digest: str, future: asyncio.Future) -> None:
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            # 中間ファイルがサーバーから見えない場合など。キャッシュできなくても結果は正しい
+            print(f"Could not cache map {task_id}: {future.exception()!r}")
+            return
+        self.cache.add(digest, future.result())
+        if self.state in (State.FINISHED, State.FAILED):
+            # ジョブはもう参照を手放したので、このエントリもすぐ手放す
+            self.cache.release([digest])
+        else:
+            self.cache_held.append(digest)
+    
+    def next_map_task(self, worker_id: T.Optional[int] = None) -> T.Optional[int]:
+        # 再実行待ち → 未実行 → 遅れているタスクの複製 の順に選ぶ
+        task_id = self.next_retry(self.retry_maps, self.working_maps, b"map", worker_id)
+        if task_id is not None:
+            self.map_attempts[task_id] += 1
+            return task_id
+        if self.file_locations:
+            path = self.pick_file(worker_id)
+            if path is None:
+                # 局所的なタスクが空くのを待つ
+                return None
+            task_id = self.file_locations[path].popleft()
+            if not self.file_locations[path]:
+                del self.file_locations[path]
+            self.working_maps[task_id] = self.splits[task_id]
+            self.map_attempts[task_id] = 1
+            return task_id
+        # 新しいタスクはもうないので、遅れているタスクの複製を渡す
+        # 先に届いた mapdone を採用し、後から届いたものは map_done で無視される
+        straggler = self.next_straggler(worker_id)
+        if straggler is not None:
+            self.map_attempts[straggler] += 1
+            self.metrics.task_speculated(self.job, straggler)
+            print(f"SPECULATING map {straggler}")
+        return straggler
+    
+    def pick_file(self, worker_id: T.Optional[int]) -> T.Optional[str]:
+        # 1. このワーカーの手元にあるファイル
+        # 2. 誰の手元にもないファイル（どのワーカーが読んでも同じ）
+        # 3. 他のワーカーの手元にあるファイル（LOCALITY_DELAY 秒待っても局所的なタスクがない場合）
+        local = self.local_files.get(worker_id)
+        while local:
+            path = next(iter(local))
+            if path in self.file_locations:
+                self.locality_waits.pop(worker_id, None)
+                return path
+            del local[path]
+        while self.remote_files:
+            path = next(iter(self.remote_files))
+            if path in self.file_locations and not self.local_workers.get(path):
+                return path
+            # 割り当て済みか、後から手元に持つワーカーが現れた（失えば worker_lost で戻す）
+            del self.remote_files[path]
+        if self.locality_wait_expired(worker_id):
+            return next(iter(self.file_locations))
+        return None
+    
+    def locality_wait_expired(self, worker_id: T.Optional[int]) -> bool:
+        # 局所的なタスクを待ち始めてから locality_delay 秒経ったか
+        if worker_id not in self.leases or self.locality_delay <= 0:
+            return True
+        now = time.monotonic()
+        started = self.locality_waits.setdefault(worker_id, now)
+        remaining = started + self.locality_delay - now
+        if remaining <= 0:
+            del self.locality_waits[worker_id]
+            return True
+        # 待ち時間が過ぎたら起こして、局所的でないタスクを渡す
+        if worker_id not in self.locality_timers:
+            loop = asyncio.get_running_loop()
+            self.locality_timers[worker_id] = loop.call_later(
+                remaining, self.locality_timeout, worker_id
+            )
+        return False
+    
+    def locality_timeout(self, worker_id: int) -> None:
+        del self.locality_timers[worker_id]
+        self.notify_work()
+    
+    def holds_intermediate(self, worker_id: T.Optional[int]) -> bool:
+        # reduce は中間ファイルを書いたワーカーに優先して渡す
+        # 誰も中間ファイルを持っていなければ（全員落ちた等）待たせる意味はない
+        return not self.producers or worker_id in self.producers
+    
+    def set_locality(self, worker_id: int, data_dirs: T.List[str]) -> None:
+        # ワーカーが知らせてきたデータディレクトリの下にある入力ファイルを、そのワーカーの手元とみなす
+        if not data_dirs:
+            return
+        if self.real_paths is None:
+            # 入力ファイルの実パスは最初に一度だけ求める
+            paths = dict.fromkeys(split[0] for split in self.splits.values())
+            self.real_paths = {path: os.path.realpath(path) for path in paths}
+        dirs = [os.path.realpath(d) for d in data_dirs]
+        for path, real in self.real_paths.items():
+            if any(os.path.commonpath([real, d]) == d for d in dirs):
+                self.local_workers.setdefault(path, set()).add(worker_id)
+                self.worker_paths.setdefault(worker_id, []).append(path)
+                if path in self.file_locations:
+                    self.local_files.setdefault(worker_id, {})[path] = None
+    
+    def next_retry(
+        self,
+        retries: T.Deque[int],
+        working: T.Container[int],
+        kind: bytes,
+        worker_id: T.Optional[int],
+    ) -> T.Optional[int]:
+        # 再実行待ちのタスクのうち、このワーカーで失敗していないものを選ぶ
+        # 失敗したワーカーにしか渡せないタスクは後ろに回して、他のワーカーが取りに来るのを待つ
+        for _ in range(len(retries)):
+            task_id = retries.popleft()
+            if task_id not in working:
+                continue
+            if self.can_retry_on(kind, task_id, worker_id):
+                return task_id
+            retries.append(task_id)
+        return None
+    
+    def can_retry_on(self, kind: bytes, task_id: int, worker_id: T.Optional[int]) -> bool:
+        # 他に試せるワーカーがいなければ、失敗したワーカーでももう一度試す
+        failed = self.failed_workers.get((kind, task_id))
+        if not failed or worker_id not in failed:
+            return True
+        return all(other in failed for other in self.leases)
+    
+    def next_reduce_task(self, worker_id: T.Optional[int] = None) -> T.Optional[int]:
+        partition = self.next_retry(
+            self.retry_reduces, self.working_reduces, b"reduce", worker_id
+        )
+        if partition is not None:
+            return partition
+        try:
+            partition = next(self.partitions)
+            self.working_reduces.add(partition)
+            return partition
+        except StopIteration:
+            return None
+    
+    def register_worker(
+        self, on_lost: T.Callable[[], None], worker_id: T.Optional[int] = None
+    ) -> int:
+        # on_lost はリースが切れたワーカーの接続を切るために呼ばれる
+        # 複数のジョブで同じワーカーを共有するときは、呼び出し側が worker_id を決める
+        if worker_id is None:
+            worker_id = self.next_worker_id
+            self.next_worker_id += 1
+        self.leases[worker_id] = time.monotonic() + LEASE_TIMEOUT
+        self.lost_callbacks[worker_id] = on_lost
+        self.assignments[worker_id] = set()
+        self.schedule_lease_check()
+        return worker_id
+    
+    def heartbeat(self, worker_id: int) -> None:
+        if worker_id in self.leases:
+            self.leases[worker_id] = time.monotonic() + LEASE_TIMEOUT
+            self.leases.move_to_end(worker_id)
+    
+    def assign(self, worker_id: T.Optional[int], kind: bytes, task_id: int) -> None:
+        self.metrics.task_assigned(self.job, kind, task_id)
+        if worker_id not in self.assignments:
+            return
+        self.assignments[worker_id].add((kind, task_id))
+        self.owners.setdefault((kind, task_id), set()).add(worker_id)
+    
+    def task_started(self, kind: bytes, task_id: int, worker_id: T.Optional[int] = None) -> None:
+        # ワーカーがタスクを実際に実行し始めた（スパンもここから測る）
+        working = self.working_maps if kind == b"map" else self.working_reduces
+        if task_id not in working:
+            return
+        self.metrics.task_started(self.job, kind, task_id, worker_id)
+        if kind == b"map":
+            self.map_started.setdefault(task_id, {})[worker_id] = time.monotonic()
+    
+    def release(self, kind: bytes, task_id: int) -> None:
+        # 完了したタスクを、それを実行していた全ワーカーの担当から外す
+        for worker_id in self.owners.pop((kind, task_id), set()):
+            self.assignments[worker_id].discard((kind, task_id))
+    
+    def worker_lost(self, worker_id: T.Optional[int]) -> None:
+        # 接続切れ・リース切れのワーカーが持っていたタスクを再実行待ちに戻す
+        # 完了済みの map の出力（map_results）はそのまま使う
+        if worker_id not in self.leases:
+            return
+        del self.leases[worker_id]
+        del self.lost_callbacks[worker_id]
+        self.producers.discard(worker_id)
+        self.local_files.pop(worker_id, None)
+        for path in self.worker_paths.pop(worker_id, ()):
+            workers = self.local_workers[path]
+            workers.discard(worker_id)
+            if not workers and path in self.file_locations:
+                # 手元に持つワーカーがいなくなったので、誰が読んでもよいファイルに戻す
+                self.remote_files[path] = None
+        self.locality_waits.pop(worker_id, None)
+        timer = self.locality_timers.pop(worker_id, None)
+        if timer is not None:
+            timer.cancel()
+        requeued = False
+        for kind, task_id in self.assignments.pop(worker_id):
+            owners = self.owners[(kind, task_id)]
+            owners.discard(worker_id)
+            if kind == b"map":
+                self.map_attempts[task_id] -= 1
+                self.map_started.get(task_id, {}).pop(worker_id, None)
+            # 投機的実行の複製が他のワーカーで動いていれば、そちらに任せる
+            if owners:
+                continue
+            print(f"RETRYING {kind.decode()} {task_id}")
+            self.metrics.task_retried(self.job, kind, task_id)
+            if kind == b"map":
+                self.retry_maps.append(task_id)
+            else:
+                self.retry_reduces.append(task_id)
+            requeued = True
+        if requeued:
+            self.notify_work()
+    
+    def task_failed(
+        self, kind: bytes, task_id: int, error: str, worker_id: T.Optional[int] = None
+    ) -> None:
+        # ワーカーでタスクが例外になった。リースは生きているので worker_lost では戻らない
+        working = self.working_maps if kind == b"map" else self.working_reduces
+        if task_id not in working or self.state == State.FAILED:
+            return
+        key = (kind, task_id)
+        failed = self.failed_workers.setdefault(key, [])
+        failed.append(worker_id)
+        print(f"FAILED {kind.decode()} {task_id} on worker {worker_id}: {error}")
+        self.metrics.inc("mapreduce_task_failures_total", job=self.job, kind=kind.decode())
+        if worker_id in self.assignments:
+            self.assignments[worker_id].discard(key)
+        owners = self.owners.get(key, set())
+        owners.discard(worker_id)
+        if kind == b"map":
+            self.map_attempts[task_id] -= 1
+            self.map_started.get(task_id, {}).pop(worker_id, None)
+        if len(failed) >= MAX_TASK_FAILURES:
+            self.fail(f"{kind.decode()} {task_id} failed {len(failed)} times: {error}")
+            return
+        # 投機的実行の複製が他のワーカーで動いていれば、そちらに任せる
+        if owners:
+            return
+        print(f"RETRYING {kind.decode()} {task_id}")
+        self.metrics.task_retried(self.job, kind, task_id)
+        if kind == b"map":
+            self.retry_maps.append(task_id)
+        else:
+            self.retry_reduces.append(task_id)
+        self.notify_work()
+    
+    def fail(self, reason: str) -> None:
+        # ジョブを打ち切る。実行中の他のタスクの結果は届いても無視される
+        self.error = reason
+        self.state = State.FAILED
+        print(f"FAILED: {reason}")
+        self.release_cache()
+        self.finish()
+    
+    def release_cache(self) -> None:
+        if self.cache is not None:
+            self.cache.release(self.cache_held)
+            self.cache_held = []
+    
+    def finish(self) -> None:
+        if self.on_finished is not None:
+            self.on_finished()
+            return
+        # 待機中のワーカーに disconnect を送ってからイベントループを止める
+        self.notify_work()
+        loop = asyncio.get_running_loop()
+        loop.call_soon(loop.stop)
+    
+    def schedule_lease_check(self) -> None:
+        if self.lease_check is not None:
+            return
+        loop = asyncio.get_running_loop()
+        self.lease_check = loop.call_later(LEASE_CHECK_INTERVAL, self.check_leases)
+    
+    def check_leases(self) -> None:
+        self.lease_check = None
+        now = time.monotonic()
+        expired = []
+        for worker_id, deadline in self.leases.items():
+            if deadline >= now:
+                break
+            expired.append(worker_id)
+        for worker_id in expired:
+            print(f"Lease expired for worker {worker_id}")
+            on_lost = self.lost_callbacks[worker_id]
+            self.worker_lost(worker_id)
+            on_lost()
+        if self.leases and self.state not in (State.FINISHED, State.FAILED):
+            self.schedule_lease_check()
+    
+    def wait_for_work(self) -> asyncio.Future:
+        # 新しいタスクができたら完了する Future を返す
+        future = asyncio.get_running_loop().create_future()
+        self.idle_workers.append(future)
+        return future
+    
+    def notify_work(self) -> None:
+        # 待機中のワーカーを起こし、もう一度 get_next_task を呼ばせる
+        idle_workers, self.idle_workers = self.idle_workers, []
+        for future in idle_workers:
+            if not future.done():
+                future.set_result(None)
+    
+    def find_stragglers(self) -> T.List[int]:
+        # 完了済みタスクのスループットの中央値から各タスクの予想時間を出し、
+        # 予想より SPECULATIVE_SLOWDOWN 倍以上かかっているタスクを、遅い順が末尾になるように返す
+        # まだどのワーカーでも始まっていない（窓で待っている）タスクは遅れていない
+        if not self.speculative or not self.map_throughputs:
+            return []
+        now = time.monotonic()
+        throughput = statistics.median(self.map_throughputs)
+        slow = []
+        for task_id, (_, start, end) in self.working_maps.items():
+            started = self.map_started.get(task_id)
+            if self.map_attempts[task_id] >= MAX_MAP_ATTEMPTS or not started:
+                continue
+            elapsed = now - min(started.values())
+            if elapsed < SPECULATIVE_MIN_ELAPSED:
+                continue
+            expected = (end - start) / throughput
+            slowdown = elapsed / expected if expected > 0 else float("inf")
+            if slowdown > SPECULATIVE_SLOWDOWN:
+                slow.append((slowdown, task_id))
+        slow.sort()
+        return [task_id for _, task_id in slow]
+    
+    def next_straggler(self, worker_id: T.Optional[int] = None) -> T.Optional[int]:
+        # 待機中のワーカーが次々に来ても、走査は STRAGGLER_CHECK_INTERVAL に 1 回だけにして
+        # その結果から遅い順に 1 つずつ渡す
+        # 複製は別のワーカーで走らせないと意味がないので、このワーカーが実行中のタスクは他のワーカーに残す
+        now = time.monotonic()
+        if now >= self.straggler_scan_due:
+            self.straggler_scan_due = now + STRAGGLER_CHECK_INTERVAL
+            self.stragglers = self.find_stragglers()
+        for index in range(len(self.stragglers) - 1, -1, -1):
+            task_id = self.stragglers[index]
+            if task_id not in self.working_maps or self.map_attempts[task_id] >= MAX_MAP_ATTEMPTS:
+                del self.stragglers[index]
+                continue
+            if worker_id in self.owners.get((b"map", task_id), ()):
+                continue
+            del self.stragglers[index]
+            return task_id
+        return None
+    
+    def schedule_straggler_check(self) -> None:
+        # 待機中のワーカーがいる間は定期的に遅いタスクを探す
+        if not self.speculative or self.straggler_check is not None:
+            return
+        loop = asyncio.get_running_loop()
+        self.straggler_check = loop.call_later(
+            STRAGGLER_CHECK_INTERVAL, self.check_stragglers
+        )
+    
+    def check_stragglers(self) -> None:
+        self.straggler_check = None
+        if self.state != State.MAPPING or not self.working_maps:
+            return
+        if self.idle_workers and self.find_stragglers():
+            # 起こしたワーカーが走査し直せるようにする
+            self.straggler_scan_due = 0.0
+            self.notify_work()
+        else:
+            self.schedule_straggler_check()
+    
+    def partition_files(self, partition: int) -> T.List[MapOutput]:
+        return [files[partition] for files in self.map_results.values()]
+    
+    def map_done(
+        self,
+        data: MapResult,
+        worker_id: T.Optional[int] = None,
+        stats: T.Optional[T.Dict[str, T.Any]] = None,
+    ) -> None:
+        # stats はワーカーが測った処理時間・読んだバイト数など（tasks.py 参照）
         if not data[0] in self.working_maps:
             return
+        self.metrics.task_finished(self.job, b"map", data[0], worker_id, stats)
         self.map_results[data[0]] = data[1]
-        del self.working_maps[data[0]]
-        print(f"MAPPING {len(self.map_results)/{self.data_len}}")
+        self.inline_bytes += sum(len(f) for f in data[1] if isinstance(f, bytes))
+        if self.cache is not None:
+            self.store_map_output(data[0])
+        if worker_id in self.leases:
+            self.producers.add(worker_id)
+        self.release(b"map", data[0])
+        _, start, end = self.working_maps.pop(data[0])
+        started = self.map_started.pop(data[0], {}).get(worker_id)
+        elapsed = time.monotonic() - started if started is not None else 0.0
+        if elapsed > 0:
+            self.map_throughputs.append((end - start) / elapsed)
+        print(f"MAPPING {len(self.map_results)}/{self.data_len}")
+        if len(self.map_results) == self.data_len:
+            # reduce タスクができたので、待機中のワーカーにも配る
+            self.notify_work()
+    
+    def reduce_done(
+        self,
+        data: FileWithId,
+        worker_id: T.Optional[int] = None,
+        stats: T.Optional[T.Dict[str, T.Any]] = None,
+    ) -> None:
+        if not data[0] in self.working_reduces:
+            return
+        self.metrics.task_finished(self.job, b"reduce", data[0], worker_id, stats)
+        self.reduce_results[data[0]] = data[1]
+        self.working_reduces.remove(data[0])
+        self.release(b"reduce", data[0])
+        self.release_inline(data[0])
+        print(f"REDUCING {len(self.reduce_results)}/{self.num_partitions}")
+        if len(self.reduce_results) < self.num_partitions:
+            return
+        self.metrics.phase_finished(self.job, "reduce")
+        if not self.merge_results:
+            self.complete()
+            return
+        # 結果のマージは大きなファイルを読み書きするので、イベントループの外で行う
+        # （同じループで動く他のジョブのハートビートやタスクの割り当てを止めない）
+        self.metrics.phase_started(self.job, "merge")
+        result_files = [self.reduce_results[p] for p in range(self.num_partitions)]
+        merged_file = MERGED_RESULT_FILENAME.format(self.output)
+        loop = asyncio.get_running_loop()
+        if self.summary is not None:
+            future = loop.run_in_executor(
+                None, merge_summary_files, self.summary, result_files, merged_file
+            )
+        else:
+            future = loop.run_in_executor(None, merge_result_files, result_files, merged_file)
+        future.add_done_callback(lambda f: self.merge_done(merged_file, f))
+    
+    def release_inline(self, partition: int) -> None:
+        # このパーティションはもう reduce し直さないので、バイト列で持っていた map の出力を手放す
+        for files in self.map_results.values():
+            if isinstance(files[partition], bytes):
+                self.inline_bytes -= len(files[partition])
+                files[partition] = b""
+    
+    def merge_done(self, merged_file: str, future: asyncio.Future) -> None:
+        if future.cancelled():
+            return
+        self.metrics.phase_finished(self.job, "merge")
+        if future.exception() is not None:
+            self.fail(f"merging into {merged_file} failed: {future.exception()!r}")
+            return
+        print(f"Merged results into {merged_file}")
+        self.complete()
     
-    def reduce_done(self) -> None:
-        print("REDUCING 1/1")
+    def complete(self) -> None:
+        self.release_cache()
         self.state = State.FINISHED
-        
\ No newline at end of file
+        print("FINISHED.")
+        self.finish()
@@ -1,39 +1,126 @@
-import os
-import glob
+import json
 import asyncio
+import argparse
+import typing as T
 
-from scheduler import Scheduler
-from protocol import Protocol, HOST, PORT, FileWithId
+from job_manager import JobManager
+from jobs import DEFAULT_INPUTS, Job, job_from_dict
+from metrics import DISABLED, Metrics
+from map_cache import KEY_MODES, MAX_CACHE_BYTES, MapCache
+from protocol import (
+    Protocol, HOST, PORT, BACKLOG, LOOPS, FileWithId, new_event_loop, raise_open_file_limit,
+)
 
 class Server(Protocol):
     # 入力ファイル群 → Map処理 → 中間結果 → Reduce処理 → 最終結果
-    def __init__(self, scheduler:Scheduler) -> None:
+    # scheduler は複数のジョブをまとめる JobManager（job_manager.py 参照）
+    def __init__(self, scheduler:JobManager) -> None:
         super().__init__()
         self.scheduler = scheduler
+        # クレジット: このワーカーにあと何個タスクを送ってよいか
+        # どのワーカーも最低1つは受け取れるので 1 から始め、
+        # ワーカーが b"credit" で追加した分だけ先行してタスクを送る（パイプライン化）
+        self.credits = 1
+        self.waiting = False
+        self.worker_id: T.Optional[int] = None
     
-    def connnection_made(self, transport: asyncio.Transport) -> None:
+    def connection_made(self, transport: asyncio.Transport) -> None:
         # 新しいワーカーが接続すると自動的にタスクを割り当てる
         # 非同期処理により、複数のワーカーを同時に管理する
+        super().connection_made(transport)
         peername = transport.get_extra_info("peername")
         print(f"New worker connection from {peername}")
-        self.start_new_task()
+        # 最初のタスクは、ワーカーが手元のデータを知らせてくる b"hello" を待ってから渡す
+        # （submit.py のようにジョブを投入するだけの接続は hello を送らず、ワーカーとして登録されない）
+    
+    def connection_lost(self, exc: T.Optional[Exception]) -> None:
+        # ワーカーが落ちたら、実行中だったタスクを他のワーカーに回す
+        if self.worker_id is None:
+            return
+        print(f"Worker {self.worker_id} disconnected")
+        self.scheduler.worker_lost(self.worker_id)
     
     def start_new_task(self) -> None:
         # スケジューラが次のタスクを割り当てるための処理
-        command, data = self.scheduler.get_next_task()
-        self.send_command(command=command, data=data)
-        
+        # クレジットが残っている限り、前のタスクの完了を待たずに次のタスクを送る
+        # 送信バッファが詰まっている間は割り当てを止め、writing_resumed で再開する
+        while self.credits > 0 and not self.waiting and not self.writing_paused:
+            command, data = self.scheduler.get_next_task(self.worker_id)
+            if command == b"wait":
+                # 渡せるタスクがない間も接続は切らずに待機させる
+                # reduce の開始など新しいタスクができたらスケジューラが起こしてくれる
+                self.waiting = True
+                waiter = self.scheduler.wait_for_work()
+                waiter.add_done_callback(lambda _: self.resume())
+                return
+            self.send_command(command=command, data=data)
+            if command == b"disconnect":
+                self.credits = 0
+                return
+            self.credits -= 1
+    
+    def writing_resumed(self) -> None:
+        if self.worker_id is None or self.waiting or self.transport.is_closing():
+            return
+        self.start_new_task()
+    
+    def resume(self) -> None:
+        self.waiting = False
+        if self.transport.is_closing():
+            return
+        self.start_new_task()
+    
     def process_command(self, command: bytes, data: FileWithId = None) -> None:
         # ワーカーがファイルを処理完了すると、mapdoneコマンドを送ってくる（reducedoneも同様）
         # スケジューラが次のタスクを割り当てる
-        if command == b"mapdone":
-            self.scheduler.map_done(data)
+        # どのコマンドもワーカーが生きている証拠なので、リースを延長する
+        self.scheduler.heartbeat(self.worker_id)
+        # タスクが1つ終わるとワーカーの枠が1つ空くので、クレジットを1つ戻す
+        if command == b"heartbeat":
+            pass
+        elif command == b"hello":
+            # リースが切れたら（ハートビートが途絶えたら）接続を切る
+            self.worker_id = self.scheduler.register_worker(self.transport.abort)
+            self.scheduler.set_locality(self.worker_id, data["data_dirs"])
+            self.start_new_task()
+        elif command == b"mapdone":
+            self.scheduler.map_done(data, self.worker_id)
+            self.credits += 1
             self.start_new_task()
         elif command == b"reducedone":
-            self.scheduler.reduce_done()
+            self.scheduler.reduce_done(data, self.worker_id)
+            self.credits += 1
+            self.start_new_task()
+        elif command == b"taskstarted":
+            # 窓で待っていたタスクを、ワーカーが実際に実行し始めた（枠は空かないのでクレジットはそのまま）
+            self.scheduler.task_started(data, self.worker_id)
+        elif command == b"taskfailed":
+            # タスクが例外で終わった。スケジューラが別のワーカーで再実行する（上限を超えたらジョブを失敗にする）
+            self.scheduler.task_failed(data, self.worker_id)
+            self.credits += 1
             self.start_new_task()
+        elif command == b"credit":
+            self.credits += data
+            self.start_new_task()
+        elif command == b"submit":
+            # submit.py から新しいジョブが届いた。待機中のワーカーにもタスクが配られる
+            # 定義の誤りはすぐに、入力が見つからないことは展開し終わってから b"submitfailed" で返す
+            try:
+                job = job_from_dict(data)
+            except (TypeError, ValueError) as e:
+                self.send_command(command=b"submitfailed", data=str(e))
+                return
+            self.scheduler.submit(job, self.job_submitted)
         else:
             print(f"Unknown commandn recived: {command}")
+    
+    def job_submitted(self, job_id: T.Optional[int], error: T.Optional[BaseException]) -> None:
+        if self.transport.is_closing():
+            return
+        if error is not None:
+            self.send_command(command=b"submitfailed", data=str(error))
+        else:
+            self.send_command(command=b"submitted", data=job_id)
 
 def main():
     # シングルスレッドで複数の接続を処理
@@ -44,18 +131,70 @@ def main():
     #　　1つのイベントループで複数のタスクを管理
     # スレッドは作成されない
     # スレッドを作成してマルチスレッドの場合は、threadingモジュールを使用することになる
-    event_loop = asyncio.get_event_loop()
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--jobs", help="実行するジョブの JSON ファイル（ジョブ定義のリスト、jobs.py 参照）",
+    )
+    parser.add_argument(
+        "--serve", action="store_true",
+        help="ジョブが全部終わっても終了せず、submit.py からの投入を待ち続ける",
+    )
+    parser.add_argument(
+        "--concurrent-jobs", type=int, default=1, help="同時に実行するジョブ数",
+    )
+    parser.add_argument(
+        "--trace", help="終了時にタスクとフェーズの時間を Chrome トレース形式で書き出すファイル",
+    )
+    parser.add_argument(
+        "--metrics-port", type=int,
+        help="Prometheus 形式のメトリクスを返す HTTP ポート（サーバーと同じイベントループで動く）",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help="map の出力をキャッシュするディレクトリ。入力が変わっていない分割は map し直さない",
+    )
+    parser.add_argument(
+        "--cache-size", type=int, default=MAX_CACHE_BYTES // 1024 // 1024,
+        help="キャッシュの上限（MB）。超えたら使われていない古いエントリから消す",
+    )
+    parser.add_argument(
+        "--cache-key", choices=KEY_MODES, default="stat",
+        help="stat: (パス, サイズ, 更新時刻) / content: 中身のハッシュ",
+    )
+    parser.add_argument(
+        "--loop", choices=LOOPS, default="asyncio",
+        help="イベントループの実装（uvloop は別途インストールが必要）",
+    )
+    args = parser.parse_args()
     
-    current_path = os.path.abspath(os.getcwd())
-    file_locations = list(
-        glob.glob(f"{current_path}/input_files/*.txt")
+    event_loop = new_event_loop(args.loop)
+    # ワーカー 1 台につき 1 つソケットを開く
+    print(f"Open file limit: {raise_open_file_limit()}")
+    
+    # どちらも指定しなければ計測しない
+    metrics: Metrics = DISABLED
+    if args.trace or args.metrics_port:
+        metrics = Metrics()
+    cache = None
+    if args.cache_dir:
+        cache = MapCache(args.cache_dir, args.cache_size * 1024 * 1024, args.cache_key)
+    scheduler = JobManager(
+        args.concurrent_jobs, exit_when_idle=not args.serve, metrics=metrics,
+        cache=cache,
     )
-    scheduler = Scheduler(file_locations)
+    jobs: T.List[Job] = []
+    if args.jobs:
+        with open(args.jobs, "r") as f:
+            jobs = [job_from_dict(spec) for spec in json.load(f)]
+    elif not args.serve:
+        # 既定のジョブ: input_files/ のテキスト（.txt と圧縮された .gz / .bz2 / .zst）のワードカウント
+        # パーティションごとの結果 (result-N.json) に加えて、result.json にもまとめる
+        jobs = [Job("wordcount", DEFAULT_INPUTS)]
     
     # 非同期サーバーを作成
     # ワーカーからの接続を待機
     server = event_loop.create_server(
-        lambda: Server(scheduler), HOST, PORT
+        lambda: Server(scheduler), HOST, PORT, backlog=BACKLOG
     )
     
     # completeの条件:
@@ -74,6 +213,16 @@ def main():
     server = event_loop.run_until_complete(server)
     
     print(f"Serving on {server.sockets[0].getsockname()}")
+    metrics_server = None
+    if args.metrics_port:
+        metrics_server = event_loop.run_until_complete(
+            metrics.serve(HOST, args.metrics_port)
+        )
+        print(f"Serving metrics on http://{HOST}:{args.metrics_port}/metrics")
+    
+    # 入力の展開はイベントループの外で行うので、投入はループが動き出してから（投入順は保たれる）
+    for job in jobs:
+        event_loop.call_soon(scheduler.submit, job)
     
     try:
         # 2. 永久ループ開始
@@ -81,7 +230,12 @@ def main():
     finally:
         server.close()
         event_loop.run_until_complete(server.wait_closed())
+        if metrics_server is not None:
+            metrics_server.close()
         event_loop.close()
+        if args.trace:
+            metrics.write_trace(args.trace)
+            print(f"Wrote trace to {args.trace}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
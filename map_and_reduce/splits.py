@@ -0,0 +1,58 @@
+import os
+import typing as T
+
+# 大きなファイルを固定サイズのバイト範囲 (path, start, end) に分割し、
+# それぞれを独立した map タスクとして複数のワーカーに配る。
+# 分割位置は行の途中にならないよう、次の改行の直後にずらす（改行が見つかるかファイルの終わりまで探す）。
+# 行の途中で分けると、1 行（JSON Lines なら 1 レコード）が 2 つの mapper に分かれてしまう。
+# ワードカウントのエンジンは行の境界を必要としないので、word_boundaries なら空白の直後でもよい。
+
+SPLIT_SIZE = 64 * 1024 * 1024  # 64MiB
+ALIGN_WINDOW = 64 * 1024  # 境界を探すときに一度に読む量
+
+WHITESPACE = b" \t\n\r\x0b\x0c"
+
+Split = T.Tuple[str, int, int]
+
+def align_offset(
+    f: T.BinaryIO, offset: int, size: int, word_boundaries: bool = False
+) -> int:
+    # offset 以降で最初の改行の直後を返す（ALIGN_WINDOW ずつ読んで、見つかるまで先へ進む）
+    # word_boundaries なら、ウィンドウ内に改行がなければ最初の空白の直後で妥協する
+    position = offset
+    while position < size:
+        f.seek(position)
+        window = f.read(ALIGN_WINDOW)
+        newline = window.find(b"\n")
+        if newline >= 0:
+            return position + newline + 1
+        if word_boundaries:
+            for i, byte in enumerate(window):
+                if byte in WHITESPACE:
+                    return position + i + 1
+        # 長い行（word_boundaries なら空白を含まない巨大な単語）の途中なので、次のウィンドウを探す
+        position += len(window)
+    return size
+
+def split_file(
+    path: str, split_size: int = SPLIT_SIZE, word_boundaries: bool = False
+) -> T.List[Split]:
+    size = os.path.getsize(path)
+    splits: T.List[Split] = []
+    start = 0
+    with open(path, "rb") as f:
+        while start < size:
+            end = size
+            if start + split_size < size:
+                end = align_offset(f, start + split_size, size, word_boundaries)
+            splits.append((path, start, end))
+            start = end
+    return splits
+
+def make_splits(
+    file_locations: T.Iterable[str], split_size: int = SPLIT_SIZE, word_boundaries: bool = False
+) -> T.List[Split]:
+    splits: T.List[Split] = []
+    for path in file_locations:
+        splits.extend(split_file(path, split_size, word_boundaries))
+    return splits
@@ -0,0 +1,57 @@
+import sys
+import json
+import asyncio
+import typing as T
+
+from protocol import Protocol, HOST, PORT
+
+# 起動中のサーバー（server.py --serve）にジョブを投入するクライアント
+#   python submit.py jobs.json
+# jobs.json はジョブ定義のリスト（jobs.Job のフィールド名をキーにした辞書）
+# 投入したらすぐ終了する。ワーカーは再起動せずにそのまま新しいジョブのタスクを受け取る
+# 定義の誤りや入力が見つからないジョブはサーバーに断られ、終了コードが 1 になる
+
+class Submitter(Protocol):
+    def __init__(self, specs: T.List[T.Dict[str, T.Any]]) -> None:
+        super().__init__()
+        self.specs = specs
+        self.remaining = len(specs)
+        self.failed = False
+    
+    def connection_made(self, transport: asyncio.Transport) -> None:
+        super().connection_made(transport)
+        for spec in self.specs:
+            self.send_command(command=b"submit", data=spec)
+    
+    def connection_lost(self, exc: T.Optional[Exception]) -> None:
+        asyncio.get_running_loop().stop()
+    
+    def process_command(self, command: bytes, data: T.Any) -> None:
+        if command == b"submitted":
+            print(f"Submitted job {data}")
+        elif command == b"submitfailed":
+            print(f"Rejected job: {data}", file=sys.stderr)
+            self.failed = True
+        else:
+            print(f"Unknown command received: {command}")
+            return
+        self.remaining -= 1
+        if self.remaining == 0:
+            self.close()
+
+def main():
+    with open(sys.argv[1], "r") as f:
+        specs = json.load(f)
+    event_loop = asyncio.get_event_loop()
+    submitter = Submitter(specs)
+    coro = event_loop.create_connection(lambda: submitter, HOST, PORT)
+    event_loop.run_until_complete(coro)
+    try:
+        event_loop.run_forever()
+    finally:
+        event_loop.close()
+    if submitter.failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+import json
+import math
+import zlib
+import heapq
+import base64
+import struct
+import hashlib
+import typing as T
+from array import array
+
+from external_merge import Record, write_json_stream
+
+# 全キーの正確な値の代わりに、その要約だけを結果にする reduce モード（Job.reduce_mode）
+#
+#   "topk":        値（出現回数）の大きい順に k 個のキーだけを正確に求める
+#                  map の出力はこれまでどおりキーのハッシュでパーティションに分けるので、
+#                  各パーティションの reduce はそのキーの正確な合計を持っている。
+#                  reduce はソート済みの中間ファイルを k-way マージしながら大きさ k のヒープだけを持ち、
+#                  最後にパーティションごとの上位 k 個をもう一度ヒープでマージする。
+#   "count-min":   Count-Min Sketch（キーごとの値を過大側にだけ誤差のある推定で答える）
+#   "hyperloglog": HyperLogLog（異なるキーの数の推定）
+#                  この 2 つは map が辞書の代わりにスケッチを中間ファイルに書き、
+#                  reduce / マージはスケッチ同士を足す（max を取る）だけなので、
+#                  中間ファイル・reduce のメモリはキー数によらず固定の大きさになる。
+# オプション（Job.reduce_options）は DEFAULT_OPTIONS を上書きする。
+
+SUMMARY_MODES = ("topk", "count-min", "hyperloglog")
+SKETCH_MODES = ("count-min", "hyperloglog")
+DEFAULT_OPTIONS: T.Dict[str, T.Dict[str, int]] = {
+    "topk": {"k": 1000},
+    # 誤差は 確率 1 - e^-depth で 合計 × e / width 以下
+    "count-min": {"width": 2048, "depth": 4},
+    # 相対誤差はおよそ 1.04 / sqrt(2^precision)（14 なら 0.8%）
+    "hyperloglog": {"precision": 14},
+}
+
+SKETCH_MAGIC = b"MRS\x01"
+SKETCH_SUFFIX = ".sketch"
+COMPRESS_LEVEL = 1  # 中間ファイルのスケッチは大半が 0 なのでよく縮む
+COUNT_MIN_HEADER = struct.Struct("<BII")  # (種類, width, depth)
+HYPERLOGLOG_HEADER = struct.Struct("<BB")  # (種類, precision)
+COUNT_MIN, HYPERLOGLOG = 0, 1
+HASH_BITS = 64
+
+Summary = T.Tuple[str, T.Dict[str, int]]  # (reduce_mode, オプション)
+
+def summary_options(mode: str, options: T.Optional[T.Dict[str, int]]) -> T.Dict[str, int]:
+    defaults = DEFAULT_OPTIONS[mode]
+    unknown = set(options or {}) - set(defaults)
+    if unknown:
+        raise ValueError(f"Unknown options for {mode}: {sorted(unknown)}")
+    return dict(defaults, **(options or {}))
+
+def key_hash(key: str) -> int:
+    # ワーカー間で同じ値になる 64 ビットのハッシュ（組み込みの hash() はプロセスごとに変わる）
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+class CountMinSketch:
+    def __init__(self, width: int, depth: int, table: T.Optional[array] = None) -> None:
+        self.width = width
+        self.depth = depth
+        # depth 行 × width 列を 1 次元の配列に並べる
+        self.table = table if table is not None else array("q", bytes(8 * width * depth))
+    
+    def columns(self, key: str) -> T.List[int]:
+        # 2 つのハッシュの線形結合で depth 個の独立なハッシュの代わりにする（Kirsch-Mitzenmacher）
+        h = key_hash(key)
+        h1, h2 = h & 0xFFFFFFFF, h >> 32
+        width = self.width
+        return [row * width + (h1 + row * h2) % width for row in range(self.depth)]
+    
+    def update(self, counts: T.Mapping[str, int]) -> None:
+        table = self.table
+        for key, count in counts.items():
+            for column in self.columns(key):
+                table[column] += count
+    
+    def estimate(self, key: str) -> int:
+        return min(self.table[column] for column in self.columns(key))
+    
+    def merge(self, other: "CountMinSketch") -> None:
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError("Cannot merge Count-Min sketches of different sizes")
+        self.table = array("q", map(sum, zip(self.table, other.table)))
+    
+    def total(self) -> int:
+        # どの行も全キーの値の合計になる
+        return sum(self.table[:self.width])
+    
+    def to_bytes(self) -> bytes:
+        header = COUNT_MIN_HEADER.pack(COUNT_MIN, self.width, self.depth)
+        return SKETCH_MAGIC + zlib.compress(header + self.table.tobytes(), COMPRESS_LEVEL)
+    
+    def to_json(self) -> T.Dict[str, T.Any]:
+        rows = [
+            self.table[row * self.width:(row + 1) * self.width].tolist()
+            for row in range(self.depth)
+        ]
+        return {
+            "type": "count-min", "width": self.width, "depth": self.depth,
+            "total": self.total(), "table": rows,
+        }
+    
+    @classmethod
+    def from_json(cls, data: T.Dict[str, T.Any]) -> "CountMinSketch":
+        table = array("q", [count for row in data["table"] for count in row])
+        return cls(data["width"], data["depth"], table)
+
+class HyperLogLog:
+    def __init__(self, precision: int, registers: T.Optional[bytearray] = None) -> None:
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = registers if registers is not None else bytearray(self.size)
+    
+    def update(self, keys: T.Iterable[str]) -> None:
+        # ハッシュの上位 precision ビットでレジスタを選び、残りのビットの先頭の 0 の数 + 1 を記録する
+        registers = self.registers
+        rest_bits = HASH_BITS - self.precision
+        rest_mask = (1 << rest_bits) - 1
+        for key in keys:
+            h = key_hash(key)
+            index = h >> rest_bits
+            rank = rest_bits - (h & rest_mask).bit_length() + 1
+            if rank > registers[index]:
+                registers[index] = rank
+    
+    def merge(self, other: "HyperLogLog") -> None:
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLogs of different precision")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+    
+    def count(self) -> int:
+        m = self.size
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # 少ないうちは空のレジスタの数から数える（linear counting）
+            estimate = m * math.log(m / zeros)
+        return round(estimate)
+    
+    def to_bytes(self) -> bytes:
+        header = HYPERLOGLOG_HEADER.pack(HYPERLOGLOG, self.precision)
+        return SKETCH_MAGIC + zlib.compress(header + self.registers, COMPRESS_LEVEL)
+    
+    def to_json(self) -> T.Dict[str, T.Any]:
+        return {
+            "type": "hyperloglog", "precision": self.precision, "distinct": self.count(),
+            "registers": base64.b64encode(self.registers).decode("ascii"),
+        }
+    
+    @classmethod
+    def from_json(cls, data: T.Dict[str, T.Any]) -> "HyperLogLog":
+        return cls(data["precision"], bytearray(base64.b64decode(data["registers"])))
+
+Sketch = T.Union[CountMinSketch, HyperLogLog]
+
+def new_sketch(mode: str, options: T.Dict[str, int]) -> Sketch:
+    if mode == "count-min":
+        return CountMinSketch(options["width"], options["depth"])
+    return HyperLogLog(options["precision"])
+
+def build_sketch(summary: Summary, results: T.Mapping[str, T.Any]) -> Sketch:
+    # map の出力（パーティション 1 つ分）をスケッチにする
+    sketch = new_sketch(*summary)
+    sketch.update(results)
+    return sketch
+
+def sketch_from_bytes(data: T.Union[bytes, memoryview]) -> Sketch:
+    # 共有メモリの memoryview もそのまま受け取る（コピーになるのは伸長した中身だけ）
+    if data[:len(SKETCH_MAGIC)] != SKETCH_MAGIC:
+        raise ValueError("Not a sketch")
+    body = zlib.decompress(data[len(SKETCH_MAGIC):])
+    if body[0] == COUNT_MIN:
+        _, width, depth = COUNT_MIN_HEADER.unpack_from(body)
+        table = array("q")
+        table.frombytes(body[COUNT_MIN_HEADER.size:])
+        return CountMinSketch(width, depth, table)
+    _, precision = HYPERLOGLOG_HEADER.unpack_from(body)
+    return HyperLogLog(precision, bytearray(body[HYPERLOGLOG_HEADER.size:]))
+
+def save_sketch(filename: str, sketch: Sketch) -> None:
+    with open(filename, "wb") as f:
+        f.write(sketch.to_bytes())
+
+def load_sketch(filename: T.Union[str, bytes]) -> Sketch:
+    # 小さいスケッチはファイルではなくバイト列のまま届く（tasks.py 参照）
+    if isinstance(filename, bytes):
+        return sketch_from_bytes(filename)
+    with open(filename, "rb") as f:
+        return sketch_from_bytes(f.read())
+
+def merge_sketches(summary: Summary, sketches: T.Iterable[Sketch]) -> Sketch:
+    merged = new_sketch(*summary)
+    for sketch in sketches:
+        merged.merge(sketch)  # type: ignore[arg-type]
+    return merged
+
+def top_records(records: T.Iterable[Record], k: int) -> T.List[Record]:
+    # 値の大きい順（同じ値ならキーの順）に k 個。ヒープは k 個分しか持たない
+    return heapq.nsmallest(k, records, key=lambda record: (-record[1], record[0]))
+
+def write_sketch_result(filename: str, sketch: Sketch) -> None:
+    with open(filename, "w") as f:
+        json.dump(sketch.to_json(), f)
+
+def load_result(filename: str) -> T.Union[T.Dict[str, T.Any], Sketch]:
+    # 結果ファイルを読む（スケッチならスケッチのオブジェクトにする）
+    with open(filename, "r") as f:
+        data = json.load(f)
+    if data.get("type") == "count-min" and "table" in data:
+        return CountMinSketch.from_json(data)
+    if data.get("type") == "hyperloglog" and "registers" in data:
+        return HyperLogLog.from_json(data)
+    return data
+
+def merge_summary_files(
+    summary: Summary, result_files: T.Iterable[str], merged_file: str
+) -> None:
+    # パーティションごとの結果を 1 つにまとめる（partition.merge_result_files の代わり）
+    mode, options = summary
+    if mode == "topk":
+        records: T.List[Record] = []
+        for filename in result_files:
+            with open(filename, "r") as f:
+                records.extend(json.load(f).items())
+        write_json_stream(merged_file, top_records(records, options["k"]))
+        return
+    # パーティション同士はキーが重ならないので、スケッチを足せば全体のスケッチになる
+    sketches = (load_result(filename) for filename in result_files)
+    write_sketch_result(merged_file, merge_sketches(summary, sketches))  # type: ignore[arg-type]
@@ -0,0 +1,180 @@
+import io
+import os
+import json
+import gzip
+import time
+import operator
+import typing as T
+from uuid import uuid4
+
+from protocol import Occurrences
+from readers import is_plain_split, iter_input_chunks
+from partition import partition_results
+from intermediate import (
+    COMPRESS_LEVEL, INTERMEDIATE_SUFFIX, MapOutput, dump_occurrences, iter_blocks,
+)
+from external_merge import external_reduce, iter_merged, write_json_stream
+from jobs import TaskSpec, load_callable, combine
+from summaries import (
+    SKETCH_MODES, SKETCH_SUFFIX, Summary, build_sketch, load_sketch, merge_sketches,
+    top_records, write_sketch_result,
+)
+
+# ワーカーが実行する map / reduce タスクの本体
+# ProcessPoolExecutor に渡せるよう、Worker のメソッドではなくモジュールレベルの関数にしている
+# （引数も戻り値も pickle できるタプルだけ）
+# どのタスクも (ジョブID, 関数の指定, タスク本体) を受け取り、(ジョブID, 結果, 統計) を返す（jobs.py 参照）
+# 統計（処理時間・読んだバイト数・出力したキー数）はサーバーのメトリクスに使う（metrics.py 参照）
+
+RESULT_FILENAME = "{}-{}.json"  # パーティションごとの最終結果 (出力名, パーティション)
+TEMP_DIRNAME = "temp_results"
+COMPRESS_INTERMEDIATE = True  # 中間ファイルを gzip で圧縮する（intermediate.py 参照）
+# これ以下の大きさの map の出力はファイルに書かず、mapdone のメッセージに載せて送る（0 なら常にファイル）
+# 実際の上限はタスクごとにスケジューラが決めて渡す（サーバーが持つ合計が増えすぎたら 0 にする）
+INLINE_MAP_OUTPUT_BYTES = 64 * 1024
+
+MapTask = T.Tuple[int, TaskSpec, T.Tuple[int, T.Tuple[str, int, int], int, int]]
+ReduceTask = T.Tuple[int, TaskSpec, T.Tuple[int, T.List[MapOutput], str]]
+TaskStats = T.Dict[str, T.Any]
+
+def get_temp_dir() -> str:
+    temp_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), TEMP_DIRNAME)
+    os.makedirs(temp_dir, exist_ok=True)
+    return temp_dir
+
+def save_map_output(
+    results: Occurrences,
+    summary: T.Optional[Summary],
+    inline_limit: int = INLINE_MAP_OUTPUT_BYTES,
+) -> MapOutput:
+    if summary is not None and summary[0] in SKETCH_MODES:
+        # スケッチのモードでは辞書の代わりにスケッチを書く（大きさはキー数によらない）
+        data = build_sketch(summary, results).to_bytes()
+        suffix = SKETCH_SUFFIX
+    else:
+        # JSON ではなく、キーでソートしたバイナリ形式で保存する
+        buffer = io.BytesIO()
+        dump_occurrences(buffer, results)
+        data = buffer.getvalue()
+        if COMPRESS_INTERMEDIATE:
+            data = gzip.compress(data, COMPRESS_LEVEL)
+        suffix = INTERMEDIATE_SUFFIX
+    # 小さい出力は一時ファイルを経由せず、バイト列のまま reduce タスクまで運ぶ
+    if len(data) <= inline_limit:
+        return data
+    temp_file = os.path.join(get_temp_dir(), f"{uuid4()}{suffix}")
+    with open(temp_file, "wb") as f:
+        f.write(data)
+    return temp_file
+
+def reduce_blocks(
+    blocks: T.Iterable[T.Tuple[T.List[str], T.List[T.Any]]],
+    reducer: T.Callable[[T.Any, T.Any], T.Any] = operator.add,
+    reduced_redult: T.Optional[Occurrences] = None,
+) -> Occurrences:
+    # 中間ファイルのブロック (キーの列, 値の列) を reduced_redult に畳み込む
+    if reduced_redult is None:
+        reduced_redult = {}
+    for keys, counts in blocks:
+        if reducer is operator.add:
+            # ワードカウントはよく使うので、関数呼び出しを挟まずに足す
+            for k, v in zip(keys, counts):
+                reduced_redult[k] = v + reduced_redult.get(k, 0)
+            continue
+        for k, v in zip(keys, counts):
+            if k in reduced_redult:
+                reduced_redult[k] = reducer(reduced_redult[k], v)
+            else:
+                reduced_redult[k] = v
+    return reduced_redult
+
+def reducefn(
+    map_files: T.List[MapOutput], reducer: T.Callable[[T.Any, T.Any], T.Any] = operator.add
+) -> Occurrences:
+    # 複数のMap結果ファイルを読み込み
+    # 全ファイルの単語カウントを合計し、最終的な単語頻度を計算
+    # map_files は担当パーティションの中間ファイルだけ
+    reduced_redult: Occurrences = {}
+    for filename in map_files:
+        # 中間ファイルはブロック単位で少しずつ読む
+        reduce_blocks(iter_blocks(filename), reducer, reduced_redult)
+    return reduced_redult
+
+def map_partitions(
+    spec: TaskSpec, split: T.Tuple[str, int, int], num_partitions: int
+) -> T.List[Occurrences]:
+    # 既定の mapper は mapfn + combinefn と同じ結果をバイト列のまま数える（map_engine.py 参照）
+    mapper, combiner, _, _, field, _ = spec
+    mapfn = load_callable(mapper)
+    if getattr(mapfn, "reads_split", False) and is_plain_split(split, field):
+        output = mapfn(*split)
+    else:
+        # 圧縮や JSON Lines の入力は readers.py が伸長・抽出したチャンクを渡す
+        mapfn = getattr(mapfn, "chunk_mapper", None) or mapfn
+        output = mapfn(iter_input_chunks(split, field))
+    results = combine(output, load_callable(combiner))
+    # reduce を並列化できるよう、キーのハッシュでパーティションに分ける
+    return partition_results(results, num_partitions)
+
+def write_result(results: Occurrences, result_file: str) -> None:
+    with open(result_file, "w") as f:
+        d = json.dumps(results)
+        f.write(d)
+
+def map_stats(
+    split: T.Tuple[str, int, int], partitions: T.List[Occurrences], start: float
+) -> TaskStats:
+    _, begin, end = split
+    return {
+        "bytes_read": end - begin,
+        "keys_emitted": sum(len(partition) for partition in partitions),
+        "seconds": time.perf_counter() - start,
+        "pid": os.getpid(),
+    }
+
+def reduce_stats(inputs: T.List[T.Any], keys: int, start: float) -> TaskStats:
+    return {
+        "inputs": len(inputs),
+        "keys_emitted": keys,
+        "seconds": time.perf_counter() - start,
+        "pid": os.getpid(),
+    }
+
+def run_map_task(
+    map_file: MapTask,
+) -> T.Tuple[int, T.Tuple[int, T.List[MapOutput]], TaskStats]:
+    # タスク本体は (タスクID, (path, start, end), パーティション数, インラインで返してよい大きさ)
+    # （splits.py・scheduler.py 参照）
+    start = time.perf_counter()
+    job_id, spec, (task_id, split, num_partitions, inline_limit) = map_file
+    partitions = map_partitions(spec, split, num_partitions)
+    # パーティションごとのファイルに保存する
+    summary = spec[5]
+    temp_files = [
+        save_map_output(partition, summary, inline_limit) for partition in partitions
+    ]
+    return job_id, (task_id, temp_files), map_stats(split, partitions, start)
+
+def run_reduce_task(data: ReduceTask) -> T.Tuple[int, T.Tuple[int, str], TaskStats]:
+    start = time.perf_counter()
+    job_id, (_, _, reducer_path, output, _, summary), task = data
+    partition, map_files, reduce_mode = task
+    reducer = load_callable(reducer_path)
+    result_file = RESULT_FILENAME.format(output, partition)
+    if reduce_mode in SKETCH_MODES:
+        sketch = merge_sketches(summary, (load_sketch(f) for f in map_files))
+        write_sketch_result(result_file, sketch)
+        keys = 1
+    elif reduce_mode == "topk":
+        # このパーティションのキーは全部ここに集まるので、上位 k 個は正確に決まる
+        records = iter_merged(map_files, get_temp_dir(), reducer=reducer)
+        keys = write_json_stream(result_file, top_records(records, summary[1]["k"]))
+    elif reduce_mode == "external":
+        # ソート済みの中間ファイルを k-way マージし、メモリ使用量を一定に保つ
+        keys = external_reduce(map_files, result_file, get_temp_dir(), reducer=reducer)
+    else:
+        results = reducefn(map_files, reducer)
+        write_result(results, result_file)
+        keys = len(results)
+    stats = reduce_stats(map_files, keys, start)
+    return job_id, (partition, result_file), stats
@@ -1,14 +1,32 @@
 import re
 import os
-import json
 import asyncio
+import argparse
 import typing as T
-from uuid import uuid4
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 
-from protocol import Protocol, HOST, PORT, FileWithId, Occurrences
+from protocol import Protocol, HOST, PORT, LOOPS, Occurrences, new_event_loop
+from tasks import run_map_task, run_reduce_task
 
 ENCODING = "ISO-8859-1"
-RESULT_FILENAME = "result.json"
+WINDOW = 2  # 同時に受け取っておくタスク数（先読みの窓）
+HEARTBEAT_INTERVAL = 5.0  # サーバーのリース（scheduler.LEASE_TIMEOUT）より十分短くする
+
+# 受け取ったコマンドごとの処理と、完了時にサーバーへ返すコマンド
+TASKS = {
+    b"map": (run_map_task, b"mapdone"),
+    b"reduce": (run_reduce_task, b"reducedone"),
+}
+# タスクが例外で終わったら代わりにこれを返す（サーバーが別のワーカーで再実行する）
+FAILED_COMMAND = b"taskfailed"
+# 受け取ったタスクを実際に実行し始めたら送る（窓で待っていた時間を実行時間に数えないため）
+STARTED_COMMAND = b"taskstarted"
+
+def task_ref(command: bytes, data: T.Any) -> T.Tuple[int, T.Tuple[bytes, int]]:
+    # タスクは (ジョブID, 関数の指定, (タスクID, ...)) なので、(ジョブID, (種類, タスクID)) でどれかを示す
+    job_id, _, (task_id, *_) = data
+    return job_id, (command, task_id)
 
 # 1. ワーカーがサーバーに接続
 # 2. Server.connection_made()呼び出し
@@ -18,20 +36,108 @@ RESULT_FILENAME = "result.json"
 # 6. 次のタスクを割り当て
 
 class Worker(Protocol):
+    def __init__(
+        self,
+        window: int = WINDOW,
+        executor: T.Optional[Executor] = None,
+        data_dirs: T.Sequence[str] = (),
+        slots: int = 1,
+    ) -> None:
+        super().__init__()
+        # サーバーは前のタスクの mapdone を待たずに window 個までタスクを送ってくる
+        # 受け取ったタスクは順番に処理し、結果を送ったらすぐ次のタスクに取りかかる
+        self.window = window
+        # executor があれば、タスクはイベントループの外（別プロセス）で並列に実行する
+        # 同時に実行するのは slots 個（executor のワーカー数）までで、残りは pending_tasks で待たせる
+        self.executor = executor
+        self.slots = slots
+        # このワーカーのローカルディスクにある入力データ（スケジューラが局所性に使う）
+        self.data_dirs = list(data_dirs)
+        self.pending_tasks: T.Deque[T.Tuple[bytes, T.Any]] = deque()
+        self.running = 0
+    
+    def connection_made(self, transport: asyncio.Transport) -> None:
+        super().connection_made(transport)
+        # 手元のデータを知らせると、サーバーから最初のタスクが届く
+        self.send_command(command=b"hello", data={"data_dirs": self.data_dirs})
+        # サーバーは最初の1タスク分のクレジットを持っているので、残りの分を渡す
+        if self.window > 1:
+            self.send_command(command=b"credit", data=self.window - 1)
+        self.schedule_heartbeat()
+    
+    def schedule_heartbeat(self) -> None:
+        asyncio.get_running_loop().call_later(HEARTBEAT_INTERVAL, self.send_heartbeat)
+    
+    def send_heartbeat(self) -> None:
+        # タスクの実行中でもイベントループは空いているので、定期的に生存を知らせる
+        if self.transport.is_closing():
+            return
+        self.send_command(command=b"heartbeat")
+        self.schedule_heartbeat()
+    
     def connection_lost(self, exc):
         print("The server closed the connection")
         asyncio.get_running_loop().stop()
     
     def process_command(self, command: bytes, data: T.Any) -> None:
-        if command == b"map":
-            self.handle_map_request(data)
-        elif command == b"reduce":
-            self.handle_reduce_request(data)
+        if command in TASKS:
+            self.pending_tasks.append((command, data))
+            self.start_tasks()
         elif command == b"disconnect":
             self.connection_lost(None)
         else:
             print(f"Unknown command received: {command}")
     
+    def start_tasks(self) -> None:
+        # 空いている枠の数だけ、届いた順にタスクを始め、始めたことをサーバーに知らせる
+        # （サーバーは投機的実行のための経過時間をこの時刻から測る）
+        while self.pending_tasks and self.running < self.slots:
+            command, data = self.pending_tasks.popleft()
+            self.running += 1
+            self.send_command(command=STARTED_COMMAND, data=task_ref(command, data))
+            if self.executor is not None:
+                self.submit_task(command, data)
+            else:
+                # 結果の送信（transport への書き込み）を先に済ませてから次のタスクを処理する
+                asyncio.get_running_loop().call_soon(self.run_task, command, data)
+    
+    def run_task(self, command: bytes, data: T.Any) -> None:
+        task, done_command = TASKS[command]
+        try:
+            result = task(data)
+        except Exception as e:
+            self.task_failed(command, data, e)
+        else:
+            self.send_command(command=done_command, data=result)
+        finally:
+            self.running -= 1
+        self.start_tasks()
+    
+    def submit_task(self, command: bytes, data: T.Any) -> None:
+        # CPU処理はプロセスプールで実行し、イベントループは通信だけを担当する
+        # 1つの接続で受け取った複数のタスクが、別々のコアで同時に進む
+        task, _ = TASKS[command]
+        future = asyncio.get_running_loop().run_in_executor(self.executor, task, data)
+        future.add_done_callback(lambda f: self.task_done(command, data, f))
+    
+    def task_done(self, command: bytes, data: T.Any, future: asyncio.Future) -> None:
+        self.running -= 1
+        if future.cancelled() or self.transport.is_closing():
+            return
+        if future.exception() is not None:
+            self.task_failed(command, data, future.exception())
+        else:
+            self.send_command(command=TASKS[command][1], data=future.result())
+        self.start_tasks()
+    
+    def task_failed(self, command: bytes, data: T.Any, error: BaseException) -> None:
+        # 失敗も完了と同じく枠を 1 つ空けるので、サーバーはクレジットを戻して次のタスクを送ってくる
+        job_id, (_, task_id) = task_ref(command, data)
+        print(f"Task failed: {command.decode()} {task_id}: {error!r}")
+        self.send_command(
+            command=FAILED_COMMAND, data=(job_id, (command, task_id), repr(error))
+        )
+    
     def mapfn(self, filename: str) -> T.Dict[str, T.List[int]]:
         print(f"Running map for {filename}")
         word_counts: T.Dict[str, T.List[int]] = {}
@@ -40,69 +146,62 @@ class Worker(Protocol):
                 words = re.split("\W+", line)
                 for word in words:
                     word = word.lower()
-                    if word != " ":
+                    if word:
                         if word not in word_counts:
                             word_counts[word] = []
                         word_counts[word].append(1)
         # 各単語に対して1をカウント 結果: {"word": [1, 1, 1], ...}
         return word_counts
-
+    
     def combinefn(self, results: T.Dict[str, T.List[int]]) -> Occurrences:
         combined_results: Occurrences = {}
         for key in results.keys():
             combined_results[key] = sum(results[key])
         # 同じ単語のカウントを合計 結果: {"word": 3, ...}
         return combined_results
-    
-    def reducefn(self, map_files: T.Dict[str, str]) -> Occurrences:
-        # 複数のMap結果ファイルを読み込み
-        # 全ファイルの単語カウントを合計し、最終的な単語頻度を計算
-        reduced_redult: Occurrences = {}
-        for filename in map_files.values():
-            with open(filename, "r") as f:
-                print(f"Running reduce for {filename}")
-                d = json.load(f)
-                for k, v in d.items():
-                    reduced_redult[k] = v + reduced_redult.get(k, 0)
-        return reduced_redult
-    
-    def handle_map_request(self, map_file: FileWithId) -> None:
-        print(f"Mapping {map_file}")
-        temp_results = self.mapfn(map_file[1])
-        results = self.combinefn(temp_results)
-        temp_file = self.save_map_results(results)
-        self.send_command(
-            command=b"mapdone", data=(map_file[0], temp_file)
-        )
-    
-    def save_map_results(self, results: Occurrences) -> str:
-        temp_dir = self.get_temp_dir()
-        temp_file = os.path.join(temp_dir, f"{uuid4()}.json")
-        print(f"Saving to {temp_file}")
-        with open(temp_file, "w") as f:
-            d = json.dumps(results)
-            f.write(d)
-        print(f"Saved to {temp_file}")
-        return temp_file
-    
-    def handle_reduce_request(self, data: T.Dict[str, str]) -> None:
-        results = self.reducefn(data)
-        with open(RESULT_FILENAME, "w") as f:
-            d = json.dumps(results)
-            f.write(d)
-        self.send_command(command=b"reducedone", data=("0", RESULT_FILENAME))
 
 def main():
     # ワーカープロセスが起動
     # 自動的にサーバーに接続
     # タスクの割り当てを待機
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--processes", type=int, nargs="?", const=os.cpu_count(), default=0,
+        help="map/reduce をプロセスプールで実行する（値を省略するとコア数）",
+    )
+    parser.add_argument(
+        "--data-dir", action="append", default=[], dest="data_dirs",
+        help="このホストのローカルディスクにある入力データのディレクトリ（複数指定可）",
+    )
+    parser.add_argument(
+        "--loop", choices=LOOPS, default="asyncio",
+        help="イベントループの実装（uvloop は別途インストールが必要）",
+    )
+    args = parser.parse_args()
+    
+    # タスクをイベントループ上で直接実行するとハートビートが送れなくなるので、
+    # プロセスプールを使わない場合も1スレッドのエグゼキュータで実行する
+    executor: Executor = ThreadPoolExecutor(1)
+    window = WINDOW
+    slots = 1
+    if args.processes:
+        executor = ProcessPoolExecutor(args.processes)
+        # 全プロセスが常にタスクを持てるよう、プロセス数より1つ多く受け取る
+        window = args.processes + 1
+        slots = args.processes
+    
     # 1. サーバーに接続（完了まで待機）
-    event_loop = asyncio.get_event_loop()
-    coro = event_loop.create_connection(Worker, HOST, PORT)
+    event_loop = new_event_loop(args.loop)
+    coro = event_loop.create_connection(
+        lambda: Worker(window, executor, args.data_dirs, slots), HOST, PORT
+    )
     event_loop.run_until_complete(coro)
     # 2. 永久ループ開始
-    event_loop.run_forever()
-    event_loop.close()
+    try:
+        event_loop.run_forever()
+    finally:
+        executor.shutdown()
+        event_loop.close()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
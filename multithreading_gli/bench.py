@@ -0,0 +1,295 @@
+import sys
+import json
+import time
+import math
+import platform
+import argparse
+import statistics
+import multiprocessing
+import typing as T
+from threading import Thread
+
+try:
+    import resource
+except ImportError:  # Windows ではピーク RSS を測らない
+    resource = None  # type: ignore[assignment]
+
+import workloads
+import vectorized
+
+# 各スクリプトの処理（workloads.py）をまとめて測るベンチマーク
+#   python bench.py [-k PATTERN] [--threads 1,2,4] [--warmup W] [--repeat R] [--scale S]
+#                   [--json FILE] [--baseline FILE] [--threshold 0.05] [--normalize]
+#
+# ケースは (処理, 大きさ, スレッド数) の組で、スレッド数の分だけ同じ処理を別々のスレッドで同時に実行する
+# （各スクリプトの Thread の使い方と同じ）。ケースごとに新しいプロセスで
+#   1. warmup 回実行して捨てる
+#   2. repeat 回、経過時間（perf_counter）と CPU 時間（process_time、全スレッドの合計）を測る
+#   3. 最後にピーク RSS を読む
+# 経過時間の平均には t 分布による 95% 信頼区間を付ける。
+# --json で結果を書き出し、--baseline で以前の結果と比べて、信頼区間が重ならずに threshold 以上
+# 遅くなったケースを回帰として報告する（終了コード 1）。
+# 別のマシンの結果と比べるときは --normalize で、各実行の最初に測る較正用の処理の時間で割った値を比べる。
+
+THREAD_COUNTS = (1, 2, 4)
+WARMUP = 1
+REPEAT = 5
+THRESHOLD = 0.05
+CALIBRATION_SIZE = 200000
+CALIBRATION_RUNS = 5
+
+# 自由度 → 両側 95% の t 値（表にない自由度はその下の値を使うので、区間は広めになる）
+T_95 = {
+    1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365, 8: 2.306,
+    9: 2.262, 10: 2.228, 12: 2.179, 15: 2.131, 20: 2.086, 30: 2.042, 60: 2.000, 120: 1.980,
+}
+
+class Case(T.NamedTuple):
+    name: str
+    func: T.Callable[..., T.Any]
+    params: T.Dict[str, T.Any]
+    size_key: str  # --scale で大きさを変える引数
+
+# 1 スレッド分の処理が 0.1 秒前後になる大きさ（元のスクリプトの 1/10〜1/100）
+CASES = [
+    Case("sqrt_sum", workloads.sqrt_sum, {"n": 10**6}, "n"),
+    Case(
+        "sqrt_sum_with_release", workloads.sqrt_sum_with_release,
+        {"blocks": 10, "block_size": 10**5}, "blocks",
+    ),
+    Case("strict_cpu", workloads.strict_cpu, {"n": 10**6}, "n"),
+    Case(
+        "strict_cpu_with_release", workloads.strict_cpu_with_release,
+        {"n": 10**6, "release_every": 10**5}, "n",
+    ),
+    Case("long_cpu", workloads.long_cpu, {"n": 10**6}, "n"),
+    Case("simple", workloads.simple_sum, {"n": 10**6}, "n"),
+    Case("memory_intensive", workloads.memory_intensive, {"n": 10**6}, "n"),
+    Case("random", workloads.random_sum, {"n": 2 * 10**5}, "n"),
+    Case("cache_friendly", workloads.cache_friendly, {"n": 10**6}, "n"),
+    Case("cache_unfriendly", workloads.cache_unfriendly, {"n": 10**6}, "n"),
+    Case("io_sleep", workloads.io_sleep, {"seconds": 0.1}, "seconds"),
+]
+# NumPy があれば、ベクトル化した版（vectorized.py）も元のケースと同じ大きさで測る
+if vectorized.np is not None:
+    CASES += [
+        Case(f"{case.name}_numpy", vectorized.VARIANTS[case.func], case.params, case.size_key)
+        for case in list(CASES) if case.func in vectorized.VARIANTS
+    ]
+
+def case_id(case: Case, threads: int) -> str:
+    return f"{case.name}[threads={threads}]"
+
+def scaled_params(case: Case, scale: float) -> T.Dict[str, T.Any]:
+    """size_key の引数を scale 倍にした引数"""
+    params = dict(case.params)
+    size = params[case.size_key] * scale
+    if isinstance(params[case.size_key], int):
+        size = max(1, round(size))
+    params[case.size_key] = size
+    return params
+
+def run_threads(func: T.Callable[..., T.Any], params: T.Dict[str, T.Any], threads: int) -> None:
+    """同じ処理を threads 個のスレッドで同時に実行し、全部終わるまで待つ"""
+    workers = [Thread(target=func, kwargs=params, name=f"Bench-{i}") for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+def peak_rss_mb() -> T.Optional[float]:
+    """このプロセスのピーク RSS（MB）"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux は KB、macOS はバイト
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+def measure(
+    func: T.Callable[..., T.Any], params: T.Dict[str, T.Any], threads: int,
+    warmup: int, repeat: int,
+) -> T.Dict[str, T.Any]:
+    """子プロセスで実行される。warmup 回捨ててから repeat 回測る"""
+    start_rss = peak_rss_mb()
+    for _ in range(warmup):
+        run_threads(func, params, threads)
+    wall: T.List[float] = []
+    cpu: T.List[float] = []
+    for _ in range(repeat):
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        run_threads(func, params, threads)
+        cpu.append(time.process_time() - cpu_start)
+        wall.append(time.perf_counter() - wall_start)
+    return {"wall": wall, "cpu": cpu, "start_rss_mb": start_rss, "peak_rss_mb": peak_rss_mb()}
+
+def measure_in_child(queue: T.Any, *args: T.Any) -> None:
+    queue.put(measure(*args))
+
+def run_isolated(*args: T.Any) -> T.Dict[str, T.Any]:
+    """前のケースのメモリやスレッドが残らないよう、ケースごとに新しいプロセスで測る"""
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=measure_in_child, args=(queue, *args))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+def summarize(samples: T.List[float]) -> T.Dict[str, float]:
+    """平均・標準偏差・中央値・最小値と、平均の 95% 信頼区間の半幅"""
+    mean = statistics.fmean(samples)
+    stdev = statistics.stdev(samples) if len(samples) > 1 else 0.0
+    df = len(samples) - 1
+    ci95 = 0.0
+    if df > 0:
+        t = T_95[max(k for k in T_95 if k <= df)]
+        ci95 = t * stdev / math.sqrt(len(samples))
+    return {
+        "mean": mean, "stdev": stdev, "median": statistics.median(samples),
+        "min": min(samples), "ci95": ci95,
+    }
+
+def calibrate() -> float:
+    """マシンの速さの目安: 決まった大きさの strict_cpu の最短時間"""
+    times = []
+    for _ in range(CALIBRATION_RUNS):
+        start = time.perf_counter()
+        workloads.strict_cpu(CALIBRATION_SIZE)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def machine_info() -> T.Dict[str, T.Any]:
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", None)
+    return {
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "cpu_count": multiprocessing.cpu_count(),
+        "gil_enabled": is_gil_enabled() if is_gil_enabled is not None else True,
+    }
+
+def run_cases(args: argparse.Namespace) -> T.Dict[str, T.Any]:
+    results: T.Dict[str, T.Any] = {}
+    print(
+        f"{'Case':<40} {'Mean(ms)':>10} {'±95%':>8} {'CPU(ms)':>10} {'PeakRSS(MB)':>12}"
+    )
+    print("-" * 84)
+    for case in CASES:
+        for threads in args.threads:
+            name = case_id(case, threads)
+            if args.k and args.k not in name:
+                continue
+            params = scaled_params(case, args.scale)
+            measured = run_isolated(case.func, params, threads, args.warmup, args.repeat)
+            wall = summarize(measured["wall"])
+            cpu = summarize(measured["cpu"])
+            results[name] = dict(
+                measured, name=case.name, params=params, threads=threads,
+                stats=wall, cpu_stats=cpu,
+            )
+            rss = measured["peak_rss_mb"]
+            print(
+                f"{name:<40} {wall['mean'] * 1000:>10.1f} {wall['ci95'] * 1000:>8.1f} "
+                f"{cpu['mean'] * 1000:>10.1f} {rss if rss is not None else float('nan'):>12.1f}"
+            )
+    return results
+
+def compare(
+    current: T.Dict[str, T.Any], baseline: T.Dict[str, T.Any],
+    threshold: float, normalize: bool,
+) -> T.List[str]:
+    """両方にあるケースの平均を比べて表示し、回帰したケースの名前を返す"""
+    current_scale = current["calibration"] if normalize else 1.0
+    baseline_scale = baseline["calibration"] if normalize else 1.0
+    unit = "x calibration" if normalize else "ms"
+    factor = 1.0 if normalize else 1000.0
+    print(f"\nComparison with baseline ({unit}, threshold {threshold:.0%})")
+    print(f"{'Case':<40} {'Baseline':>10} {'Current':>10} {'Change':>8}  Verdict")
+    print("-" * 84)
+    regressions = []
+    for name, result in current["cases"].items():
+        if name not in baseline["cases"]:
+            continue
+        old = baseline["cases"][name]["stats"]
+        new = result["stats"]
+        old_mean, old_ci = old["mean"] / baseline_scale, old["ci95"] / baseline_scale
+        new_mean, new_ci = new["mean"] / current_scale, new["ci95"] / current_scale
+        change = new_mean / old_mean - 1
+        # 閾値を超えていても、信頼区間が重なっていればノイズとみなす
+        verdict = ""
+        if change > threshold and new_mean - new_ci > old_mean + old_ci:
+            verdict = "REGRESSION"
+            regressions.append(name)
+        elif change < -threshold and new_mean + new_ci < old_mean - old_ci:
+            verdict = "improved"
+        print(
+            f"{name:<40} {old_mean * factor:>10.2f} {new_mean * factor:>10.2f} "
+            f"{change:>+8.1%}  {verdict}"
+        )
+    return regressions
+
+def parse_counts(text: str) -> T.List[int]:
+    return [int(count) for count in text.split(",")]
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-k", help="ケース名（例: strict_cpu[threads=2]）に含まれる文字列で絞り込む")
+    parser.add_argument(
+        "--threads", type=parse_counts, default=list(THREAD_COUNTS),
+        help="カンマ区切りのスレッド数",
+    )
+    parser.add_argument("--warmup", type=int, default=WARMUP, help="捨てる実行の回数")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="測る実行の回数")
+    parser.add_argument("--scale", type=float, default=1.0, help="処理の大きさの倍率")
+    parser.add_argument("--json", help="結果を書き出す JSON ファイル")
+    parser.add_argument("--baseline", help="比べる以前の結果（--json で書き出したもの）")
+    parser.add_argument(
+        "--threshold", type=float, default=THRESHOLD, help="回帰とみなす遅くなった割合",
+    )
+    parser.add_argument(
+        "--normalize", action="store_true",
+        help="較正用の処理の時間で割ってから比べる（別のマシンの結果と比べるとき）",
+    )
+    parser.add_argument("--list", action="store_true", help="ケースの一覧を表示して終わる")
+    args = parser.parse_args()
+    
+    if args.list:
+        for case in CASES:
+            for threads in args.threads:
+                print(case_id(case, threads))
+        return
+    
+    machine = machine_info()
+    calibration = calibrate()
+    print("=" * 84)
+    print(
+        f"Python {machine['python']} ({machine['implementation']}), "
+        f"{machine['cpu_count']} CPUs, GIL {'enabled' if machine['gil_enabled'] else 'disabled'}"
+    )
+    print(
+        f"warmup {args.warmup}, repeat {args.repeat}, scale {args.scale}, "
+        f"calibration {calibration * 1000:.1f}ms"
+    )
+    print("=" * 84)
+    report = {
+        "machine": machine,
+        "settings": {"warmup": args.warmup, "repeat": args.repeat, "scale": args.scale},
+        "calibration": calibration,
+        "cases": run_cases(args),
+    }
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {args.json}")
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold, args.normalize)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
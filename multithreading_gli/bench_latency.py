@@ -0,0 +1,367 @@
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import threading
+import multiprocessing
+import typing as T
+
+import workloads
+from bench import machine_info
+from bench_matrix import default_worker_counts, parse_list
+from executors import BACKENDS, PoolBackend
+from gil_profiler import CHUNK, ThreadLog, cpu_worker, percentile
+
+# CPU の処理と同時に動く I/O（asyncio のイベントループ）の応答の遅れを測る
+#   python bench_latency.py [--modes threads,processes,...] [--workers 1,2,4] [--probes lag,echo]
+#                           [--duration S] [--interval MS] [--budget MS] [--json FILE]
+#
+# cpu_vs_io_bound.py は CPU の処理と I/O の処理を別々に測るが、サーバー（map_and_reduce/server.py）で
+# 問題になるのは、イベントループのスレッドが CPU の処理の後ろで待たされる場合。
+# ここではイベントループにプローブを置き、CPU のワーカーを N 個動かしながらプローブの遅延を測る。
+#
+# プローブ:
+#   lag:  asyncio.sleep(interval) が予定より何秒遅れて戻ったか（ループの遅れ）
+#   echo: ループ上のエコーサーバーに、別のプロセスのクライアントが interval ごとに送って返ってくるまでの往復時間
+# CPU の負荷（モード）:
+#   none:               負荷なし（基準）
+#   threads:            同じプロセスのスレッドで CPU 処理（ループのスレッドと GIL を取り合う）
+#   processes:          別のプロセスで CPU 処理（GIL は取り合わず、コアだけを取り合う）
+#   executor-threads:   ループから run_in_executor で ThreadPoolExecutor に投げる
+#   executor-processes: ループから run_in_executor で ProcessPoolExecutor に投げる
+#   on-loop:            ループの中で直接 CPU 処理をする（やってはいけない例）
+# executor-* は executors.py のバックエンドの Executor を使い、常にワーカー数だけの処理を投げておく。
+#
+# p999 は 1000 個以上のサンプルがないと最大値とほぼ同じになる（--duration / --interval で調整する）。
+# ループが止まっている間はプローブも止まるのでサンプルが減り、遅れが大きいほど分位点は控えめに出る（Samples の列を見る）。
+# --budget のミリ秒以内に p99 が収まる最大のワーカー数を、モードごとに最後に表示する。
+
+MODES = ("none", "threads", "processes", "executor-threads", "executor-processes", "on-loop")
+PROBES = ("lag", "echo")
+DURATION = 3.0
+WARMUP = 0.5  # 負荷を始めてから測り始めるまでの秒数（プロセスの起動を待つ）
+PROBE_INTERVAL = 0.001
+TASK_SIZE = 10**5  # executor-* と on-loop で 1 回に投げる strict_cpu のループ回数（10ms 前後）
+PAYLOAD_SIZE = 64
+BUDGET_MS = 10.0
+QUANTILES = (("p50", 0.50), ("p99", 0.99), ("p999", 0.999))
+
+def process_worker(stop: T.Any, results: T.Any) -> None:
+    """processes のワーカー: 止められるまで strict_cpu を CHUNK 回ずつ実行し、ループの回数を返す"""
+    chunks = 0
+    while not stop.is_set():
+        workloads.strict_cpu(CHUNK)
+        chunks += 1
+    results.put(chunks * CHUNK)
+
+class Load:
+    """ワーカー数 workers の CPU 負荷。start で始め、stop で止めて実行したループの回数を返す"""
+    name = ""
+    
+    def __init__(self, workers: int) -> None:
+        self.workers = workers
+    
+    def start(self) -> None:
+        pass
+    
+    async def stop(self) -> int:
+        return 0
+
+class ThreadLoad(Load):
+    name = "threads"
+    
+    def start(self) -> None:
+        self.logs: T.List[ThreadLog] = [[] for _ in range(self.workers)]
+        self.stop_event = threading.Event()
+        self.threads = [
+            threading.Thread(
+                target=cpu_worker, args=(self.logs[i], self.stop_event), name=f"CPU-{i}",
+            )
+            for i in range(self.workers)
+        ]
+        for thread in self.threads:
+            thread.start()
+    
+    async def stop(self) -> int:
+        self.stop_event.set()
+        for thread in self.threads:
+            thread.join()
+        return sum(len(log) for log in self.logs) * CHUNK
+
+class ProcessLoad(Load):
+    name = "processes"
+    
+    def start(self) -> None:
+        context = multiprocessing.get_context("spawn")
+        self.stop_event = context.Event()
+        self.results = context.Queue()
+        self.processes = [
+            context.Process(target=process_worker, args=(self.stop_event, self.results))
+            for _ in range(self.workers)
+        ]
+        for process in self.processes:
+            process.start()
+    
+    async def stop(self) -> int:
+        self.stop_event.set()
+        done = sum(self.results.get() for _ in self.processes)
+        for process in self.processes:
+            process.join()
+        return done
+
+class ExecutorLoad(Load):
+    """ループから run_in_executor で TASK_SIZE の処理を投げ続ける（常に workers 個が実行中）"""
+    backend = ""
+    
+    def start(self) -> None:
+        self.pool = T.cast(PoolBackend, BACKENDS[self.backend](self.workers))
+        self.stopping = False
+        self.done = 0
+        self.feeders = [asyncio.create_task(self.feed()) for _ in range(self.workers)]
+    
+    async def feed(self) -> None:
+        loop = asyncio.get_running_loop()
+        while not self.stopping:
+            await loop.run_in_executor(self.pool.executor, workloads.strict_cpu, TASK_SIZE)
+            self.done += TASK_SIZE
+    
+    async def stop(self) -> int:
+        self.stopping = True
+        await asyncio.gather(*self.feeders)
+        self.pool.close()
+        return self.done
+
+class ExecutorThreadLoad(ExecutorLoad):
+    name = "executor-threads"
+    backend = "threads"
+
+class ExecutorProcessLoad(ExecutorLoad):
+    name = "executor-processes"
+    backend = "processes"
+
+class OnLoopLoad(Load):
+    """ループの中で TASK_SIZE の処理を直接実行する（その間ループは何もできない）"""
+    name = "on-loop"
+    
+    def start(self) -> None:
+        self.stopping = False
+        self.done = 0
+        self.tasks = [asyncio.create_task(self.spin()) for _ in range(self.workers)]
+    
+    async def spin(self) -> None:
+        while not self.stopping:
+            workloads.strict_cpu(TASK_SIZE)
+            self.done += TASK_SIZE
+            await asyncio.sleep(0)
+    
+    async def stop(self) -> int:
+        self.stopping = True
+        await asyncio.gather(*self.tasks)
+        return self.done
+
+LOADS: T.Dict[str, T.Type[Load]] = {
+    "none": Load,
+    **{
+        load.name: load
+        for load in (ThreadLoad, ProcessLoad, ExecutorThreadLoad, ExecutorProcessLoad, OnLoopLoad)
+    },
+}
+
+async def lag_probe(interval: float, duration: float) -> T.List[float]:
+    latencies = []
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        before = time.perf_counter()
+        await asyncio.sleep(interval)
+        latencies.append(time.perf_counter() - before - interval)
+    return latencies
+
+async def echo(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        while True:
+            data = await reader.read(PAYLOAD_SIZE)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+    finally:
+        writer.close()
+
+def echo_client(port: int, interval: float, duration: float, results: T.Any) -> None:
+    """echo プローブのクライアント（別のプロセス）: interval ごとに送り、返ってくるまでの時間を返す"""
+    latencies = []
+    payload = b"x" * PAYLOAD_SIZE
+    with socket.create_connection(("127.0.0.1", port)) as sock:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            before = time.perf_counter()
+            sock.sendall(payload)
+            received = 0
+            while received < PAYLOAD_SIZE:
+                chunk = sock.recv(PAYLOAD_SIZE - received)
+                if not chunk:
+                    raise ConnectionError("echo server closed the connection")
+                received += len(chunk)
+            latencies.append(time.perf_counter() - before)
+            time.sleep(interval)
+    results.put(latencies)
+
+async def echo_probe(interval: float, duration: float) -> T.List[float]:
+    server = await asyncio.start_server(echo, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    client = context.Process(target=echo_client, args=(port, interval, duration, results))
+    client.start()
+    try:
+        # queue.get はブロックするので、ループを止めないよう別のスレッドで待つ
+        latencies = await asyncio.get_running_loop().run_in_executor(None, results.get)
+    finally:
+        client.join()
+        server.close()
+        await server.wait_closed()
+    return latencies
+
+PROBE_FUNCS: T.Dict[str, T.Callable[[float, float], T.Awaitable[T.List[float]]]] = {
+    "lag": lag_probe,
+    "echo": echo_probe,
+}
+
+async def run_scenario(
+    mode: str, workers: int, probes: T.List[str], duration: float, interval: float
+) -> T.Dict[str, T.Any]:
+    """負荷をかけたまま、全部のプローブを同時に duration 秒動かす"""
+    load = LOADS[mode](workers)
+    load.start()
+    await asyncio.sleep(WARMUP)
+    started = time.perf_counter()
+    try:
+        latencies = await asyncio.gather(*[PROBE_FUNCS[probe](interval, duration) for probe in probes])
+    finally:
+        done = await load.stop()
+    elapsed = time.perf_counter() - started
+    return {
+        "mode": mode,
+        "workers": workers,
+        # 負荷の処理はウォームアップの間も進んでいるので、その分も含めた時間で割る
+        "cpu_loops_per_second": done / (elapsed + WARMUP),
+        "probes": {
+            probe: summarize(values) for probe, values in zip(probes, latencies)
+        },
+    }
+
+def summarize(latencies: T.List[float]) -> T.Dict[str, float]:
+    stats = {name: percentile(latencies, q) * 1000 for name, q in QUANTILES}
+    stats["max"] = max(latencies, default=0.0) * 1000
+    stats["samples"] = len(latencies)
+    return stats
+
+def max_workers_within(
+    results: T.List[T.Dict[str, T.Any]], mode: str, probe: str, budget_ms: float
+) -> T.Optional[int]:
+    """p99 が budget_ms 以内だった最大のワーカー数（1 つもなければ None）"""
+    within = [
+        result["workers"] for result in results
+        if result["mode"] == mode and result["probes"][probe]["p99"] <= budget_ms
+    ]
+    return max(within, default=None)
+
+def print_report(
+    results: T.List[T.Dict[str, T.Any]], probes: T.List[str], budget_ms: float
+) -> None:
+    baseline = {
+        probe: result["probes"][probe]["p99"]
+        for result in results if result["mode"] == "none"
+        for probe in probes
+    }
+    print(
+        f"\n{'Mode':<19} {'Workers':>7} {'Probe':<5} {'Samples':>8} {'p50(ms)':>8} {'p99(ms)':>8} "
+        f"{'p999(ms)':>9} {'Max(ms)':>8} {'vs none':>8} {'CPU M loops/s':>14}"
+    )
+    print("-" * 104)
+    for result in results:
+        for probe in probes:
+            stats = result["probes"][probe]
+            base = baseline.get(probe)
+            print(
+                f"{result['mode']:<19} {result['workers']:>7} {probe:<5} {stats['samples']:>8} "
+                f"{stats['p50']:>8.3f} {stats['p99']:>8.3f} {stats['p999']:>9.3f} "
+                f"{stats['max']:>8.3f} "
+                + (f"{stats['p99'] / base:>7.1f}x" if base else f"{'-':>8}")
+                + f" {result['cpu_loops_per_second'] / 1e6:>14.2f}"
+            )
+    
+    print(f"\nMax workers with p99 <= {budget_ms:g}ms")
+    modes = list(dict.fromkeys(result["mode"] for result in results if result["mode"] != "none"))
+    print(f"{'Mode':<19} " + " ".join(f"{probe:>6}" for probe in probes))
+    for mode in modes:
+        cells = []
+        for probe in probes:
+            workers = max_workers_within(results, mode, probe, budget_ms)
+            cells.append(f"{workers:>6}" if workers is not None else f"{'-':>6}")
+        print(f"{mode:<19} " + " ".join(cells))
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--modes", type=parse_list, default=list(MODES),
+        help="カンマ区切りの負荷の種類（" + ", ".join(MODES) + "）",
+    )
+    parser.add_argument(
+        "--workers", type=lambda text: [int(w) for w in parse_list(text)],
+        default=default_worker_counts(), help="カンマ区切りの CPU ワーカー数（既定は 1..コア数）",
+    )
+    parser.add_argument(
+        "--probes", type=parse_list, default=list(PROBES),
+        help="カンマ区切りのプローブ（" + ", ".join(PROBES) + "）",
+    )
+    parser.add_argument("--duration", type=float, default=DURATION, help="1 つの設定で測る秒数")
+    parser.add_argument(
+        "--interval", type=float, default=PROBE_INTERVAL * 1000, help="プローブの間隔（ミリ秒）",
+    )
+    parser.add_argument(
+        "--switch-interval", type=float, help="sys.setswitchinterval の値（ミリ秒、既定は変えない）",
+    )
+    parser.add_argument(
+        "--budget", type=float, default=BUDGET_MS, help="許容する p99 の遅延（ミリ秒）",
+    )
+    parser.add_argument("--json", help="結果を書き出す JSON ファイル")
+    args = parser.parse_args()
+    
+    for name, values, known in (("modes", args.modes, MODES), ("probes", args.probes, PROBES)):
+        unknown = set(values) - set(known)
+        if unknown:
+            parser.error(f"unknown {name}: {', '.join(sorted(unknown))}")
+    if args.switch_interval is not None:
+        sys.setswitchinterval(args.switch_interval / 1000)
+    interval = args.interval / 1000
+    
+    machine = machine_info()
+    print(
+        f"Python {machine['python']} ({machine['implementation']}), "
+        f"{machine['cpu_count']} CPUs, GIL {'enabled' if machine['gil_enabled'] else 'disabled'}, "
+        f"switch interval {sys.getswitchinterval() * 1000:g}ms, probe interval {args.interval:g}ms"
+    )
+    # 負荷なしは常に最初に 1 回測り、他のモードの基準にする
+    scenarios = [("none", 0)] + [
+        (mode, workers) for mode in args.modes if mode != "none" for workers in args.workers
+    ]
+    results = []
+    for mode, workers in scenarios:
+        result = asyncio.run(run_scenario(mode, workers, args.probes, args.duration, interval))
+        results.append(result)
+        summary = ", ".join(
+            f"{probe} p99 {stats['p99']:.3f}ms" for probe, stats in result["probes"].items()
+        )
+        print(f"  {mode} x{workers}: {summary}")
+    print_report(results, args.probes, args.budget)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"machine": machine, "budget_ms": args.budget, "results": results}, f, indent=2)
+        print(f"\nWrote {args.json}")
+
+if __name__ == "__main__":
+    main()
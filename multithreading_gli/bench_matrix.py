@@ -0,0 +1,164 @@
+import os
+import json
+import argparse
+import typing as T
+
+from bench import CASES, Case, scaled_params, summarize, machine_info
+from executors import BACKENDS, Backend
+
+# 同じ処理をバックエンド（executors.py）とワーカー数を変えて実行し、スケーリングを比べる
+#   python bench_matrix.py [--cases strict_cpu,long_cpu] [--backends threads,processes]
+#                          [--workers 1,2,4] [--tasks-per-worker T] [--repeat R] [--json FILE]
+#
+# ワーカー数 w のとき w × tasks_per_worker 個の処理を投げる（1 ワーカーあたりの仕事量は一定）。
+#   Tasks/s:    1 秒あたりに終わった処理の数
+#   Speedup:    同じバックエンドの 1 ワーカーのときの Tasks/s に対する倍率（理想は w 倍）
+#   Efficiency: Speedup / w
+# 使えないバックエンド（サブインタプリタは 3.12 以降、free-threaded は GIL のないビルドが必要）は理由を表示して飛ばす。
+
+DEFAULT_CASES = ("strict_cpu", "long_cpu", "memory_intensive", "io_sleep")
+TASKS_PER_WORKER = 1
+WARMUP = 1
+REPEAT = 3
+MAX_CONTIGUOUS_WORKERS = 8  # これ以下のコア数なら 1..N 全部、それより多ければ 2 の累乗と N
+
+def default_worker_counts() -> T.List[int]:
+    cores = os.cpu_count() or 1
+    if cores <= MAX_CONTIGUOUS_WORKERS:
+        return list(range(1, cores + 1))
+    counts = [1 << i for i in range(cores.bit_length()) if 1 << i < cores]
+    return counts + [cores]
+
+def parse_list(text: str) -> T.List[str]:
+    return [item for item in text.split(",") if item]
+
+def measure(
+    backend: Backend, case: Case, params: T.Dict[str, T.Any], tasks: int,
+    warmup: int, repeat: int,
+) -> T.List[float]:
+    for _ in range(warmup):
+        backend.run(case.func, params, tasks)
+    return [backend.run(case.func, params, tasks) for _ in range(repeat)]
+
+def run_matrix(
+    args: argparse.Namespace, cases: T.List[Case]
+) -> T.Dict[str, T.Dict[str, T.Dict[int, T.Dict[str, T.Any]]]]:
+    """ケース名 → バックエンド → ワーカー数 → 結果"""
+    results: T.Dict[str, T.Dict[str, T.Dict[int, T.Dict[str, T.Any]]]] = {
+        case.name: {} for case in cases
+    }
+    for name in args.backends:
+        reason = BACKENDS[name].unavailable()
+        if reason is not None:
+            print(f"Skipping {name}: {reason}")
+            continue
+        for workers in args.workers:
+            # プロセスやサブインタプリタの起動は測らないよう、バックエンドはケースをまたいで使い回す
+            backend = BACKENDS[name](workers)
+            try:
+                for case in cases:
+                    tasks = workers * args.tasks_per_worker
+                    params = scaled_params(case, args.scale)
+                    samples = measure(backend, case, params, tasks, args.warmup, args.repeat)
+                    stats = summarize(samples)
+                    results[case.name].setdefault(name, {})[workers] = {
+                        "tasks": tasks, "params": params, "samples": samples, "stats": stats,
+                        "tasks_per_second": tasks / stats["mean"],
+                    }
+                    print(f"  {name} x{workers} {case.name}: {stats['mean'] * 1000:.1f}ms")
+            finally:
+                backend.close()
+    return results
+
+def add_scaling(results: T.Dict[str, T.Dict[str, T.Dict[int, T.Dict[str, T.Any]]]]) -> None:
+    """1 ワーカーのときに対する Speedup と Efficiency を書き足す"""
+    for backends in results.values():
+        for by_workers in backends.values():
+            base = by_workers.get(1)
+            for workers, result in by_workers.items():
+                speedup = result["tasks_per_second"] / base["tasks_per_second"] if base else None
+                result["speedup"] = speedup
+                result["efficiency"] = speedup / workers if speedup is not None else None
+
+def print_report(
+    results: T.Dict[str, T.Dict[str, T.Dict[int, T.Dict[str, T.Any]]]], worker_counts: T.List[int]
+) -> None:
+    for case_name, backends in results.items():
+        print("\n" + "=" * 78)
+        print(case_name)
+        print("=" * 78)
+        print(
+            f"{'Backend':<16} {'Workers':>7} {'Time(ms)':>10} {'±95%':>8} {'Tasks/s':>9} "
+            f"{'Speedup':>8} {'Efficiency':>10}"
+        )
+        print("-" * 78)
+        for name, by_workers in backends.items():
+            for workers, result in by_workers.items():
+                stats = result["stats"]
+                speedup = result["speedup"]
+                print(
+                    f"{name:<16} {workers:>7} {stats['mean'] * 1000:>10.1f} "
+                    f"{stats['ci95'] * 1000:>8.1f} {result['tasks_per_second']:>9.2f} "
+                    + (
+                        f"{speedup:>7.2f}x {result['efficiency']:>10.0%}"
+                        if speedup is not None else f"{'-':>8} {'-':>10}"
+                    )
+                )
+        # スケーリング曲線: 行がバックエンド、列がワーカー数
+        print("\nSpeedup by workers")
+        print(f"{'Backend':<16} " + " ".join(f"{w:>6}" for w in worker_counts))
+        for name, by_workers in backends.items():
+            cells = []
+            for workers in worker_counts:
+                speedup = by_workers.get(workers, {}).get("speedup")
+                cells.append(f"{speedup:>5.2f}x" if speedup is not None else f"{'-':>6}")
+            print(f"{name:<16} " + " ".join(cells))
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--cases", type=parse_list, default=list(DEFAULT_CASES),
+        help="カンマ区切りのケース名（bench.py --list の [] の前の部分）",
+    )
+    parser.add_argument(
+        "--backends", type=parse_list, default=list(BACKENDS),
+        help="カンマ区切りのバックエンド（" + ", ".join(BACKENDS) + "）",
+    )
+    parser.add_argument(
+        "--workers", type=lambda text: [int(w) for w in parse_list(text)],
+        default=default_worker_counts(), help="カンマ区切りのワーカー数（既定は 1..コア数）",
+    )
+    parser.add_argument(
+        "--tasks-per-worker", type=int, default=TASKS_PER_WORKER,
+        help="1 ワーカーあたりの処理の数",
+    )
+    parser.add_argument("--warmup", type=int, default=WARMUP, help="捨てる実行の回数")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="測る実行の回数")
+    parser.add_argument("--scale", type=float, default=1.0, help="処理の大きさの倍率")
+    parser.add_argument("--json", help="結果を書き出す JSON ファイル")
+    args = parser.parse_args()
+    
+    unknown = set(args.backends) - set(BACKENDS)
+    if unknown:
+        parser.error(f"unknown backends: {', '.join(sorted(unknown))}")
+    cases = [case for case in CASES if case.name in args.cases]
+    if len(cases) != len(args.cases):
+        known = {case.name for case in CASES}
+        parser.error(f"unknown cases: {', '.join(c for c in args.cases if c not in known)}")
+    
+    machine = machine_info()
+    print(
+        f"Python {machine['python']} ({machine['implementation']}), "
+        f"{machine['cpu_count']} CPUs, GIL {'enabled' if machine['gil_enabled'] else 'disabled'}, "
+        f"workers {args.workers}"
+    )
+    results = run_matrix(args, cases)
+    add_scaling(results)
+    print_report(results, args.workers)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"machine": machine, "results": results}, f, indent=2)
+        print(f"\nWrote {args.json}")
+
+if __name__ == "__main__":
+    main()
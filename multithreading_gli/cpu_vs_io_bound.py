@@ -1,7 +1,8 @@
 import time
 import threading
 from threading import Thread
-import math
+
+from workloads import sqrt_sum
 
 def cpu_intensive_task(i: int) -> None:
     """CPUを集中的に使用する処理（GILのタイムスライスにより並行実行される）"""
@@ -10,9 +11,7 @@ def cpu_intensive_task(i: int) -> None:
     start_time = time.time()
     
     # CPUを集中的に使用する計算処理
-    result = 0
-    for j in range(10**7):  # 1000万回の計算
-        result += math.sqrt(j)
+    sqrt_sum(10**7)  # 1000万回の計算
     
     end_time = time.time()
     print(f"{name} finished CPU intensive task {i} in {end_time - start_time:.2f} seconds")
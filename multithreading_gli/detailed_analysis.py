@@ -1,7 +1,8 @@
 import time
 import threading
 from threading import Thread
-import random
+
+from workloads import PATTERNS, cache_friendly, cache_unfriendly
 
 def cpu_task_with_different_patterns(i: int, pattern: str) -> int:
     """異なるパターンのCPU処理（GILのタイムスライスにより並行実行される）"""
@@ -9,32 +10,9 @@ def cpu_task_with_different_patterns(i: int, pattern: str) -> int:
     print(f"{name} starting {pattern} task {i}")
     start_time = time.time()
     
-    if pattern == "simple":
-        # シンプルな計算
-        result = 0
-        for j in range(10**7):
-            result += j
-    
-    elif pattern == "complex":
-        # 複雑な計算
-        result = 0
-        for j in range(10**7):
-            result += j * j + j // 2 + j % 3
-            if result > 10**20:
-                result = result % 10**10
-    
-    elif pattern == "memory_intensive":
-        # メモリ集中処理
-        data = []
-        for j in range(10**6):
-            data.append(j * j)
-        result = sum(data)
-    
-    elif pattern == "random":
-        # ランダムアクセス
-        result = 0
-        for j in range(10**7):
-            result += random.randint(1, 100)
+    # simple: シンプルな計算 / complex: 複雑な計算
+    # memory_intensive: メモリ集中処理 / random: ランダムアクセス（workloads.py 参照）
+    result = PATTERNS[pattern]()
     
     end_time = time.time()
     print(f"{name} finished {pattern} task {i} in {end_time - start_time:.2f} seconds")
@@ -128,9 +106,7 @@ def test_cache_effects():
         start_time = time.time()
         
         # 連続したメモリアクセス
-        data = [0] * 10**6
-        for i in range(10**6):
-            data[i] = i * i
+        cache_friendly(10**6)
         
         end_time = time.time()
         print(f"{name} finished cache-friendly task in {end_time - start_time:.2f} seconds")
@@ -142,12 +118,7 @@ def test_cache_effects():
         start_time = time.time()
         
         # ランダムアクセス
-        data = [0] * 10**6
-        indices = list(range(10**6))
-        random.shuffle(indices)
-        
-        for i in indices:
-            data[i] = i * i
+        cache_unfriendly(10**6)
         
         end_time = time.time()
         print(f"{name} finished cache-unfriendly task in {end_time - start_time:.2f} seconds")
@@ -0,0 +1,245 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import importlib
+import threading
+import sysconfig
+import subprocess
+import typing as T
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+
+# workloads.py の同じ処理を、実行の仕組み（バックエンド）だけ変えて動かすための層
+#
+#   threads:         ThreadPoolExecutor（GIL のあるビルドでは CPU 処理は 1 コアしか使えない）
+#   processes:       ProcessPoolExecutor（プロセスごとに GIL があるので並列に動く）
+#   subinterpreters: インタプリタごとに GIL を持つサブインタプリタ（Python 3.12 以降）
+#                    ワーカーのスレッドごとにサブインタプリタを 1 つ作り、その中で処理を実行する
+#   free-threaded:   GIL のないビルド（python3.13t など）のスレッド
+#                    別のプロセスでそのインタプリタを起動し、中のスレッドで実行させる
+#
+# どのバックエンドも run(処理, 引数, 個数) で同じ処理を count 個実行し、かかった時間を返す。
+# 処理は workloads.py・vectorized.py などのモジュールレベルの関数で、引数は数値だけ（別のインタプリタにも渡せるように）。
+# 別のインタプリタには関数を "モジュール:関数名" の文字列で渡し、向こうでそのモジュールを import して呼ぶ。
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FREE_THREADED_PYTHONS = ("python3.14t", "python3.13t")
+
+def gil_enabled() -> bool:
+    """今のインタプリタで GIL が有効か（sys._is_gil_enabled は 3.13 以降）"""
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", None)
+    return is_gil_enabled() if is_gil_enabled is not None else True
+
+def func_ref(func: T.Callable[..., T.Any]) -> str:
+    """別のインタプリタに渡す関数の名前（"モジュール:関数名"）"""
+    return f"{func.__module__}:{func.__name__}"
+
+def resolve_func(ref: str) -> T.Callable[..., T.Any]:
+    module, name = ref.split(":")
+    return getattr(importlib.import_module(module), name)
+
+def run_tasks(
+    executor: Executor, func: T.Callable[..., T.Any], params: T.Dict[str, T.Any], count: int
+) -> float:
+    """同じ処理を count 個投げ、全部終わるまでの時間を返す"""
+    start = time.perf_counter()
+    futures = [executor.submit(func, **params) for _ in range(count)]
+    for future in futures:
+        future.result()
+    return time.perf_counter() - start
+
+class Backend:
+    name = ""
+    
+    def __init__(self, workers: int) -> None:
+        self.workers = workers
+    
+    @staticmethod
+    def unavailable() -> T.Optional[str]:
+        """使えなければその理由"""
+        return None
+    
+    def run(self, func: T.Callable[..., T.Any], params: T.Dict[str, T.Any], count: int) -> float:
+        raise NotImplementedError
+    
+    def close(self) -> None:
+        pass
+
+class PoolBackend(Backend):
+    """concurrent.futures の Executor で実行するバックエンド"""
+    
+    def __init__(self, workers: int) -> None:
+        super().__init__(workers)
+        self.executor = self.make_executor(workers)
+    
+    def make_executor(self, workers: int) -> Executor:
+        raise NotImplementedError
+    
+    def run(self, func: T.Callable[..., T.Any], params: T.Dict[str, T.Any], count: int) -> float:
+        return run_tasks(self.executor, func, params, count)
+    
+    def close(self) -> None:
+        self.executor.shutdown()
+
+class ThreadBackend(PoolBackend):
+    name = "threads"
+    
+    def make_executor(self, workers: int) -> Executor:
+        return ThreadPoolExecutor(workers)
+
+class ProcessBackend(PoolBackend):
+    name = "processes"
+    
+    def make_executor(self, workers: int) -> Executor:
+        return ProcessPoolExecutor(workers)
+
+def load_interpreters() -> T.Any:
+    """サブインタプリタを作るモジュール（3.14: concurrent.interpreters、3.13: test.support.interpreters、
+    3.12: _xxsubinterpreters）。なければ None（3.11 以前のサブインタプリタは GIL を共有するので使わない）"""
+    if sys.version_info < (3, 12):
+        return None
+    try:
+        from concurrent import interpreters  # type: ignore[attr-defined]
+        return interpreters
+    except ImportError:
+        pass
+    if sys.version_info >= (3, 13):
+        try:
+            from test.support import interpreters  # type: ignore[no-redef]
+            return interpreters
+        except ImportError:
+            pass
+    try:
+        import _xxsubinterpreters  # type: ignore[import-not-found]
+        return _xxsubinterpreters
+    except ImportError:
+        return None
+
+class Subinterpreter:
+    """GIL を共有しないサブインタプリタ 1 つ。exec(code) でその中でコードを実行する"""
+    
+    def __init__(self, module: T.Any) -> None:
+        self.module = module
+        if hasattr(module, "create") and not hasattr(module, "run_string"):
+            self.interpreter = module.create()
+        else:
+            # 3.12 の低レベル API。isolated=True でインタプリタごとの GIL になる
+            self.interpreter = module.create(isolated=True)
+    
+    def exec(self, code: str) -> None:
+        if hasattr(self.module, "run_string"):
+            self.module.run_string(self.interpreter, code)
+        else:
+            self.interpreter.exec(code)
+    
+    def close(self) -> None:
+        if hasattr(self.module, "destroy"):
+            self.module.destroy(self.interpreter)
+        else:
+            self.interpreter.close()
+
+class SubinterpreterBackend(Backend):
+    name = "subinterpreters"
+    
+    def __init__(self, workers: int) -> None:
+        super().__init__(workers)
+        self.module = load_interpreters()
+        self.interpreters: T.List[Subinterpreter] = []
+        # スレッドとサブインタプリタを 1 対 1 にし、各スレッドは自分のサブインタプリタで実行する
+        self.local = threading.local()
+        self.executor = ThreadPoolExecutor(workers, initializer=self.init_thread)
+    
+    @staticmethod
+    def unavailable() -> T.Optional[str]:
+        if load_interpreters() is None:
+            return f"needs Python 3.12+ (this is {sys.version.split()[0]})"
+        return None
+    
+    def init_thread(self) -> None:
+        interpreter = Subinterpreter(self.module)
+        interpreter.exec(f"import sys\nsys.path.insert(0, {HERE!r})")
+        self.interpreters.append(interpreter)
+        self.local.interpreter = interpreter
+    
+    def call(self, ref: str, params: T.Dict[str, T.Any]) -> None:
+        # 2 回目からの import は sys.modules から取るだけなので、毎回書いてもかまわない
+        module, name = ref.split(":")
+        self.local.interpreter.exec(f"import {module}\n{module}.{name}(**{params!r})")
+    
+    def run(self, func: T.Callable[..., T.Any], params: T.Dict[str, T.Any], count: int) -> float:
+        start = time.perf_counter()
+        futures = [
+            self.executor.submit(self.call, func_ref(func), params) for _ in range(count)
+        ]
+        for future in futures:
+            future.result()
+        return time.perf_counter() - start
+    
+    def close(self) -> None:
+        self.executor.shutdown()
+        for interpreter in self.interpreters:
+            interpreter.close()
+
+def find_free_threaded_python() -> T.Optional[str]:
+    """GIL のないビルドの python の実行ファイル"""
+    if sysconfig.get_config_var("Py_GIL_DISABLED"):
+        return sys.executable
+    for name in FREE_THREADED_PYTHONS:
+        path = shutil.which(name)
+        if path is not None:
+            return path
+    return None
+
+class FreeThreadedBackend(Backend):
+    name = "free-threaded"
+    
+    def __init__(self, workers: int) -> None:
+        super().__init__(workers)
+        python = find_free_threaded_python()
+        # 拡張モジュールの都合で GIL が有効に戻らないよう PYTHON_GIL=0 で起動する
+        self.process = subprocess.Popen(
+            [python, os.path.join(HERE, "executors.py"), "--serve-threads", str(workers)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True,
+            env=dict(os.environ, PYTHON_GIL="0"),
+        )
+    
+    @staticmethod
+    def unavailable() -> T.Optional[str]:
+        if find_free_threaded_python() is None:
+            return "no free-threaded python (" + " / ".join(FREE_THREADED_PYTHONS) + ") found"
+        return None
+    
+    def run(self, func: T.Callable[..., T.Any], params: T.Dict[str, T.Any], count: int) -> float:
+        # 時間は子プロセスの中で測る（パイプの往復は含めない）
+        request = {"func": func_ref(func), "params": params, "count": count}
+        self.process.stdin.write(json.dumps(request) + "\n")
+        self.process.stdin.flush()
+        reply = json.loads(self.process.stdout.readline())
+        if reply["gil_enabled"]:
+            raise RuntimeError("The free-threaded python is running with the GIL enabled")
+        return reply["elapsed"]
+    
+    def close(self) -> None:
+        self.process.stdin.close()
+        self.process.wait()
+
+BACKENDS: T.Dict[str, T.Type[Backend]] = {
+    backend.name: backend
+    for backend in (ThreadBackend, ProcessBackend, SubinterpreterBackend, FreeThreadedBackend)
+}
+
+def serve_threads(workers: int) -> None:
+    """FreeThreadedBackend の子プロセス側: 1 行ずつ届く依頼をスレッドで実行して時間を返す"""
+    with ThreadPoolExecutor(workers) as executor:
+        for line in sys.stdin:
+            request = json.loads(line)
+            func = resolve_func(request["func"])
+            elapsed = run_tasks(executor, func, request["params"], request["count"])
+            print(json.dumps({"elapsed": elapsed, "gil_enabled": gil_enabled()}), flush=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--serve-threads", type=int, required=True)
+    serve_threads(parser.parse_args().serve_threads)
@@ -1,7 +1,8 @@
 import time
 import threading
 from threading import Thread
-import math
+
+from workloads import sqrt_sum, sqrt_sum_with_release
 
 def cpu_intensive_without_gil_release(i: int) -> None:
     """GILを解放しないCPU集中処理（実際にはGILのタイムスライスにより並行実行される）"""
@@ -10,10 +11,8 @@ def cpu_intensive_without_gil_release(i: int) -> None:
     start_time = time.time()
     
     # 非常に長い計算処理（GILを解放しない）
-    result = 0
-    for j in range(10**8):  # 1億回の計算
-        result += math.sqrt(j)
-        # 注意: この処理はGILを解放しない
+    sqrt_sum(10**8)  # 1億回の計算
+    # 注意: この処理はGILを解放しない
     
     end_time = time.time()
     print(f"{name} finished CPU intensive task {i} in {end_time - start_time:.2f} seconds")
@@ -24,14 +23,9 @@ def cpu_intensive_with_gil_release(i: int) -> None:
     print(f"{name} starting CPU intensive task with GIL release {i}")
     start_time = time.time()
     
-    # 計算処理を小さなブロックに分けて、定期的にGILを解放
-    result = 0
-    for block in range(100):  # 100ブロックに分割
-        for j in range(10**6):  # 各ブロックで100万回の計算
-            result += math.sqrt(block * 10**6 + j)
-        
-        # 定期的にGILを解放（他のスレッドに実行機会を与える）
-        time.sleep(0.001)  # 1ミリ秒のスリープ
+    # 計算処理を100ブロック（各100万回）に分けて、ブロックごとに1ミリ秒スリープしてGILを解放
+    # （他のスレッドに実行機会を与える）
+    sqrt_sum_with_release(blocks=100, block_size=10**6, pause=0.001)
     
     end_time = time.time()
     print(f"{name} finished CPU intensive task with GIL release {i} in {end_time - start_time:.2f} seconds")
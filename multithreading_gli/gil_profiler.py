@@ -0,0 +1,278 @@
+import sys
+import json
+import time
+import argparse
+import statistics
+import threading
+import typing as T
+
+import workloads
+
+# GIL の取り合いを直接測るプロファイラ
+#   python gil_profiler.py [--cpu-threads N] [--io-threads M] [--duration S]
+#                          [--intervals 0.5,1,5,10,50] [--trace FILE] [--json FILE]
+#
+# どのスレッドも、自分が何をいつしていたかを自分のログ（perf_counter の時刻の組のリスト）に記録する。
+# 別のスレッドから覗く（サンプリングする）と、覗く側も GIL を待つので、測りたいものと同じ理由で測定が歪む。
+#
+# CPU スレッドは workloads.strict_cpu を小さな塊（CHUNK 回）ずつ実行し、塊ごとに (始まり, 終わり) を記録する。
+# 塊の長さは、最初に 1 スレッドだけで測った長さ（chunk_time）とほぼ同じなら最後まで GIL を持って動いていた。
+# それより大幅に長い塊は途中で GIL を取られて待っていたので、動いていたのは終わりの chunk_time だけとみなす。
+# 動いていた区間をつなげたものがタイムラインになり、経過時間のうちそれ以外が GIL 待ち
+# （コアが足りなければ OS の待ちも含む）。
+#
+# I/O スレッドは time.sleep(IO_SLEEP) を繰り返し、sleep の (始まり, 起きて GIL を取り直した時刻) を記録する。
+# sleep の間は GIL を待っていないので、GIL 待ちに数えるのは予定の時刻より遅れて起きた分（起床の遅れ）だけ。
+# これが CPU スレッドの後ろで GIL を待たされた時間（コンボイ効果）になる。
+#
+# sys.setswitchinterval の値ごとに同じことを繰り返し、CPU のスループットと I/O の遅延の関係を比べる。
+# コンボイ効果は、CPU スレッドなしで I/O スレッドだけを動かしたときの遅延に対する倍率で示す。
+# --trace でスレッドごとのタイムラインを Chrome トレース形式（chrome://tracing、Perfetto）で書き出す。
+
+CPU_THREADS = 2
+IO_THREADS = 1
+DURATION = 2.0
+SWITCH_INTERVALS_MS = (0.5, 1.0, 5.0, 10.0, 50.0)
+CHUNK = 200  # 1 回の進捗あたりの strict_cpu のループ回数（数十マイクロ秒）
+IO_SLEEP = 0.001
+CALIBRATION_CHUNKS = 500
+# 塊が chunk_time のこの倍より長ければ、途中で GIL を取られていた
+PREEMPTED_FACTOR = 2.0
+
+ThreadLog = T.List[T.Tuple[float, float]]  # スレッドが自分で記録した (始まり, 終わり) の列
+
+class Profile(T.NamedTuple):
+    switch_interval: float
+    names: T.List[str]  # スレッド番号 → 名前（CPU スレッド、I/O スレッドの順）
+    logs: T.List[ThreadLog]  # CPU は塊ごと、I/O は sleep ごと
+    chunk_time: float  # 1 スレッドだけで動かしたときの塊の長さ
+    start: float
+    duration: float
+
+def cpu_worker(log: ThreadLog, stop: threading.Event) -> None:
+    while not stop.is_set():
+        begin = time.perf_counter()
+        workloads.strict_cpu(CHUNK)
+        log.append((begin, time.perf_counter()))
+
+def io_worker(log: ThreadLog, stop: threading.Event) -> None:
+    while not stop.is_set():
+        begin = time.perf_counter()
+        time.sleep(IO_SLEEP)
+        # ここに来た時点で GIL を取り直している
+        log.append((begin, time.perf_counter()))
+
+def calibrate_chunk() -> float:
+    """ほかのスレッドが動いていないときの塊の長さ（中央値）"""
+    times = []
+    for _ in range(CALIBRATION_CHUNKS):
+        begin = time.perf_counter()
+        workloads.strict_cpu(CHUNK)
+        times.append(time.perf_counter() - begin)
+    return statistics.median(times)
+
+def run_scenario(
+    cpu_threads: int, io_threads: int, duration: float, switch_interval: float,
+    chunk_time: T.Optional[float] = None,
+) -> Profile:
+    """switch_interval 秒の切り替え間隔で duration 秒動かして測る"""
+    if chunk_time is None:
+        chunk_time = calibrate_chunk()
+    names = [f"CPU-{i}" for i in range(cpu_threads)] + [f"IO-{i}" for i in range(io_threads)]
+    logs: T.List[ThreadLog] = [[] for _ in names]
+    stop = threading.Event()
+    threads = [
+        threading.Thread(
+            target=cpu_worker if i < cpu_threads else io_worker,
+            args=(logs[i], stop), name=name,
+        )
+        for i, name in enumerate(names)
+    ]
+    original = sys.getswitchinterval()
+    sys.setswitchinterval(switch_interval)
+    try:
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        # メインスレッドは sleep している間 GIL を持たない
+        time.sleep(duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        sys.setswitchinterval(original)
+    return Profile(
+        switch_interval=switch_interval, names=names, logs=logs, chunk_time=chunk_time,
+        start=start, duration=elapsed,
+    )
+
+def running_spans(log: ThreadLog, chunk_time: float) -> ThreadLog:
+    """CPU スレッドの塊のログから、GIL を持って動いていた区間を作る（間が空いていない区間はつなげる）"""
+    spans: ThreadLog = []
+    for begin, end in log:
+        if end - begin > chunk_time * PREEMPTED_FACTOR:
+            begin = end - chunk_time
+        if spans and begin - spans[-1][1] < chunk_time:
+            spans[-1] = (spans[-1][0], end)
+        else:
+            spans.append((begin, end))
+    return spans
+
+def wake_delays(log: ThreadLog) -> T.List[float]:
+    """I/O スレッドの sleep のログから、予定より遅れて起きた時間"""
+    return [max(0.0, end - begin - IO_SLEEP) for begin, end in log]
+
+def percentile(values: T.List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+def summarize(profile: Profile, baseline_io: T.Optional[float] = None) -> T.Dict[str, T.Any]:
+    """スループット・遅延と、スレッドごとの GIL 待ちの時間・動いていた割合"""
+    cpu_count = sum(1 for name in profile.names if name.startswith("CPU"))
+    io_latencies: T.List[float] = []
+    threads = []
+    for index, (name, log) in enumerate(zip(profile.names, profile.logs)):
+        wall = log[-1][1] - log[0][0] if log else 0.0
+        if index < cpu_count:
+            running: T.Optional[float] = sum(
+                end - begin for begin, end in running_spans(log, profile.chunk_time)
+            )
+            wait = max(0.0, wall - running)
+        else:
+            delays = wake_delays(log)
+            io_latencies += delays
+            # I/O スレッドが GIL を持つのは起きてから次の sleep までの一瞬だけなので、割合は出さない
+            running = None
+            wait = sum(delays)
+        threads.append({
+            "name": name,
+            "progress": len(log),
+            "wall": wall,
+            "wait": wait,
+            "wait_share": wait / wall if wall else 0.0,
+            "running_share": running / profile.duration if running is not None else None,
+        })
+    io_p99 = percentile(io_latencies, 0.99)
+    cpu_chunks = sum(len(log) for log in profile.logs[:cpu_count])
+    io_ops = sum(len(log) for log in profile.logs[cpu_count:])
+    return {
+        "switch_interval_ms": profile.switch_interval * 1000,
+        "chunk_us": profile.chunk_time * 1e6,
+        "cpu_chunks_per_second": cpu_chunks / profile.duration,
+        "io_ops_per_second": io_ops / profile.duration,
+        "io_p50_ms": percentile(io_latencies, 0.50) * 1000,
+        "io_p99_ms": io_p99 * 1000,
+        "io_max_ms": max(io_latencies, default=0.0) * 1000,
+        "convoy": io_p99 / baseline_io if baseline_io else None,
+        "threads": threads,
+    }
+
+def trace_events(profile: Profile, pid: int, label: str) -> T.List[T.Dict[str, T.Any]]:
+    """CPU スレッドは動いていた区間、I/O スレッドは起床が遅れて GIL を待っていた区間"""
+    events: T.List[T.Dict[str, T.Any]] = [
+        {"name": "process_name", "ph": "M", "pid": pid, "args": {"name": label}},
+    ]
+    events += [
+        {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+        for tid, name in enumerate(profile.names)
+    ]
+    for tid, (name, log) in enumerate(zip(profile.names, profile.logs)):
+        if name.startswith("CPU"):
+            spans, event_name = running_spans(log, profile.chunk_time), "running"
+        else:
+            spans = [(begin + IO_SLEEP, end) for begin, end in log if end - begin > IO_SLEEP]
+            event_name = "waiting for GIL"
+        events += [
+            {
+                "name": event_name, "ph": "X", "pid": pid, "tid": tid,
+                "ts": (begin - profile.start) * 1e6, "dur": (end - begin) * 1e6,
+            }
+            for begin, end in spans
+        ]
+    return events
+
+def parse_intervals(text: str) -> T.List[float]:
+    return [float(ms) / 1000 for ms in text.split(",") if ms]
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cpu-threads", type=int, default=CPU_THREADS)
+    parser.add_argument("--io-threads", type=int, default=IO_THREADS)
+    parser.add_argument("--duration", type=float, default=DURATION, help="1 つの設定で動かす秒数")
+    parser.add_argument(
+        "--intervals", type=parse_intervals,
+        default=[ms / 1000 for ms in SWITCH_INTERVALS_MS],
+        help="試す sys.setswitchinterval の値（ミリ秒、カンマ区切り）",
+    )
+    parser.add_argument("--trace", help="スレッドごとのタイムラインを書き出す Chrome トレースのファイル")
+    parser.add_argument("--json", help="集計を書き出す JSON ファイル")
+    args = parser.parse_args()
+    
+    print("=" * 86)
+    print(
+        f"{args.cpu_threads} CPU thread(s) + {args.io_threads} I/O thread(s), "
+        f"{args.duration}s per setting, default switch interval "
+        f"{sys.getswitchinterval() * 1000:.1f}ms"
+    )
+    print("=" * 86)
+    chunk_time = calibrate_chunk()
+    print(f"CPU chunk alone: {chunk_time * 1e6:.1f}us ({CHUNK} iterations)")
+    # I/O スレッドだけのときの遅延（コンボイ効果の基準）
+    baseline = run_scenario(
+        0, max(1, args.io_threads), args.duration, sys.getswitchinterval(), chunk_time,
+    )
+    baseline_io = summarize(baseline)["io_p99_ms"] / 1000
+    print(f"I/O only: p99 latency {baseline_io * 1000:.3f}ms")
+    
+    print(
+        f"\n{'Switch(ms)':>10} {'CPU chunks/s':>13} {'IO ops/s':>9} {'IO p50(ms)':>11} "
+        f"{'IO p99(ms)':>11} {'Convoy':>8} {'CPU wait':>9}"
+    )
+    print("-" * 86)
+    summaries = []
+    events: T.List[T.Dict[str, T.Any]] = []
+    for pid, interval in enumerate(args.intervals):
+        profile = run_scenario(
+            args.cpu_threads, args.io_threads, args.duration, interval, chunk_time,
+        )
+        summary = summarize(profile, baseline_io)
+        summaries.append(summary)
+        events += trace_events(profile, pid, f"switchinterval={interval * 1000:g}ms")
+        cpu_waits = [t["wait_share"] for t in summary["threads"] if t["name"].startswith("CPU")]
+        convoy = summary["convoy"]
+        print(
+            f"{summary['switch_interval_ms']:>10.1f} {summary['cpu_chunks_per_second']:>13.0f} "
+            f"{summary['io_ops_per_second']:>9.0f} {summary['io_p50_ms']:>11.3f} "
+            f"{summary['io_p99_ms']:>11.3f} "
+            + (f"{convoy:>7.1f}x" if convoy is not None else f"{'-':>8}")
+            + f" {statistics.fmean(cpu_waits) if cpu_waits else 0.0:>9.0%}"
+        )
+    
+    print(
+        f"\n{'Switch(ms)':>10} {'Thread':<8} {'Progress':>9} {'Wait(s)':>8} {'Wait%':>6} "
+        f"{'Running%':>9}"
+    )
+    print("-" * 86)
+    for summary in summaries:
+        for thread in summary["threads"]:
+            running = thread["running_share"]
+            print(
+                f"{summary['switch_interval_ms']:>10.1f} {thread['name']:<8} "
+                f"{thread['progress']:>9} {thread['wait']:>8.3f} {thread['wait_share']:>6.0%} "
+                + (f"{running:>9.0%}" if running is not None else f"{'-':>9}")
+            )
+    
+    if args.trace:
+        with open(args.trace, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        print(f"\nWrote {args.trace}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"baseline_io_p99_ms": baseline_io * 1000, "settings": summaries}, f, indent=2)
+        print(f"Wrote {args.json}")
+
+if __name__ == "__main__":
+    main()
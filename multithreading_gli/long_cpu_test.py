@@ -2,19 +2,17 @@ import time
 import threading
 from threading import Thread
 
+from workloads import long_cpu
+
 def very_long_cpu_intensive(i: int) -> None:
     """非常に長いCPU集中処理（GILのタイムスライスにより並行実行される）"""
     name = threading.current_thread().name
     print(f"{name} starting very long CPU intensive task {i}")
     start_time = time.time()
     
-    # 非常に長い計算処理
-    result = 0
-    for j in range(10**8):  # 1億回のループ
-        result += j * j + j // 2 + j % 3
-        # 最適化を防ぐため、結果を使用
-        if result > 10**20:  # オーバーフロー防止
-            result = result % 10**10
+    # 非常に長い計算処理（1億回のループ）
+    # 最適化を防ぐため結果を使い、大きくなりすぎないよう剰余を取る
+    result = long_cpu(10**8)
     
     end_time = time.time()
     print(f"{name} finished very long CPU intensive task {i} in {end_time - start_time:.2f} seconds")
@@ -52,11 +50,7 @@ def compare_single_vs_multi():
         print("Starting single-threaded CPU task...")
         start_time = time.time()
         
-        result = 0
-        for j in range(10**8):
-            result += j * j + j // 2 + j % 3
-            if result > 10**20:
-                result = result % 10**10
+        result = long_cpu(10**8)
         
         end_time = time.time()
         print(f"Single-threaded task finished in {end_time - start_time:.2f} seconds")
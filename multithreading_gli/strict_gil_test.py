@@ -2,6 +2,8 @@ import time
 import threading
 from threading import Thread
 
+from workloads import strict_cpu, strict_cpu_with_release
+
 def strict_cpu_intensive(i: int) -> None:
     """I/O操作を完全に排除したCPU集中処理（GILのタイムスライスにより並行実行される）"""
     name = threading.current_thread().name
@@ -9,11 +11,9 @@ def strict_cpu_intensive(i: int) -> None:
     start_time = time.time()
     
     # 純粋なCPU計算のみ（I/O操作なし）
-    result = 0
-    for j in range(10**7):  # 1000万回のループ
-        # 純粋なPythonの計算（GILのタイムスライスにより並行実行される）
-        result += j * j + j // 2 + j % 3
-        # 注意: print文やI/O操作は一切なし
+    # 純粋なPythonの計算（GILのタイムスライスにより並行実行される）
+    result = strict_cpu(10**7)  # 1000万回のループ
+    # 注意: print文やI/O操作は一切なし
     
     end_time = time.time()
     print(f"{name} finished strict CPU intensive task {i} in {end_time - start_time:.2f} seconds")
@@ -25,11 +25,8 @@ def strict_cpu_with_gil_release(i: int) -> None:
     print(f"{name} starting strict CPU task with GIL release {i}")
     start_time = time.time()
     
-    result = 0
-    for j in range(10**7):
-        result += j * j + j // 2 + j % 3
-        if j % 1000000 == 0:  # 100万回ごとにGILを解放
-            time.sleep(0.001)  # 1ミリ秒のスリープ
+    # 100万回ごとに1ミリ秒のスリープでGILを解放
+    result = strict_cpu_with_release(10**7, release_every=1000000, pause=0.001)
     
     end_time = time.time()
     print(f"{name} finished strict CPU task with GIL release {i} in {end_time - start_time:.2f} seconds")
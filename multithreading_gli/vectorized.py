@@ -0,0 +1,136 @@
+import sys
+import typing as T
+
+try:
+    import numpy as np
+except ImportError:  # NumPy がなければ bench.py はこのモジュールのケースを登録しない
+    np = None
+
+import workloads
+
+# workloads.py の CPU 処理を NumPy でベクトル化したもの（結果は元の関数と完全に一致する）
+#
+# どれも BLOCK_SIZE 要素ずつのブロックに分けて計算するので、n がいくら大きくてもメモリは一定。
+# NumPy は大きな配列の演算中は GIL を手放すので、ブロックの計算は複数のスレッドで同時に進む
+# （Python のループはブロックごとに数回の呼び出しだけ）。
+#
+# 整数は int64 で計算する。項（j * j など）が int64 に収まるよう n は MAX_N まで。
+# 和は上位 32 ビットと下位 32 ビットに分けて足してから Python の int に戻すので、
+# 合計が int64 を超えても正確になる。
+# 浮動小数点の和（sqrt_sum）は add.accumulate が先頭から順に足すので、
+# 元のループと同じ順序・同じ丸めになる（np.sum はペアごとに足すので結果が変わる）。
+
+BLOCK_SIZE = 1 << 18  # int64 で 2MB
+MAX_N = 3 * 10**9  # j * j + j // 2 + j % 3 が int64 に収まる範囲
+LOW_MASK = (1 << 32) - 1
+COMPLEX_LIMIT = 10**20  # workloads.long_cpu と同じ
+COMPLEX_MODULUS = 10**10
+
+def check_n(n: int) -> None:
+    if np is None:
+        raise RuntimeError("vectorized workloads require numpy")
+    if n > MAX_N:
+        raise ValueError(f"n must be at most {MAX_N} (int64 overflow)")
+
+def blocks(n: int) -> T.Iterator[T.Any]:
+    """0..n-1 を BLOCK_SIZE ずつの int64 配列で返す"""
+    for start in range(0, n, BLOCK_SIZE):
+        yield np.arange(start, min(start + BLOCK_SIZE, n), dtype=np.int64)
+
+def exact_sum(terms: T.Any) -> int:
+    """0 以上の int64 の配列の正確な合計（上位・下位 32 ビットに分けて足す）"""
+    high = int(np.sum(terms >> 32))
+    low = int(np.sum(terms & LOW_MASK))
+    return (high << 32) + low
+
+def simple_sum(n: int = 10**7) -> int:
+    """workloads.simple_sum と同じ結果"""
+    check_n(n)
+    result = 0
+    for j in blocks(n):
+        result += exact_sum(j)
+    return result
+
+def memory_intensive(n: int = 10**6) -> int:
+    """workloads.memory_intensive と同じ結果（リストを作らずブロックごとの二乗和）"""
+    check_n(n)
+    result = 0
+    for j in blocks(n):
+        result += exact_sum(j * j)
+    return result
+
+def sqrt_sum(n: int = 10**7) -> float:
+    """workloads.sqrt_sum と同じ結果"""
+    check_n(n)
+    result = 0.0
+    for j in blocks(n):
+        values = np.sqrt(j, dtype=np.float64)
+        # 前のブロックまでの和を先頭に足してから順に累積すると、元のループと同じ足し算の列になる
+        values[0] += result
+        np.add.accumulate(values, out=values)
+        result = float(values[-1])
+    return result
+
+def long_cpu(n: int = 10**8) -> int:
+    """workloads.long_cpu と同じ結果（detailed_analysis.py の complex）
+    
+    result が COMPLEX_LIMIT を超えるたびに剰余を取るので、単純な和にはならない。
+    ブロック内の累積和を上位・下位 32 ビットに分けて持ち、超える位置を二分探索で見つけて
+    そこで剰余を取り、残りの部分で続ける。超えるのは 10**10 未満から 10**20 まで増える間に 1 回なので、
+    ほとんどのブロックは累積和の末尾を見るだけで終わる。
+    """
+    check_n(n)
+    result = 0
+    for j in blocks(n):
+        terms = j * j + j // 2 + j % 3
+        high = np.cumsum(terms >> 32)
+        low = np.cumsum(terms & LOW_MASK)
+        
+        def prefix(k: int) -> int:
+            # terms[0..k] の和（k = -1 なら 0）
+            return (int(high[k]) << 32) + int(low[k]) if k >= 0 else 0
+        
+        last = len(terms) - 1
+        start = -1  # この位置までは足し終えている
+        while True:
+            base = prefix(start)
+            if result + prefix(last) - base <= COMPLEX_LIMIT:
+                result += prefix(last) - base
+                break
+            # result + (terms[start+1..k] の和) が初めて COMPLEX_LIMIT を超える k
+            lo, hi = start + 1, last
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if result + prefix(mid) - base > COMPLEX_LIMIT:
+                    hi = mid
+                else:
+                    lo = mid + 1
+            result = (result + prefix(lo) - base) % COMPLEX_MODULUS
+            start = lo
+            if start == last:
+                break
+    return result
+
+# 元の関数 → ベクトル化した関数（bench.py のケースと確認用）
+VARIANTS: T.Dict[T.Callable[..., T.Any], T.Callable[..., T.Any]] = {
+    workloads.simple_sum: simple_sum,
+    workloads.memory_intensive: memory_intensive,
+    workloads.sqrt_sum: sqrt_sum,
+    workloads.long_cpu: long_cpu,
+}
+
+def verify(n: int) -> bool:
+    """各関数の結果が元の関数と一致するか（n は BLOCK_SIZE より大きくしてブロックの境目も確かめる）"""
+    ok = True
+    for original, variant in VARIANTS.items():
+        expected, actual = original(n), variant(n)
+        same = expected == actual
+        ok = ok and same
+        print(f"{variant.__name__:<20} {'OK' if same else 'MISMATCH'} ({expected!r} / {actual!r})")
+    return ok
+
+if __name__ == "__main__":
+    check_n(0)
+    sizes = [int(arg) for arg in sys.argv[1:]] or [BLOCK_SIZE * 3 + 12345]
+    if not all([verify(n) for n in sizes]):
+        sys.exit(1)
@@ -0,0 +1,103 @@
+import math
+import time
+import random
+import typing as T
+from functools import partial
+
+# 各スクリプトのスレッドが実行する計算処理の本体
+# 出力も時間計測もせず結果を返すだけにして、スクリプトと bench.py で同じ処理を使う
+# 大きさ（ループ回数など）は引数で変えられ、既定値は元のスクリプトと同じ
+
+def sqrt_sum(n: int = 10**7) -> float:
+    """math.sqrt の合計（cpu_vs_io_bound.py、gil_demonstration.py）"""
+    result = 0.0
+    for j in range(n):
+        result += math.sqrt(j)
+    return result
+
+def sqrt_sum_with_release(
+    blocks: int = 100, block_size: int = 10**6, pause: float = 0.001
+) -> float:
+    """sqrt_sum をブロックに分け、ブロックごとに sleep して GIL を手放す（gil_demonstration.py）"""
+    result = 0.0
+    for block in range(blocks):
+        for j in range(block_size):
+            result += math.sqrt(block * block_size + j)
+        time.sleep(pause)
+    return result
+
+def strict_cpu(n: int = 10**7) -> int:
+    """I/O を含まない純粋な整数演算（strict_gil_test.py）"""
+    result = 0
+    for j in range(n):
+        result += j * j + j // 2 + j % 3
+    return result
+
+def strict_cpu_with_release(
+    n: int = 10**7, release_every: int = 10**6, pause: float = 0.001
+) -> int:
+    """strict_cpu を release_every 回ごとに sleep して GIL を手放す（strict_gil_test.py）"""
+    result = 0
+    for j in range(n):
+        result += j * j + j // 2 + j % 3
+        if j % release_every == 0:
+            time.sleep(pause)
+    return result
+
+def long_cpu(n: int = 10**8) -> int:
+    """値が大きくなりすぎないよう剰余を取りながらの整数演算（long_cpu_test.py、detailed_analysis.py の complex）"""
+    result = 0
+    for j in range(n):
+        result += j * j + j // 2 + j % 3
+        if result > 10**20:
+            result = result % 10**10
+    return result
+
+def simple_sum(n: int = 10**7) -> int:
+    """単純な足し算（detailed_analysis.py の simple）"""
+    result = 0
+    for j in range(n):
+        result += j
+    return result
+
+def memory_intensive(n: int = 10**6) -> int:
+    """リストを作ってから合計する（detailed_analysis.py の memory_intensive）"""
+    data = []
+    for j in range(n):
+        data.append(j * j)
+    return sum(data)
+
+def random_sum(n: int = 10**7) -> int:
+    """乱数の合計（detailed_analysis.py の random）"""
+    result = 0
+    for _ in range(n):
+        result += random.randint(1, 100)
+    return result
+
+# detailed_analysis.py のパターン名 → 処理（プロセスにも渡せるよう lambda ではなく partial）
+PATTERNS: T.Dict[str, T.Callable[[], int]] = {
+    "simple": partial(simple_sum, 10**7),
+    "complex": partial(long_cpu, 10**7),
+    "memory_intensive": partial(memory_intensive, 10**6),
+    "random": partial(random_sum, 10**7),
+}
+
+def cache_friendly(n: int = 10**6) -> T.List[int]:
+    """連続したメモリアクセス（detailed_analysis.py のキャッシュ効果のテスト）"""
+    data = [0] * n
+    for i in range(n):
+        data[i] = i * i
+    return data
+
+def cache_unfriendly(n: int = 10**6) -> T.List[int]:
+    """ランダムな順序でのメモリアクセス（detailed_analysis.py のキャッシュ効果のテスト）"""
+    data = [0] * n
+    indices = list(range(n))
+    random.shuffle(indices)
+    for i in indices:
+        data[i] = i * i
+    return data
+
+def io_sleep(seconds: float = 3.0) -> None:
+    """I/O 待ちの代わりの sleep（待っている間は GIL を手放す）"""
+    time.sleep(seconds)